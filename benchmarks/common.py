@@ -0,0 +1,184 @@
+# benchmarks/common.py
+"""
+Общие части бенчмарков: замер времени, подсчет SQL-запросов и бот без сети.
+"""
+import itertools
+import time
+from typing import Any, Awaitable, Callable, Dict, List, NamedTuple, Optional
+
+from aiogram import Bot
+from aiogram.client.session.base import BaseSession
+from aiogram.methods import SendMessage, TelegramMethod
+from aiogram.types import Chat, Message
+
+from utils.metrics import Metrics
+
+
+class BenchResult(NamedTuple):
+    name: str
+    params: Dict[str, Any]
+    ops: int
+    seconds: float
+    ops_per_sec: float
+    p50_ms: float
+    p99_ms: float
+    max_ms: float
+    queries_per_op: Optional[float]
+
+    def as_dict(self) -> Dict[str, Any]:
+        return self._asdict()
+
+
+class FakeTelegramSession(BaseSession):
+    """Сессия бота, которая ничего не отправляет: sendMessage возвращает сообщение, остальное - True."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.requests = 0
+        self._message_ids = itertools.count(1)
+
+    async def make_request(self, bot: Bot, method: TelegramMethod, timeout: Optional[int] = None) -> Any:
+        self.requests += 1
+        if isinstance(method, SendMessage):
+            return Message(
+                message_id=next(self._message_ids),
+                date=int(time.time()),
+                chat=Chat(id=method.chat_id, type="supergroup"),
+                text=method.text,
+            )
+        return True
+
+    async def stream_content(self, *args: Any, **kwargs: Any):
+        yield b""
+
+    async def close(self) -> None:
+        pass
+
+
+def make_bot() -> Bot:
+    return Bot("123456:BENCHMARK", session=FakeTelegramSession())
+
+
+def percentile(sorted_values: List[float], p: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * p))]
+
+
+class QueryCounter:
+    """Счетчик SQL-запросов движка (события SQLAlchemy через utils.metrics)."""
+
+    def __init__(self, engine) -> None:
+        self._metrics = Metrics()
+        self._metrics.instrument_engine(engine)
+
+    @property
+    def total(self) -> float:
+        return self._metrics.db_queries.value()
+
+
+def _result(
+    name: str,
+    params: Dict[str, Any],
+    latencies: List[float],
+    seconds: float,
+    ops: int,
+    queries: Optional[float],
+) -> BenchResult:
+    latencies = sorted(latencies)
+    return BenchResult(
+        name=name,
+        params=params,
+        ops=ops,
+        seconds=round(seconds, 4),
+        ops_per_sec=round(ops / seconds, 2) if seconds else 0.0,
+        p50_ms=round(percentile(latencies, 0.50) * 1000, 4),
+        p99_ms=round(percentile(latencies, 0.99) * 1000, 4),
+        max_ms=round(latencies[-1] * 1000, 4) if latencies else 0.0,
+        queries_per_op=round(queries / ops, 2) if queries is not None and ops else None,
+    )
+
+
+def bench_sync(
+    name: str,
+    fn: Callable[[], Any],
+    params: Optional[Dict[str, Any]] = None,
+    samples: int = 200,
+    inner: int = 50,
+    warmup: int = 10,
+) -> BenchResult:
+    """
+    Синхронная функция: samples замеров по inner вызовов подряд
+    (задержка одного вызова - среднее внутри замера).
+    """
+    for _ in range(warmup):
+        fn()
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(samples):
+        sample_started = time.perf_counter()
+        for _ in range(inner):
+            fn()
+        latencies.append((time.perf_counter() - sample_started) / inner)
+    seconds = time.perf_counter() - started
+    return _result(name, params or {}, latencies, seconds, samples * inner, None)
+
+
+async def bench_async(
+    name: str,
+    fn: Callable[[int], Awaitable[Any]],
+    params: Optional[Dict[str, Any]] = None,
+    ops: int = 200,
+    warmup: int = 5,
+    queries: Optional[QueryCounter] = None,
+    setup: Optional[Callable[[int], Any]] = None,
+) -> BenchResult:
+    """
+    Корутина fn(i) выполняется ops раз последовательно. setup(i) вызывается
+    перед каждой операцией и в замер не входит (например, сброс кэша).
+    """
+    for i in range(warmup):
+        if setup:
+            setup(i)
+        await fn(i)
+    latencies = []
+    busy = 0.0
+    queries_before = queries.total if queries else None
+    for i in range(ops):
+        if setup:
+            setup(i)
+        op_started = time.perf_counter()
+        await fn(i)
+        elapsed = time.perf_counter() - op_started
+        latencies.append(elapsed)
+        busy += elapsed
+    query_count = queries.total - queries_before if queries else None
+    return _result(name, params or {}, latencies, busy, ops, query_count)
+
+
+def format_table(results: List[BenchResult]) -> str:
+    lines = [f"{'benchmark':<42} {'ops/s':>12} {'p50 ms':>10} {'p99 ms':>10} {'q/op':>7}"]
+    for r in results:
+        label = r.name + (f"[{','.join(f'{k}={v}' for k, v in r.params.items())}]" if r.params else "")
+        q = f"{r.queries_per_op:.1f}" if r.queries_per_op is not None else "-"
+        lines.append(f"{label:<42} {r.ops_per_sec:>12.1f} {r.p50_ms:>10.3f} {r.p99_ms:>10.3f} {q:>7}")
+    return "\n".join(lines)
+
+
+def compare(results: List[Dict[str, Any]], baseline: List[Dict[str, Any]]) -> str:
+    """Изменение ops/s и p99 относительно прошлого прогона (сопоставление по имени и параметрам)."""
+    def key(r: Dict[str, Any]):
+        return r["name"], tuple(sorted(r["params"].items()))
+
+    old = {key(r): r for r in baseline}
+    lines = [f"{'benchmark':<42} {'ops/s':>10} {'p99':>10}"]
+    for r in results:
+        before = old.get(key(r))
+        label = r["name"] + (f"[{','.join(f'{k}={v}' for k, v in r['params'].items())}]" if r["params"] else "")
+        if not before:
+            lines.append(f"{label:<42} {'new':>10} {'new':>10}")
+            continue
+        ops_change = (r["ops_per_sec"] / before["ops_per_sec"] - 1) * 100 if before["ops_per_sec"] else 0.0
+        p99_change = (r["p99_ms"] / before["p99_ms"] - 1) * 100 if before["p99_ms"] else 0.0
+        lines.append(f"{label:<42} {ops_change:>+9.1f}% {p99_change:>+9.1f}%")
+    return "\n".join(lines)
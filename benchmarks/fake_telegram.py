@@ -0,0 +1,141 @@
+# benchmarks/fake_telegram.py
+"""
+Локальная замена Telegram Bot API для нагрузочных тестов (aiohttp).
+
+Отдает боту апдейты из очереди через getUpdates (long polling) и отвечает
+на исходящие методы правдоподобными объектами: sendMessage/editMessageText -
+сообщением, answerCallbackQuery - True, getChatMember - участником чата,
+getMe - ботом. Остальные методы принимаются и возвращают True.
+Бот подключается через TelegramAPIServer.from_base(server.url).
+"""
+import asyncio
+import itertools
+import json
+import time
+from collections import Counter, deque
+from typing import Any, Deque, Dict, Iterable, Optional, Set
+
+from aiohttp import web
+
+BOT_USER = {"id": 100_000_001, "is_bot": True, "first_name": "Load Test Bot", "username": "load_test_bot"}
+
+# Методы, которые возвращают сообщение (aiogram проверяет тип результата)
+MESSAGE_METHODS = {"sendmessage", "senddocument", "sendphoto", "editmessagereplymarkup"}
+
+
+def _chat(chat_id: int) -> Dict[str, Any]:
+    return {"id": chat_id, "type": "private" if chat_id > 0 else "supergroup", "title": None if chat_id > 0 else "Load test"}
+
+
+class FakeTelegramServer:
+    """Сервер Bot API в том же процессе; считает вызовы методов."""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, admin_ids: Iterable[int] = ()):
+        self.host = host
+        self.port = port
+        self.admin_ids: Set[int] = set(admin_ids)
+        self.calls: Counter = Counter()
+        self.delivered_at: Dict[int, float] = {}
+
+        self._pending: Deque[Dict[str, Any]] = deque()
+        self._new_updates = asyncio.Event()
+        self._message_ids = itertools.count(1_000)
+        self._runner: Optional[web.AppRunner] = None
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    async def start(self) -> None:
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host=self.host, port=self.port)
+        await site.start()
+        # Порт 0 - выбирает ОС; узнаем фактический
+        self.port = self._runner.addresses[0][1]
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def push(self, update: Dict[str, Any]) -> None:
+        """Ставит апдейт в очередь getUpdates."""
+        self._pending.append(update)
+        self._new_updates.set()
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        self.calls[method] += 1
+        params = {key: self._decode(value) for key, value in (await request.post()).items()}
+        handler = getattr(self, f"_method_{method.lower()}", None)
+        if handler is not None:
+            result = await handler(params)
+        elif method.lower() in MESSAGE_METHODS:
+            result = self._message(params)
+        else:
+            result = True
+        return web.json_response({"ok": True, "result": result})
+
+    @staticmethod
+    def _decode(value: Any) -> Any:
+        """aiogram передает сложные параметры JSON-строкой, простые - строкой."""
+        if not isinstance(value, str):
+            return value
+        try:
+            return json.loads(value)
+        except ValueError:
+            return value
+
+    def _message(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        chat_id = int(params.get("chat_id", 0))
+        return {
+            "message_id": int(params.get("message_id") or next(self._message_ids)),
+            "date": int(time.time()),
+            "chat": _chat(chat_id),
+            "from": BOT_USER,
+            "text": str(params.get("text", "")),
+        }
+
+    async def _method_getme(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        return BOT_USER
+
+    async def _method_getupdates(self, params: Dict[str, Any]) -> list:
+        offset = int(params.get("offset") or 0)
+        limit = int(params.get("limit") or 100)
+        timeout = float(params.get("timeout") or 0)
+        # Апдейты до offset бот подтвердил
+        while self._pending and self._pending[0]["update_id"] < offset:
+            self._pending.popleft()
+        if not self._pending and timeout:
+            self._new_updates.clear()
+            try:
+                await asyncio.wait_for(self._new_updates.wait(), timeout)
+            except asyncio.TimeoutError:
+                return []
+        updates = list(itertools.islice(self._pending, limit))
+        now = time.perf_counter()
+        for update in updates:
+            self.delivered_at.setdefault(update["update_id"], now)
+        return updates
+
+    async def _method_editmessagetext(self, params: Dict[str, Any]) -> Any:
+        if params.get("inline_message_id"):
+            return True
+        return self._message(params)
+
+    async def _method_answercallbackquery(self, params: Dict[str, Any]) -> bool:
+        return True
+
+    async def _method_getchatmember(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        user_id = int(params["user_id"])
+        user = {"id": user_id, "is_bot": False, "first_name": f"User {user_id}"}
+        if user_id in self.admin_ids:
+            return {"status": "administrator", "user": user, "can_be_edited": False, "is_anonymous": False,
+                    "can_manage_chat": True, "can_delete_messages": True, "can_manage_video_chats": True,
+                    "can_restrict_members": True, "can_promote_members": False, "can_change_info": True,
+                    "can_invite_users": True, "can_post_stories": False, "can_edit_stories": False,
+                    "can_delete_stories": False}
+        return {"status": "member", "user": user}
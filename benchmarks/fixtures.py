@@ -0,0 +1,99 @@
+# benchmarks/fixtures.py
+"""
+Детерминированные данные для бенчмарков: пользователи и соревнования
+с заданным числом игроков. Вставка пачками через Core (без ORM-объектов).
+"""
+import random
+from typing import Any, Dict, List, NamedTuple
+
+from sqlalchemy import insert, select, func
+
+from database import models
+
+BATCH_SIZE = 5000
+
+RANGE_RULES = [
+    {"diff_min": 0, "diff_max": 100, "win_points": 25, "lose_points": -25},
+    {"diff_min": 100, "diff_max": 300, "win_points": 30, "lose_points": -20},
+    {"diff_min": 300, "diff_max": None, "win_points": 40, "lose_points": -10},
+]
+RANKS = [
+    {"name": "Бронза", "mmr_threshold": 0},
+    {"name": "Серебро", "mmr_threshold": 1100},
+    {"name": "Золото", "mmr_threshold": 1300},
+    {"name": "Алмаз", "mmr_threshold": 1600},
+]
+ACHIEVEMENTS = {"MVP": 5, "Первая кровь": 2, "Камбэк": 3}
+
+
+class SeededCompetition(NamedTuple):
+    id: int
+    name: str
+    chat_id: int
+    user_ids: List[int]  # Внутренние ID пользователей-игроков (User.id)
+
+
+async def _insert_batches(db, table, rows: List[Dict[str, Any]]) -> None:
+    for start in range(0, len(rows), BATCH_SIZE):
+        await db.execute(insert(table), rows[start:start + BATCH_SIZE])
+
+
+async def ensure_users(db, count: int, seed: int) -> List[int]:
+    """Создает пользователей до count штук (telegram ID 10^9 + n) и возвращает их внутренние ID."""
+    existing = (await db.execute(select(func.count()).select_from(models.User))).scalar()
+    if existing < count:
+        rng = random.Random(seed)
+        rows = []
+        for n in range(existing, count):
+            username = f"bench_{n}" if rng.random() < 0.9 else None
+            rows.append({
+                "user_id": 1_000_000_000 + n,
+                "username": username,
+                "username_lower": username,
+                "full_name": f"Игрок {n}",
+            })
+        await _insert_batches(db, models.User.__table__, rows)
+        await db.commit()
+    result = await db.execute(select(models.User.id).order_by(models.User.id).limit(count))
+    return list(result.scalars().all())
+
+
+async def seed_competition(db, name: str, players: int, seed: int, use_formula: bool = False) -> SeededCompetition:
+    """Соревнование с players игроками; MMR - нормальное распределение вокруг 1200."""
+    rng = random.Random(f"{seed}:{name}")
+    user_ids = await ensure_users(db, players, seed)
+    chat_id = -1_000_000_000_000 - rng.randrange(1_000_000)
+
+    result = await db.execute(
+        insert(models.Competition).values(
+            name=name,
+            chat_id=chat_id,
+            creator_id=user_ids[0],
+            start_mmr=1000,
+            use_formula=use_formula,
+            formula="25 + (opponent_mmr - player_mmr) / 40" if use_formula else None,
+            range_rules=[] if use_formula else RANGE_RULES,
+            ranks=RANKS,
+            achievements=ACHIEVEMENTS,
+            admins=[],
+            version=0,
+        )
+    )
+    competition_id = result.inserted_primary_key[0]
+    await db.execute(insert(models.CompetitionAdmin).values(competition_id=competition_id, user_id=user_ids[0]))
+
+    rows = []
+    for user_id in user_ids:
+        wins = rng.randrange(0, 200)
+        rows.append({
+            "competition_id": competition_id,
+            "user_id": user_id,
+            "mmr": max(0, int(rng.gauss(1200, 200))),
+            "wins": wins,
+            "losses": rng.randrange(0, 200),
+            "streak": rng.randrange(-5, 6),
+            "achievements": {},
+        })
+    await _insert_batches(db, models.Player.__table__, rows)
+    await db.commit()
+    return SeededCompetition(competition_id, name, chat_id, user_ids)
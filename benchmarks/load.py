@@ -0,0 +1,408 @@
+# benchmarks/load.py
+"""
+Сквозной нагрузочный тест: настоящий Dispatcher из main.py (роутеры,
+фильтры, middleware, БД) получает апдейты через getUpdates от локального
+Bot API (benchmarks/fake_telegram.py), без сети.
+
+    python benchmarks/load.py                                  # случайный поток, 2000 апдейтов
+    python benchmarks/load.py --rate 200 --updates 10000       # 200 апдейтов/с
+    python benchmarks/load.py --mix top=50,stats=30,match=20   # свое соотношение команд
+    python benchmarks/load.py --script updates.jsonl           # записанные апдейты (как scripts/post_updates.py)
+    DATABASE_URL=sqlite+aiosqlite:///load.db python benchmarks/load.py --competition synth_17
+                                                               # база из scripts/generate_dataset.py
+
+Задержка апдейта - от постановки в очередь Bot API до конца обработки в
+диспетчере (включая все исходящие запросы хендлера). По каждому типу
+команды: число апдейтов, апдейтов/с, p50/p99/max и запросов к Bot API на
+апдейт. Результат сохраняется в JSON в том же формате, что у run.py
+(--baseline для сравнения).
+"""
+import argparse
+import asyncio
+import contextvars
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+DEFAULT_RESULTS_DIR = ROOT / "benchmarks" / "results"
+DEFAULT_MIX = {"start": 5, "help": 5, "top": 20, "top_me": 10, "stats": 20, "match": 10, "chatter": 30}
+LOAD_COMPETITION = "load_test"
+
+_current_label: contextvars.ContextVar[str] = contextvars.ContextVar("load_label", default="-")
+
+
+class LoadData(NamedTuple):
+    competition_id: int
+    name: str
+    chat_id: int
+    admin_id: int  # Telegram ID администратора соревнования
+    players: List[Tuple[int, str]]  # (Telegram ID, username) игроков с username
+
+
+class UpdateFactory:
+    """Апдейты Telegram для команд бота со случайными игроками соревнования."""
+
+    def __init__(self, data: LoadData, rng: random.Random):
+        self.data = data
+        self.rng = rng
+        self._message_ids = iter(range(1, 10**9))
+
+    def _user(self, telegram_id: int, username: Optional[str]) -> Dict[str, Any]:
+        return {"id": telegram_id, "is_bot": False, "first_name": f"Load {telegram_id}", "username": username}
+
+    def _message(self, user: Dict[str, Any], chat: Dict[str, Any], text: str) -> Dict[str, Any]:
+        return {"message": {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": chat,
+            "from": user,
+            "text": text,
+        }}
+
+    def _private(self, text: str) -> Dict[str, Any]:
+        telegram_id, username = self.rng.choice(self.data.players)
+        return self._message(self._user(telegram_id, username), {"id": telegram_id, "type": "private"}, text)
+
+    def _group(self, text: str, telegram_id: Optional[int] = None) -> Dict[str, Any]:
+        if telegram_id is None:
+            telegram_id, username = self.rng.choice(self.data.players)
+        else:
+            username = None
+        chat = {"id": self.data.chat_id, "type": "supergroup", "title": self.data.name}
+        return self._message(self._user(telegram_id, username), chat, text)
+
+    def _callback(self, data: str) -> Dict[str, Any]:
+        telegram_id, username = self.rng.choice(self.data.players)
+        return {"callback_query": {
+            "id": str(next(self._message_ids)),
+            "from": self._user(telegram_id, username),
+            "chat_instance": "load",
+            "data": data,
+            "message": {
+                "message_id": next(self._message_ids),
+                "date": int(time.time()),
+                "chat": {"id": telegram_id, "type": "private"},
+                "text": "menu",
+            },
+        }}
+
+    def start(self) -> Dict[str, Any]:
+        return self._private("/start")
+
+    def help(self) -> Dict[str, Any]:
+        return self._private("/help")
+
+    def top(self) -> Dict[str, Any]:
+        return self._group(f"топ {self.data.name} 20")
+
+    def top_me(self) -> Dict[str, Any]:
+        return self._callback(f"lbme:{self.data.competition_id}:20")
+
+    def stats(self) -> Dict[str, Any]:
+        return self._callback(f"view_comp_{self.data.competition_id}")
+
+    def match(self) -> Dict[str, Any]:
+        players = self.rng.sample(self.data.players, min(len(self.data.players), self.rng.choice([2, 2, 3, 4, 6])))
+        losers = [f"@{username}" for _, username in players[1:]]
+        return self._group(f"/Исход {self.data.name}, {', '.join(losers)}, @{players[0][1]}", self.data.admin_id)
+
+    def chatter(self) -> Dict[str, Any]:
+        return self._group(self.rng.choice(["gg", "го еще", "кто играет?", "+", "ок"]))
+
+
+def parse_mix(spec: str) -> Dict[str, int]:
+    """'top=50,stats=30' -> {'top': 50, 'stats': 30}."""
+    mix = {}
+    for item in spec.split(","):
+        name, _, weight = item.partition("=")
+        if not hasattr(UpdateFactory, name.strip()) or name.startswith("_"):
+            raise SystemExit(f"Неизвестный тип апдейта в --mix: {name}. Доступны: {', '.join(DEFAULT_MIX)}")
+        mix[name.strip()] = int(weight or 1)
+    return mix
+
+
+def random_updates(factory: UpdateFactory, mix: Dict[str, int], count: int) -> List[Tuple[str, Dict[str, Any]]]:
+    labels = factory.rng.choices(list(mix), weights=list(mix.values()), k=count)
+    return [(label, getattr(factory, label)()) for label in labels]
+
+
+def label_for(update: Dict[str, Any]) -> str:
+    """Тип записанного апдейта: первое слово команды или префикс callback_data."""
+    if "message" in update and update["message"].get("text"):
+        word = update["message"]["text"].split(maxsplit=1)[0].lower()
+        return word.split("@", 1)[0] if word.startswith("/") else word if len(word) < 20 else "text"
+    if "callback_query" in update:
+        data = update["callback_query"].get("data") or ""
+        return "cb:" + (re.match(r"[^\d]*", data).group().rstrip(":_") or "-")
+    return next((key for key in update if key != "update_id"), "unknown")
+
+
+class LoadRecorder:
+    """Время постановки и завершения апдейтов; ожидание, пока все будут обработаны."""
+
+    def __init__(self, total: int):
+        self.total = total
+        self.labels: Dict[int, str] = {}
+        self.enqueued_at: Dict[int, float] = {}
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.outcomes: Dict[str, Counter] = defaultdict(Counter)
+        self.api_calls: Counter = Counter()
+        self.finished_at = 0.0
+        self.done = asyncio.Event()
+        self._finished = 0
+
+    def enqueue(self, update_id: int, label: str) -> None:
+        self.labels[update_id] = label
+        self.enqueued_at[update_id] = time.perf_counter()
+
+    def finish(self, update_id: int, outcome: str) -> None:
+        now = time.perf_counter()
+        label = self.labels.get(update_id, "?")
+        self.latencies[label].append(now - self.enqueued_at.get(update_id, now))
+        self.outcomes[label][outcome] += 1
+        self.finished_at = now
+        self._finished += 1
+        if self._finished >= self.total:
+            self.done.set()
+
+    def instrument(self, dp, bot) -> None:
+        """
+        Оборачивает dp.feed_update (снаружи всех middleware) и считает
+        запросы к Bot API по типу апдейта через middleware сессии бота.
+        """
+        from aiogram.dispatcher.event.bases import UNHANDLED
+
+        feed_update = dp.feed_update
+
+        async def recorded_feed_update(bot, update, **kwargs):
+            token = _current_label.set(self.labels.get(update.update_id, "?"))
+            outcome = "error"
+            try:
+                result = await feed_update(bot, update, **kwargs)
+                outcome = "unhandled" if result is UNHANDLED else "handled"
+                return result
+            finally:
+                self.finish(update.update_id, outcome)
+                _current_label.reset(token)
+
+        dp.feed_update = recorded_feed_update
+
+        async def count_api_calls(make_request, bot, method):
+            self.api_calls[_current_label.get()] += 1
+            return await make_request(bot, method)
+
+        bot.session.middleware(count_api_calls)
+
+
+async def prepare_data(args) -> LoadData:
+    """Соревнование для случайного потока: существующее (--competition) или новое из benchmarks/fixtures.py."""
+    from sqlalchemy import select
+
+    from benchmarks.fixtures import seed_competition
+    from database import crud, get_sessionmaker, models
+
+    async with get_sessionmaker()() as db:
+        name = args.competition or LOAD_COMPETITION
+        competition = await crud.get_competition_by_name(db, name)
+        if competition is None:
+            if args.competition:
+                raise SystemExit(f"Соревнование '{args.competition}' не найдено в базе.")
+            await seed_competition(db, name, args.players, args.seed)
+            competition = await crud.get_competition_by_name(db, name)
+
+        admin_id = (await db.execute(
+            select(models.User.user_id)
+            .join(models.CompetitionAdmin, models.CompetitionAdmin.user_id == models.User.id)
+            .where(models.CompetitionAdmin.competition_id == competition.id)
+            .limit(1)
+        )).scalar()
+        players = (await db.execute(
+            select(models.User.user_id, models.User.username)
+            .join(models.Player, models.Player.user_id == models.User.id)
+            .where(models.Player.competition_id == competition.id, models.User.username.is_not(None))
+            .order_by(models.Player.id)
+            .limit(args.active_players)
+        )).all()
+    if admin_id is None or len(players) < 2:
+        raise SystemExit(f"В соревновании '{competition.name}' нет администратора или игроков с username.")
+    return LoadData(competition.id, competition.name, competition.chat_id, admin_id, [tuple(p) for p in players])
+
+
+async def feed(server, recorder: LoadRecorder, updates: List[Tuple[str, Dict[str, Any]]], rate: float) -> None:
+    """Ставит апдейты в очередь getUpdates: все сразу (rate=0) или с заданной частотой."""
+    started = time.perf_counter()
+    for n, (label, update) in enumerate(updates):
+        if rate:
+            delay = started + n / rate - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        recorder.enqueue(update["update_id"], label)
+        server.push(update)
+
+
+async def run_load(args) -> Dict[str, Any]:
+    from aiogram.client.session.aiohttp import AiohttpSession
+    from aiogram.client.telegram import TelegramAPIServer
+
+    from benchmarks.fake_telegram import FakeTelegramServer
+    from database import init_db
+    from scripts.post_updates import load_updates
+
+    import main as bot_main
+
+    await init_db()
+    admin_ids = []
+    if args.script:
+        updates = [(label_for(update), update) for update in load_updates(args.script)]
+    else:
+        data = await prepare_data(args)
+        admin_ids.append(data.admin_id)
+        updates = random_updates(UpdateFactory(data, random.Random(args.seed)), args.mix, args.updates)
+    # Номера апдейтов по порядку: от них зависит offset в getUpdates
+    for update_id, (_, update) in enumerate(updates, start=1):
+        update["update_id"] = update_id
+
+    server = FakeTelegramServer(admin_ids=admin_ids)
+    await server.start()
+    recorder = LoadRecorder(len(updates))
+
+    bot = bot_main.build_bot(AiohttpSession(api=TelegramAPIServer.from_base(server.url)))
+    dp = bot_main.build_dispatcher()
+    recorder.instrument(dp, bot)
+    started_polling = asyncio.Event()
+
+    async def on_startup():
+        started_polling.set()
+
+    dp.startup.register(on_startup)
+    polling = asyncio.create_task(dp.start_polling(
+        bot,
+        allowed_updates=dp.resolve_used_update_types(),
+        handle_as_tasks=True,
+        handle_signals=False,
+        polling_timeout=1,
+    ))
+    await started_polling.wait()
+
+    started = time.perf_counter()
+    await feed(server, recorder, updates, args.rate)
+    try:
+        await asyncio.wait_for(recorder.done.wait(), args.timeout)
+    except asyncio.TimeoutError:
+        print(f"Таймаут: обработано {sum(map(len, recorder.latencies.values()))} из {len(updates)} апдейтов", file=sys.stderr)
+    elapsed = (recorder.finished_at or time.perf_counter()) - started
+
+    await dp.stop_polling()
+    await polling
+    await server.stop()
+
+    return summarize(recorder, server, elapsed, args)
+
+
+def summarize(recorder: LoadRecorder, server, elapsed: float, args) -> Dict[str, Any]:
+    from benchmarks.common import _result
+
+    params = {"rate": args.rate, "updates": recorder.total}
+    results, details = [], {}
+    everything = []
+    for label in sorted(recorder.latencies, key=lambda l: -len(recorder.latencies[l])):
+        latencies = recorder.latencies[label]
+        everything += latencies
+        result = _result(f"e2e:{label}", params, latencies, elapsed, len(latencies), None)
+        results.append(result)
+        details[result.name] = {
+            "outcomes": dict(recorder.outcomes[label]),
+            "api_calls_per_update": round(recorder.api_calls[label] / len(latencies), 2),
+        }
+    total = _result("e2e:all", params, everything, elapsed, len(everything), None)
+    details[total.name] = {"api_calls_per_update": round(sum(recorder.api_calls.values()) / max(1, len(everything)), 2)}
+    return {"results": [total] + results, "details": details, "api_methods": dict(server.calls)}
+
+
+def format_report(report: Dict[str, Any]) -> str:
+    lines = [f"{'update':<24} {'count':>7} {'upd/s':>9} {'p50 ms':>9} {'p99 ms':>9} {'max ms':>9} {'api/upd':>8}  исход"]
+    for r in report["results"]:
+        detail = report["details"][r.name]
+        outcomes = ", ".join(f"{k}={v}" for k, v in sorted(detail.get("outcomes", {}).items()))
+        lines.append(
+            f"{r.name[4:]:<24} {r.ops:>7} {r.ops_per_sec:>9.1f} {r.p50_ms:>9.1f} {r.p99_ms:>9.1f} "
+            f"{r.max_ms:>9.1f} {detail['api_calls_per_update']:>8.2f}  {outcomes}"
+        )
+    lines.append("Bot API: " + ", ".join(f"{k}={v}" for k, v in sorted(report["api_methods"].items())))
+    return "\n".join(lines)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Сквозной нагрузочный тест бота с локальным Bot API")
+    parser.add_argument("--updates", type=int, default=2000, help="Сколько случайных апдейтов отправить")
+    parser.add_argument("--mix", type=parse_mix, default=DEFAULT_MIX,
+                        help=f"Соотношение типов апдейтов (по умолчанию {','.join(f'{k}={v}' for k, v in DEFAULT_MIX.items())})")
+    parser.add_argument("--script", help="Записанные апдейты (JSON-массив или JSON Lines) вместо случайных")
+    parser.add_argument("--rate", type=float, default=0, help="Апдейтов в секунду (0 - все сразу)")
+    parser.add_argument("--competition", help="Существующее соревнование в базе (иначе создается load_test)")
+    parser.add_argument("--players", type=int, default=1000, help="Игроков в новом соревновании load_test")
+    parser.add_argument("--active-players", type=int, default=500, help="Среди скольких игроков выбирать отправителей")
+    parser.add_argument("--seed", type=int, default=42, help="Seed случайного потока")
+    parser.add_argument("--timeout", type=float, default=300, help="Сколько ждать обработки всех апдейтов, с")
+    parser.add_argument("--flood-limits", action="store_true", help="Оставить флуд-лимиты исходящих сообщений как в продакшене")
+    parser.add_argument("--out", help="Файл результатов JSON (по умолчанию benchmarks/results/load-<время>.json)")
+    parser.add_argument("--baseline", help="Прошлый результат для сравнения")
+    args = parser.parse_args()
+
+    # Окружение до импорта main: он читает настройки при импорте
+    tmp = tempfile.TemporaryDirectory()
+    os.environ.setdefault("DATABASE_URL", f"sqlite+aiosqlite:///{os.path.join(tmp.name, 'load.db')}")
+    os.environ.setdefault("BOT_TOKEN", "123456:LOAD-TEST")
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    os.environ["BOT_MODE"] = "polling"
+    os.environ["WORKERS"] = "1"
+    if not args.flood_limits:
+        # Bot API локальный: лимиты Telegram только замедлили бы обработку
+        for name in ("OUTBOUND_GLOBAL_RATE", "OUTBOUND_PRIVATE_CHAT_RATE", "OUTBOUND_GROUP_CHAT_PER_MINUTE", "OUTBOUND_CHAT_BURST"):
+            os.environ.setdefault(name, "1000000")
+
+    from benchmarks.common import compare
+
+    try:
+        report = asyncio.run(run_load(args))
+    finally:
+        tmp.cleanup()
+    print(format_report(report))
+
+    results = [r.as_dict() for r in report["results"]]
+    out = Path(args.out) if args.out else DEFAULT_RESULTS_DIR / f"load-{time.strftime('%Y%m%d-%H%M%S')}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps({
+        "meta": {
+            "timestamp": int(time.time()),
+            "rate": args.rate,
+            "updates": results[0]["ops"],
+            "mix": None if args.script else args.mix,
+            "script": args.script,
+            "seed": args.seed,
+            "flood_limits": args.flood_limits,
+        },
+        "results": results,
+        "details": report["details"],
+        "api_methods": report["api_methods"],
+    }, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(f"\nРезультаты сохранены: {out}")
+
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text(encoding="utf-8"))
+        print("\nСравнение с", args.baseline)
+        print(compare(results, baseline["results"]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,278 @@
+# benchmarks/run.py
+"""
+Бенчмарки горячих путей рейтинга и БД. Работают без сети на временной SQLite.
+
+    python benchmarks/run.py                      # все бенчмарки, результат в benchmarks/results/
+    python benchmarks/run.py --quick              # без соревнования на 100k игроков, меньше повторов
+    python benchmarks/run.py --only db --baseline benchmarks/results/<прошлый>.json
+
+Для каждого бенчмарка сохраняются ops/sec, p50/p99/max задержки (мс) и
+число SQL-запросов на операцию. --baseline печатает изменение относительно
+прошлого прогона.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, Dict, List
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+# До импорта модулей бота: логирование и БД настраиваются из окружения
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+os.environ.setdefault("LOG_QUEUE", "0")
+
+import aiogram
+import sqlalchemy
+
+from utils.logging_setup import setup_logging
+
+setup_logging()
+
+DEFAULT_RESULTS_DIR = ROOT / "benchmarks" / "results"
+MATCH_SIZES = (2, 10, 64)
+# Во сколько раз последняя страница топа может быть медленнее первой без предупреждения
+DEEP_PAGE_SLOWDOWN = 3
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def match_command_text(players: int) -> str:
+    parts = ["/Исход Турнир"]
+    for n in range(players):
+        parts.append(f"@player_{n}: MVP" if n % 3 == 0 else f"@player_{n}")
+    parts.append("@player_0")
+    return ", ".join(parts)
+
+
+def bench_rating(args) -> List:
+    """Чистые функции: разбор /Исход и расчет MMR."""
+    from benchmarks.common import bench_sync
+    from handlers.match_handlers import parse_match_command
+    from utils.mmr_calculator import calculate_mmr_change_by_formula, calculate_mmr_change_by_ranges
+    from benchmarks.fixtures import RANGE_RULES
+
+    results = []
+    for players in MATCH_SIZES:
+        text = match_command_text(players)
+        results.append(bench_sync(
+            "parse_match_command", lambda: parse_match_command(text), {"players": players}, samples=args.samples
+        ))
+
+    ranges = SimpleNamespace(use_formula=False, range_rules=RANGE_RULES)
+    results.append(bench_sync(
+        "calculate_mmr_change_by_ranges",
+        lambda: calculate_mmr_change_by_ranges(ranges, 1200, 1350, True),
+        samples=args.samples,
+    ))
+    formula = SimpleNamespace(use_formula=True, formula="25 + (opponent_mmr - player_mmr) / 40")
+    results.append(bench_sync(
+        "calculate_mmr_change_by_formula",
+        lambda: calculate_mmr_change_by_formula(formula, 1200, 1350),
+        samples=args.samples,
+    ))
+    return results
+
+
+async def bench_database(args) -> List:
+    """Запись матча, топ и статистика игрока на заполненной БД."""
+    from aiogram.types import CallbackQuery, Message
+    from sqlalchemy import select
+
+    from benchmarks.common import QueryCounter, bench_async, make_bot
+    from benchmarks.fixtures import seed_competition
+    from database import crud, get_engine, get_sessionmaker, init_db, models
+    from handlers.admin_commands import cmd_top
+    from handlers.player_handlers import show_player_stats
+    import utils.leaderboard
+
+    await init_db()
+    queries = QueryCounter(get_engine())
+    AsyncSessionLocal = get_sessionmaker()
+    bot = make_bot()
+    results = []
+
+    sizes = [1_000] if args.quick else [1_000, 100_000]
+    competitions = {}
+    async with AsyncSessionLocal() as db:
+        for size in sizes:
+            started = time.perf_counter()
+            competitions[size] = await seed_competition(db, f"bench_{size}", size, args.seed)
+            print(f"  соревнование на {size} игроков создано за {time.perf_counter() - started:.1f} с", file=sys.stderr)
+        matches_competition = await seed_competition(db, "bench_matches", max(MATCH_SIZES) * 2, args.seed)
+
+    # --- crud.create_match ---
+    for players in MATCH_SIZES:
+        async def create_match(i: int, players=players) -> None:
+            user_ids = matches_competition.user_ids
+            offset = (i * players) % (len(user_ids) - players + 1)
+            participants = [
+                {
+                    "user_id": user_id,
+                    "mmr_change": 25 if n == 0 else -20,
+                    "is_winner": n == 0,
+                    "achievements": ["MVP"] if n == 0 else [],
+                }
+                for n, user_id in enumerate(user_ids[offset:offset + players])
+            ]
+            async with AsyncSessionLocal() as db:
+                await crud.create_match(db, matches_competition.id, participants[0]["user_id"], participants)
+
+        results.append(await bench_async(
+            "crud.create_match", create_match, {"players": players}, ops=args.ops, queries=queries
+        ))
+
+    # --- cmd_top: без кэша (первый запрос после матча) и из кэша страниц ---
+    for size, competition in competitions.items():
+        message = Message.model_validate({
+            "message_id": 1,
+            "date": int(time.time()),
+            "chat": {"id": competition.chat_id, "type": "supergroup"},
+            "from": {"id": 1_000_000_000, "is_bot": False, "first_name": "bench"},
+            "text": f"топ {competition.name} 30",
+        }, context={"bot": bot})
+
+        async def top(i: int) -> None:
+            async with AsyncSessionLocal() as db:
+                await cmd_top(message, db)
+
+        results.append(await bench_async(
+            "cmd_top", top, {"players": size, "cache": "cold"}, ops=args.ops, queries=queries,
+            setup=lambda i: utils.leaderboard._page_cache.clear(),
+        ))
+        results.append(await bench_async(
+            "cmd_top", top, {"players": size, "cache": "warm"}, ops=args.ops, queries=queries
+        ))
+
+    # --- crud.get_leaderboard_page: страница топа в начале и в глубине ---
+    # Keyset-курсор должен давать поиск по индексу: время страницы не растет с глубиной
+    for size, competition in competitions.items():
+        async with AsyncSessionLocal() as db:
+            ordered = await db.execute(
+                select(models.Player.mmr, models.Player.id)
+                .where(models.Player.competition_id == competition.id)
+                .order_by(models.Player.mmr.desc(), models.Player.id)
+            )
+            cursors = [tuple(row) for row in ordered.all()]
+        by_depth = {}
+        for depth in ("top", "middle", "bottom"):
+            position = {"top": 0, "middle": len(cursors) // 2, "bottom": len(cursors) - 31}[depth]
+            cursor = cursors[max(position, 0)]
+
+            async def page(i: int, cursor=cursor) -> None:
+                async with AsyncSessionLocal() as db:
+                    await crud.get_leaderboard_page(db, competition.id, 31, after=cursor)
+
+            by_depth[depth] = await bench_async(
+                "crud.get_leaderboard_page", page, {"players": size, "depth": depth}, ops=args.ops, queries=queries
+            )
+            results.append(by_depth[depth])
+        if by_depth["bottom"].p50_ms > DEEP_PAGE_SLOWDOWN * by_depth["top"].p50_ms:
+            print(
+                f"  ВНИМАНИЕ: последняя страница топа на {size} игроков в "
+                f"{by_depth['bottom'].p50_ms / by_depth['top'].p50_ms:.0f} раз медленнее первой "
+                "(курсор не использует индекс?)",
+                file=sys.stderr,
+            )
+
+    # --- show_player_stats ---
+    for size, competition in competitions.items():
+        async def stats(i: int, competition=competition) -> None:
+            # ensure_users на пустой БД: telegram ID = 10^9 + (User.id - 1)
+            telegram_id = 1_000_000_000 + competition.user_ids[(i * 7919) % len(competition.user_ids)] - 1
+            callback = CallbackQuery.model_validate({
+                "id": str(i),
+                "chat_instance": "bench",
+                "data": f"stats_{competition.id}",
+                "from": {"id": telegram_id, "is_bot": False, "first_name": "bench"},
+                "message": {
+                    "message_id": 1,
+                    "date": int(time.time()),
+                    "chat": {"id": telegram_id, "type": "private"},
+                    "text": "menu",
+                },
+            }, context={"bot": bot})
+            async with AsyncSessionLocal() as db:
+                db_user = await crud.get_user_identity(db, telegram_id)
+                await show_player_stats(callback, db, db_user, competition.id)
+
+        results.append(await bench_async(
+            "show_player_stats", stats, {"players": size}, ops=args.ops, queries=queries
+        ))
+
+    await get_engine().dispose()
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Бенчмарки рейтинга и БД")
+    parser.add_argument("--out", help="Файл результатов JSON (по умолчанию benchmarks/results/<время>-<коммит>.json)")
+    parser.add_argument("--baseline", help="Прошлый результат для сравнения")
+    parser.add_argument("--only", choices=["rating", "db"], help="Только одна группа бенчмарков")
+    parser.add_argument("--quick", action="store_true", help="Без соревнования на 100k игроков, меньше повторов")
+    parser.add_argument("--ops", type=int, default=200, help="Операций на бенчмарк БД")
+    parser.add_argument("--samples", type=int, default=200, help="Замеров на бенчмарк чистых функций")
+    parser.add_argument("--seed", type=int, default=42, help="Seed генерации данных")
+    parser.add_argument("--db", help="Новый файл SQLite, чтобы сохранить БД после прогона (по умолчанию временный)")
+    args = parser.parse_args()
+    if args.quick:
+        args.ops = min(args.ops, 50)
+        args.samples = min(args.samples, 50)
+
+    from benchmarks.common import compare, format_table
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = args.db or os.path.join(tmp, "bench.db")
+        os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{db_path}"
+
+        results = []
+        if args.only in (None, "rating"):
+            results += bench_rating(args)
+        if args.only in (None, "db"):
+            results += asyncio.run(bench_database(args))
+
+    print(format_table(results))
+    report: Dict[str, Any] = {
+        "meta": {
+            "timestamp": int(time.time()),
+            "git": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "aiogram": aiogram.__version__,
+            "sqlalchemy": sqlalchemy.__version__,
+            "seed": args.seed,
+            "quick": args.quick,
+            "ops": args.ops,
+            "samples": args.samples,
+        },
+        "results": [r.as_dict() for r in results],
+    }
+
+    out = Path(args.out) if args.out else DEFAULT_RESULTS_DIR / f"{time.strftime('%Y%m%d-%H%M%S')}-{report['meta']['git']}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(f"\nРезультаты сохранены: {out}")
+
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text(encoding="utf-8"))
+        print("\nСравнение с", args.baseline)
+        print(compare(report["results"], baseline["results"]))
+
+
+if __name__ == "__main__":
+    main()
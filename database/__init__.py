@@ -10,6 +10,7 @@ logger = logging.getLogger(__name__)
 
 
 from . import models
+from .migrations import run_migrations
 
 Base = models.Base 
 
@@ -82,6 +83,8 @@ async def init_models():
             logger.info("Вызов Base.metadata.create_all()...")
             await conn.run_sync(Base.metadata.create_all) # <-- Теперь это metadata с таблицами
             logger.info("Base.metadata.create_all() завершён.")
+            await conn.run_sync(run_migrations)
+            logger.info("Миграции данных выполнены.")
             try:
                 result = await conn.execute(text("SELECT name FROM sqlite_master WHERE type='table';"))
                 existing_tables_after = [row[0] for row in result.fetchall()]
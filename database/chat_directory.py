@@ -0,0 +1,94 @@
+# database/chat_directory.py
+"""
+Пассивный справочник участников чатов соревнований.
+
+Сообщения из чатов складываются в буфер в памяти и периодически
+сбрасываются в таблицу chat_members одним upsert-ом.
+"""
+import logging
+import os
+import time
+from typing import Any, Dict, Hashable, Optional
+
+from aiogram.types import User
+
+from utils.batching import CoalescingBuffer
+from . import crud, get_sessionmaker
+
+logger = logging.getLogger(__name__)
+
+
+class ChatDirectory(CoalescingBuffer):
+    """Буфер записей (chat_id, telegram user_id) -> данные пользователя."""
+
+    def __init__(self, flush_interval: float = 5.0, max_items: int = 500, refresh_interval: float = 60.0):
+        super().__init__(flush_interval=flush_interval, max_items=max_items)
+        self.refresh_interval = refresh_interval
+        self.competition_chat_ids: set = set()
+        self._refreshed_at = 0.0
+
+    def record(self, chat_id: int, user: User) -> None:
+        """Запоминает автора сообщения, если чат привязан к соревнованию."""
+        if chat_id not in self.competition_chat_ids:
+            return
+        username = user.username or None
+        self.put((chat_id, user.id), {
+            "chat_id": chat_id,
+            "user_id": user.id,
+            "username": username,
+            "username_lower": username.lower() if username else None,
+            "full_name": user.full_name,
+            "last_seen": int(time.time()),
+        })
+
+    def find_pending(self, chat_id: int, username: str) -> Optional[Dict[str, Any]]:
+        """Ищет еще не записанного в БД участника чата по username (без @)."""
+        username_lower = username.lower()
+        for row in self._pending.values():
+            if row["chat_id"] == chat_id and row["username_lower"] == username_lower:
+                return row
+        return None
+
+    async def refresh_chat_ids(self) -> None:
+        """Перечитывает список чатов, к которым привязаны соревнования."""
+        AsyncSessionLocal = get_sessionmaker()
+        async with AsyncSessionLocal() as db:
+            self.competition_chat_ids = await crud.get_competition_chat_ids(db)
+        self._refreshed_at = time.monotonic()
+
+    async def start(self) -> None:
+        await self.refresh_chat_ids()
+        await super().start()
+
+    async def flush(self) -> None:
+        # Пустой буфер: список чатов перечитываем не чаще refresh_interval,
+        # а не на каждом тике сброса (без него не найти чаты новых соревнований)
+        if not self.pending_count and time.monotonic() - self._refreshed_at < self.refresh_interval:
+            return
+        await super().flush()
+        # Подхватываем чаты новых соревнований (в т.ч. созданных другими процессами)
+        try:
+            await self.refresh_chat_ids()
+        except Exception as e:
+            logger.warning(f"Не удалось обновить список чатов соревнований: {e}")
+
+    async def write(self, items: Dict[Hashable, Any]) -> None:
+        AsyncSessionLocal = get_sessionmaker()
+        async with AsyncSessionLocal() as db:
+            await crud.upsert_chat_members(db, list(items.values()))
+        logger.debug(f"В chat_members записано {len(items)} участников чатов.")
+
+
+_chat_directory: Optional[ChatDirectory] = None
+
+
+def get_chat_directory() -> ChatDirectory:
+    """Ленивая инициализация справочника участников чатов."""
+    global _chat_directory
+    if _chat_directory is None:
+        _chat_directory = ChatDirectory(
+            flush_interval=float(os.getenv("CHAT_DIRECTORY_FLUSH_INTERVAL", "5")),
+            max_items=int(os.getenv("CHAT_DIRECTORY_MAX_PENDING", "500")),
+            refresh_interval=float(os.getenv("CHAT_DIRECTORY_REFRESH_INTERVAL", "60")),
+        )
+    return _chat_directory
@@ -1,10 +1,12 @@
 import time
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, NamedTuple, Optional, Tuple
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, and_, distinct
+from sqlalchemy import select, and_, or_, distinct, func, update
 
 from sqlalchemy.orm import selectinload
+from sqlalchemy.orm.attributes import set_committed_value
 
 from sqlalchemy import select
 
@@ -13,6 +15,24 @@ import logging
 logger = logging.getLogger(__name__)
 
 from . import models
+from .profile_buffer import get_profile_buffer
+from utils.cache import LRUCache
+
+# Кэш проверок прав: (competition_id, internal user_id) -> bool
+_admin_check_cache = LRUCache(maxsize=10_000, ttl=300, name="admin_check")
+# Кэш пользователей: Telegram ID -> UserIdentity
+_identity_cache = LRUCache(maxsize=50_000, ttl=600, name="user_identity")
+
+
+class UserIdentity(NamedTuple):
+    """
+    Снимок пользователя для кэша. Не привязан к сессии, поэтому его безопасно
+    переиспользовать между апдейтами. Поля совпадают с models.User.
+    """
+    id: int
+    user_id: int
+    username: Optional[str]
+    full_name: Optional[str]
 
 # ---- User CRUD ----
 async def get_or_create_user(db: AsyncSession, user_id: int, username: str, full_name: str) -> models.User:
@@ -28,7 +48,12 @@ async def get_or_create_user(db: AsyncSession, user_id: int, username: str, full
     
     if not user:
         # Пользователь не найден, создаем нового
-        user = models.User(user_id=user_id, username=username, full_name=full_name)
+        user = models.User(
+            user_id=user_id,
+            username=username,
+            username_lower=username.lower() if username else None,
+            full_name=full_name
+        )
         db.add(user)
         try:
             await db.commit()
@@ -45,17 +70,24 @@ async def get_or_create_user(db: AsyncSession, user_id: int, username: str, full
                 raise RuntimeError(f"Не удалось создать или получить пользователя с user_id={user_id}")
     else:
         # Пользователь найден, проверяем, нужно ли обновить данные
-        updated = False
-        if user.username != username:
-            user.username = username
-            updated = True
-        if user.full_name != full_name:
-            user.full_name = full_name
-            updated = True
-        if updated:
-            # Если были изменения, коммитим
-            await db.commit()
-            # await db.refresh(user) # Опционально
+        if user.username != username or user.full_name != full_name:
+            profile_buffer = get_profile_buffer()
+            if profile_buffer.running:
+                # Отложенная запись: commit не попадает на путь пользовательской команды.
+                # Объект обновляем без пометки "изменен", чтобы сессия не записала его сама.
+                set_committed_value(user, "username", username)
+                set_committed_value(user, "username_lower", username.lower() if username else None)
+                set_committed_value(user, "full_name", full_name)
+                profile_buffer.enqueue(user_id, username, full_name)
+            else:
+                # Буфер не запущен (например, в скриптах) - пишем сразу
+                user.username = username
+                user.username_lower = username.lower() if username else None
+                user.full_name = full_name
+                await db.commit()
+            # Кэш получает новые данные сразу: отложенная запись попадет в БД позже,
+            # и перечитанная до нее строка закэшировала бы старое имя на весь TTL
+            _identity_cache.set(user_id, UserIdentity(user.id, user.user_id, username, full_name))
     
     # Возвращаем объект пользователя
     return user
@@ -66,6 +98,55 @@ async def get_user_by_id(db: AsyncSession, user_id: int) -> Optional[models.User
     return result.scalars().first() 
 
 
+async def get_user_identity(
+    db: AsyncSession,
+    user_id: int,
+    username: Optional[str] = None,
+    full_name: Optional[str] = None
+) -> Optional[UserIdentity]:
+    """
+    Получает снимок пользователя по Telegram ID через кэш.
+    Незарегистрированные пользователи не кэшируются.
+    full_name/username - текущий профиль из апдейта: если кэш с ним расходится
+    (профиль обновил другой воркер), снимок перечитывается из БД.
+    """
+    identity = _identity_cache.get(user_id)
+    if identity is not None and _profile_differs(identity, username, full_name):
+        identity = None
+    if identity is None:
+        user = await get_user_by_id(db, user_id)
+        if user is None:
+            return None
+        identity = UserIdentity(user.id, user.user_id, user.username, user.full_name)
+        profile_buffer = get_profile_buffer()
+        if _profile_differs(identity, username, full_name) and profile_buffer.running:
+            # В БД еще старый профиль: ставим запись в очередь, иначе каждый апдейт
+            # пользователя снова промахивался бы мимо кэша
+            profile_buffer.enqueue(user_id, username or "", full_name)
+            identity = identity._replace(username=username or "", full_name=full_name)
+        _identity_cache.set(user_id, identity)
+    return identity
+
+
+def _profile_differs(identity: UserIdentity, username: Optional[str], full_name: Optional[str]) -> bool:
+    """Расходится ли снимок с профилем из апдейта (full_name=None - профиль неизвестен)."""
+    if full_name is None:
+        return False
+    return (identity.username or None) != (username or None) or identity.full_name != full_name
+
+
+async def get_users_by_usernames(db: AsyncSession, usernames: List[str]) -> Dict[str, models.User]:
+    """
+    Получает пользователей по списку username (без @) одним запросом, без учета регистра.
+    Возвращает словарь username в нижнем регистре -> User только для найденных пользователей.
+    """
+    lowered = {u.lower() for u in usernames if u}
+    if not lowered:
+        return {}
+    result = await db.execute(select(models.User).where(models.User.username_lower.in_(lowered)))
+    return {user.username_lower: user for user in result.scalars().all()}
+
+
 # ---- Competition CRUD ----
 async def create_competition( 
     db: AsyncSession, 
@@ -93,8 +174,8 @@ async def create_competition(
         range_rules=range_rules or [],
         achievements=achievements or {},
         ranks=ranks or [],
-        admins=[creator_id]
     )
+    competition.admin_links.append(models.CompetitionAdmin(user_id=creator_id))
     db.add(competition)
     await db.commit()      
     await db.refresh(competition) 
@@ -115,7 +196,44 @@ async def get_competition_by_id(db: AsyncSession, comp_id: int) -> Optional[mode
     return result.scalars().first() # 
 
 
+async def bump_competition_version(db: AsyncSession, competition_id: int) -> None:
+    """
+    Увеличивает версию соревнования (без commit).
+    Вызывать в той же транзакции, что и изменение, влияющее на топ: новый игрок,
+    изменение MMR, настройки рангов и т.п.
+    """
+    await db.execute(
+        update(models.Competition)
+        .where(models.Competition.id == competition_id)
+        .values(version=models.Competition.version + 1)
+    )
+
+
+async def set_competition_leaderboard_message(
+    db: AsyncSession,
+    competition_id: int,
+    message_id: Optional[int]
+) -> None:
+    """Сохраняет ID закрепленного сообщения с живым топом (None - выключить)."""
+    competition = await db.get(models.Competition, competition_id)
+    if competition:
+        competition.leaderboard_message_id = message_id
+        await db.commit()
+
+
 # ---- Player CRUD ----
+async def get_player(db: AsyncSession, competition_id: int, user_id: int) -> Optional[models.Player]:
+    """Получает участника соревнования без создания (user_id - внутренний ID пользователя)."""
+    result = await db.execute(
+        select(models.Player)
+        .where(
+            models.Player.competition_id == competition_id,
+            models.Player.user_id == user_id
+        )
+    )
+    return result.scalars().first()
+
+
 async def get_or_create_player(
     db: AsyncSession,
     competition_id: int,
@@ -151,6 +269,8 @@ async def get_or_create_player(
             mmr=max(start_mmr, 0)
         )
         db.add(player)
+        # Новый игрок появляется в топе - в той же транзакции, что и вставка
+        await bump_competition_version(db, competition_id)
         try:
             await db.commit() 
         except IntegrityError:
@@ -181,14 +301,34 @@ async def update_player_stats_after_match(
     achievements_gained: Optional[List[str]] = None 
 ) -> models.Player:
     """
-    Обновляет полную статистику игрока после матча.
+    Обновляет полную статистику игрока после матча (отдельной транзакцией).
+    Матч целиком записывает create_match.
     """
     competition = await get_competition_by_id(db, competition_id) 
     if not competition:
         raise ValueError(f"Соревнование с ID {competition_id} не найдено.")
 
     player = await get_or_create_player(db, competition_id, user_id) 
-    
+    apply_match_result(competition, player, mmr_delta, is_winner, achievements_gained)
+
+    if achievements_gained:
+        # Счетчики достижений обновляются upsert-ом, без чтения и перезаписи всего словаря
+        await increment_player_achievements(db, player.id, competition_id, achievements_gained)
+
+    # Топ изменился - старые отрисованные страницы больше не используются
+    await bump_competition_version(db, competition_id)
+    await db.commit() 
+    return player
+
+
+def apply_match_result(
+    competition: models.Competition,
+    player: models.Player,
+    mmr_delta: int,
+    is_winner: bool,
+    achievements_gained: Optional[List[str]] = None
+) -> None:
+    """Меняет MMR (с бонусами за достижения), победы/поражения и серию игрока, без запросов к БД."""
     # Начинаем с базового изменения
     total_mmr_change = mmr_delta
 
@@ -200,7 +340,7 @@ async def update_player_stats_after_match(
             # competition.achievements - это словарь {"НазваниеДостижения": bonus_mmr, ...}
             bonus_mmr = competition.achievements.get(ach_name, 0)
             total_mmr_change += bonus_mmr
-            logger.debug(f"Начислен бонус MMR за достижение '{ach_name}': +{bonus_mmr}. Итого: {total_mmr_change}")
+            logger.debug("Начислен бонус MMR за достижение '%s': +%s. Итого: %s", ach_name, bonus_mmr, total_mmr_change)
 
     # Применяем ИТОГОВОЕ изменение MMR к игроку
     player.mmr = max(player.mmr + total_mmr_change, 0)
@@ -220,22 +360,67 @@ async def update_player_stats_after_match(
         else:
             player.streak = -1 # Сброс серии побед
 
-    if achievements_gained:
-        # 1. Получаем текущий словарь достижений игрока
-        #    (Используем .copy() или dict() для создания копии, если он существует)
-        current_achievements = player.achievements.copy() if player.achievements else {}
-        
-        # 2. Обновляем копию словаря
-        for ach in achievements_gained:
-            if ach in current_achievements:
-                current_achievements[ach] += 1
-            else:
-                current_achievements[ach] = 1
-        
-        player.achievements = current_achievements
 
-    await db.commit() 
-    return player
+async def increment_player_achievements(
+    db: AsyncSession,
+    player_id: int,
+    competition_id: int,
+    achievements: List[str]
+) -> None:
+    """
+    Увеличивает счетчики достижений участника (upsert, без commit).
+    Одинаковые достижения в списке засчитываются несколько раз.
+    """
+    counts: Dict[str, int] = {}
+    for ach in achievements:
+        counts[ach] = counts.get(ach, 0) + 1
+
+    table = models.PlayerAchievement.__table__
+    for ach, increment in counts.items():
+        stmt = sqlite_insert(table).values(
+            player_id=player_id,
+            competition_id=competition_id,
+            achievement=ach,
+            count=increment
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.player_id, table.c.achievement],
+            set_={"count": table.c.count + stmt.excluded.count}
+        )
+        await db.execute(stmt)
+
+
+async def get_player_achievements(db: AsyncSession, player_id: int) -> Dict[str, int]:
+    """Получает счетчики достижений участника: название -> количество."""
+    result = await db.execute(
+        select(models.PlayerAchievement.achievement, models.PlayerAchievement.count)
+        .where(models.PlayerAchievement.player_id == player_id)
+    )
+    return {ach: count for ach, count in result.all()}
+
+
+async def get_achievement_leaderboard(
+    db: AsyncSession,
+    competition_id: int,
+    achievement: str,
+    limit: int = 10
+) -> List[Tuple[models.Player, int]]:
+    """
+    Получает топ участников по количеству конкретного достижения.
+    Использует индекс (competition_id, achievement, count DESC).
+    """
+    result = await db.execute(
+        select(models.Player, models.PlayerAchievement.count)
+        .join(models.PlayerAchievement, models.PlayerAchievement.player_id == models.Player.id)
+        .where(
+            models.PlayerAchievement.competition_id == competition_id,
+            models.PlayerAchievement.achievement == achievement
+        )
+        .order_by(models.PlayerAchievement.count.desc())
+        .limit(limit)
+        .options(selectinload(models.Player.user))
+    )
+    return [(player, count) for player, count in result.all()]
 
 
 async def create_match( 
@@ -246,38 +431,54 @@ async def create_match(
 ) -> models.Match:
     """
     Создает новый матч и записи участников.
+    Матч, участники, статистика игроков и версия соревнования записываются
+    одной транзакцией: топ не увидит матч наполовину, версия растет один раз.
     """
+    competition = await get_competition_by_id(db, competition_id)
+    if not competition:
+        raise ValueError(f"Соревнование с ID {competition_id} не найдено.")
+
+    # Игроки всех участников одним запросом. Обычно хендлер уже зарегистрировал
+    # их в соревновании; недостающие создаются до транзакции матча
+    user_ids = [p_data["user_id"] for p_data in participants]
+    result = await db.execute(
+        select(models.Player)
+        .where(
+            models.Player.competition_id == competition_id,
+            models.Player.user_id.in_(user_ids)
+        )
+    )
+    players = {player.user_id: player for player in result.scalars().all()}
+    for user_id in user_ids:
+        if user_id not in players:
+            players[user_id] = await get_or_create_player(db, competition_id, user_id, competition.start_mmr)
+
     match = models.Match(
         competition_id=competition_id,
         winner_id=winner_id,
         timestamp=int(time.time())
     )
     db.add(match)
-    await db.commit() # <-- ASYNC CHANGE
-    await db.refresh(match) # <-- ASYNC CHANGE
+    await db.flush()  # ID матча для участников
 
-    created_participants = []
     for p_data in participants:
-        mp = models.MatchParticipant(
+        achievements = p_data.get("achievements", [])
+        db.add(models.MatchParticipant(
             match_id=match.id,
             user_id=p_data["user_id"],
             mmr_change=p_data["mmr_change"],
             is_winner=p_data["is_winner"],
-            achievements_gained=p_data.get("achievements", [])
-        )
-        db.add(mp)
-        created_participants.append(mp)
+            achievements_gained=achievements
+        ))
 
         # --- Обновление статистики игрока ---
-        await update_player_stats_after_match( # <-- ASYNC CHANGE
-            db,
-            competition_id=competition_id,
-            user_id=p_data["user_id"],
-            mmr_delta=p_data["mmr_change"],
-            is_winner=p_data["is_winner"],
-            achievements_gained=p_data.get("achievements", [])
-        )
+        player = players[p_data["user_id"]]
+        apply_match_result(competition, player, p_data["mmr_change"], p_data["is_winner"], achievements)
+        if achievements:
+            await increment_player_achievements(db, player.id, competition_id, achievements)
 
+    # Топ изменился - старые отрисованные страницы больше не используются
+    await bump_competition_version(db, competition_id)
     await db.commit() 
     return match
 
@@ -295,6 +496,83 @@ async def get_competition_players(db: AsyncSession, competition_id: int) -> List
     return list(result.scalars().all()) 
 
 
+async def get_top_players(
+    db: AsyncSession,
+    competition_id: int,
+    limit: int,
+    offset: int = 0
+) -> List[models.Player]:
+    """Получает limit игроков соревнования по MMR, начиная с offset (с пользователями)."""
+    result = await db.execute(
+        select(models.Player)
+        .where(models.Player.competition_id == competition_id)
+        .order_by(models.Player.mmr.desc(), models.Player.id)
+        .offset(offset)
+        .limit(limit)
+        .options(selectinload(models.Player.user))
+    )
+    return list(result.scalars().all())
+
+
+async def get_leaderboard_page(
+    db: AsyncSession,
+    competition_id: int,
+    limit: int,
+    after: Optional[Tuple[int, int]] = None,
+    before: Optional[Tuple[int, int]] = None,
+    inclusive: bool = False
+) -> List[models.Player]:
+    """
+    Страница топа с keyset-пагинацией по (mmr DESC, id).
+    after/before - курсор (mmr, player_id): игроки строго после или строго до него
+    (inclusive=True - для after включая сам курсор).
+    Всегда возвращает игроков в порядке топа; стоимость не зависит от номера страницы.
+    Условие по курсору дублируется границей по mmr: по одному OR SQLite не
+    строит поиск по диапазону idx_players_leaderboard и читает топ с начала.
+    """
+    Player = models.Player
+    stmt = (
+        select(Player)
+        .where(Player.competition_id == competition_id)
+        .options(selectinload(Player.user))
+        .limit(limit)
+    )
+    if before is not None:
+        mmr, player_id = before
+        stmt = stmt.where(
+            Player.mmr >= mmr,
+            or_(Player.mmr > mmr, and_(Player.mmr == mmr, Player.id < player_id))
+        ).order_by(Player.mmr.asc(), Player.id.desc())
+        result = await db.execute(stmt)
+        return list(reversed(result.scalars().all()))
+
+    if after is not None:
+        mmr, player_id = after
+        id_condition = Player.id >= player_id if inclusive else Player.id > player_id
+        stmt = stmt.where(
+            Player.mmr <= mmr,
+            or_(Player.mmr < mmr, and_(Player.mmr == mmr, id_condition))
+        )
+    result = await db.execute(stmt.order_by(Player.mmr.desc(), Player.id.asc()))
+    return list(result.scalars().all())
+
+
+async def get_player_position(db: AsyncSession, player: models.Player) -> int:
+    """Место игрока в топе соревнования (порядок (mmr DESC, id), с 1)."""
+    Player = models.Player
+    result = await db.execute(
+        select(func.count(Player.id))
+        .where(
+            Player.competition_id == player.competition_id,
+            or_(
+                Player.mmr > player.mmr,
+                and_(Player.mmr == player.mmr, Player.id < player.id)
+            )
+        )
+    )
+    return result.scalar() + 1
+
+
 async def get_user_competitions(db: AsyncSession, user_id: int) -> List[models.Competition]: 
     """Получает список соревнований, в которых участвует пользователь."""
     result = await db.execute(
@@ -313,11 +591,11 @@ async def get_competition_by_chat_id(db: AsyncSession, chat_id: int) -> Optional
 
 
 async def get_user_by_username(db: AsyncSession, username: str) -> Optional[models.User]:
-    """Получает пользователя по его Telegram username."""
+    """Получает пользователя по его Telegram username (без учета регистра, по индексу)."""
     if not username:
         return None
     
-    result = await db.execute(select(models.User).where(models.User.username == username))
+    result = await db.execute(select(models.User).where(models.User.username_lower == username.lower()))
     return result.scalars().first()
 
 
@@ -325,20 +603,72 @@ async def get_user_by_username(db: AsyncSession, username: str) -> Optional[mode
 async def get_administered_competitions(db: AsyncSession, user_id: int) -> List[models.Competition]:
     """
     Получает список соревнований, где пользователь является администратором
-    (создатель или в списке admins).
+    (создатель тоже записан в competition_admins).
     """
-    logger.debug(f"Fetching administered competitions for user ID: {user_id}")
+    logger.debug("Fetching administered competitions for user ID: %s", user_id)
     try:
-        stmt = select(models.Competition).where(
-            models.Competition.creator_id == user_id
+        stmt = (
+            select(models.Competition)
+            .join(models.CompetitionAdmin, models.CompetitionAdmin.competition_id == models.Competition.id)
+            .where(models.CompetitionAdmin.user_id == user_id)
+            .order_by(models.Competition.id)
         )
         result = await db.execute(stmt)
         competitions = list(result.scalars().all())
-        logger.debug(f"Found {len(competitions)} administered competitions for user {user_id}")
+        logger.debug("Found %d administered competitions for user %s", len(competitions), user_id)
         return competitions
     except Exception as e:
-        logger.error(f"Error fetching administered competitions for user {user_id}: {e}", exc_info=True)
+        logger.error("Error fetching administered competitions for user %s: %s", user_id, e, exc_info=True)
         return [] 
+
+
+async def is_competition_admin(db: AsyncSession, competition_id: int, user_id: int) -> bool:
+    """
+    Проверяет, является ли пользователь (внутренний ID) админом соревнования.
+    Кэшируются только положительные ответы: админ, добавленный в другом
+    процессе (см. utils/sharding.py), сразу получает права.
+    """
+    key = (competition_id, user_id)
+    cached = _admin_check_cache.get(key)
+    if cached is not None:
+        return cached
+
+    result = await db.execute(
+        select(models.CompetitionAdmin.id).where(
+            models.CompetitionAdmin.user_id == user_id,
+            models.CompetitionAdmin.competition_id == competition_id
+        ).limit(1)
+    )
+    is_admin = result.scalar() is not None
+    if is_admin:
+        _admin_check_cache.set(key, True)
+    return is_admin
+
+
+async def get_competition_admin_ids(db: AsyncSession, competition_id: int) -> List[int]:
+    """Получает внутренние ID всех админов соревнования."""
+    result = await db.execute(
+        select(models.CompetitionAdmin.user_id)
+        .where(models.CompetitionAdmin.competition_id == competition_id)
+    )
+    return list(result.scalars().all())
+
+
+async def add_competition_admins(db: AsyncSession, competition_id: int, user_ids: List[int]) -> List[int]:
+    """
+    Добавляет админов в соревнование одной транзакцией.
+    Возвращает список реально добавленных ID (уже существующие пропускаются).
+    """
+    existing = set(await get_competition_admin_ids(db, competition_id))
+    to_add = [uid for uid in dict.fromkeys(user_ids) if uid not in existing]
+    if not to_add:
+        return []
+
+    db.add_all(models.CompetitionAdmin(competition_id=competition_id, user_id=uid) for uid in to_add)
+    await db.commit()
+    for uid in to_add:
+        _admin_check_cache.pop((competition_id, uid))
+    return to_add
     
 
     
@@ -372,3 +702,52 @@ async def get_played_competitions(db: AsyncSession, user_id: int) -> List[models
         return []
     
 
+
+# ---- ChatMember CRUD ----
+async def get_competition_chat_ids(db: AsyncSession) -> set:
+    """Получает множество ID чатов, к которым привязаны соревнования."""
+    result = await db.execute(select(distinct(models.Competition.chat_id)))
+    return set(result.scalars().all())
+
+
+async def upsert_chat_members(db: AsyncSession, rows: List[Dict[str, Any]]) -> None:
+    """
+    Добавляет или обновляет записи справочника участников чатов одной транзакцией.
+    Каждая запись: chat_id, user_id, username, username_lower, full_name, last_seen.
+    """
+    if not rows:
+        return
+    table = models.ChatMember.__table__
+    stmt = sqlite_insert(table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.chat_id, table.c.user_id],
+        set_={
+            "username": stmt.excluded.username,
+            "username_lower": stmt.excluded.username_lower,
+            "full_name": stmt.excluded.full_name,
+            "last_seen": stmt.excluded.last_seen,
+        }
+    )
+    await db.execute(stmt, rows)
+    await db.commit()
+
+
+async def get_chat_members_by_usernames(
+    db: AsyncSession,
+    chat_id: int,
+    usernames: List[str]
+) -> Dict[str, models.ChatMember]:
+    """
+    Ищет участников чата по списку username (без @, без учета регистра).
+    Возвращает словарь username в нижнем регистре -> ChatMember.
+    """
+    lowered = {u.lower() for u in usernames if u}
+    if not lowered:
+        return {}
+    result = await db.execute(
+        select(models.ChatMember).where(
+            models.ChatMember.chat_id == chat_id,
+            models.ChatMember.username_lower.in_(lowered)
+        )
+    )
+    return {member.username_lower: member for member in result.scalars().all()}
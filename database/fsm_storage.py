@@ -0,0 +1,273 @@
+# database/fsm_storage.py
+"""
+Хранилище FSM в базе данных бота (таблица fsm_states).
+
+В отличие от MemoryStorage, незавершенные сценарии (мастер создания
+соревнования) переживают перезапуск бота. Чтобы шаги мастера не ходили
+в БД на каждый get_data()/update_data():
+- чтения обслуживаются из LRU-кэша в памяти;
+- записи объединяются по ключу и сбрасываются пачкой (последняя побеждает);
+- брошенные сценарии удаляются по TTL (см. utils/fsm_sweeper.py).
+
+При шардировании (utils/sharding.py) все апдейты чата обрабатывает один
+процесс, поэтому кэш каждого процесса согласован с БД.
+"""
+import logging
+import os
+import time
+from typing import Any, Dict, Hashable, List, Mapping, NamedTuple, Optional
+
+from aiogram.exceptions import DataNotDictLikeError
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, StateType, StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from utils.batching import CoalescingBuffer
+from utils.cache import LRUCache
+from . import models, get_sessionmaker
+
+logger = logging.getLogger(__name__)
+
+
+class FSMSnapshot(NamedTuple):
+    """Состояние и данные FSM одного ключа."""
+    state: Optional[str]
+    data: Dict[str, Any]
+    updated_at: int
+    chat_id: Optional[int] = None
+    user_id: Optional[int] = None
+
+    @property
+    def is_empty(self) -> bool:
+        return self.state is None and not self.data
+
+
+_EMPTY = FSMSnapshot(state=None, data={}, updated_at=0)
+
+
+class ExpiredFSM(NamedTuple):
+    """Сценарий, удаленный по TTL: кому и о каком состоянии сообщить."""
+    chat_id: int
+    user_id: int
+    state: Optional[str]
+
+
+class FSMWriteBuffer(CoalescingBuffer):
+    """Буфер записей ключ -> FSMSnapshot. Пустые записи удаляются из таблицы."""
+
+    async def write(self, items: Dict[Hashable, Any]) -> None:
+        fsm_table = models.FSMRecord.__table__
+        rows = [
+            {
+                "key": key,
+                "chat_id": snap.chat_id,
+                "user_id": snap.user_id,
+                "state": snap.state,
+                "data": snap.data,
+                "updated_at": snap.updated_at,
+            }
+            for key, snap in items.items() if not snap.is_empty
+        ]
+        empty_keys = [key for key, snap in items.items() if snap.is_empty]
+
+        AsyncSessionLocal = get_sessionmaker()
+        async with AsyncSessionLocal() as db:
+            if rows:
+                stmt = sqlite_insert(fsm_table)
+                await db.execute(
+                    stmt.on_conflict_do_update(
+                        index_elements=[fsm_table.c.key],
+                        set_={
+                            "chat_id": stmt.excluded.chat_id,
+                            "user_id": stmt.excluded.user_id,
+                            "state": stmt.excluded.state,
+                            "data": stmt.excluded.data,
+                            "updated_at": stmt.excluded.updated_at,
+                        },
+                    ),
+                    rows,
+                )
+            if empty_keys:
+                await db.execute(delete(fsm_table).where(fsm_table.c.key.in_(empty_keys)))
+            await db.commit()
+        logger.debug(f"FSM: записано {len(rows)}, удалено {len(empty_keys)} состояний.")
+
+
+class DatabaseStorage(BaseStorage):
+    """FSM-хранилище в БД с кэшем чтения, объединением записей и TTL."""
+
+    def __init__(
+        self,
+        flush_interval: float = 1.0,
+        max_items: int = 200,
+        ttl: float = 86400,
+        cache_size: int = 10_000,
+    ):
+        self.key_builder = DefaultKeyBuilder(with_bot_id=True, with_destiny=True)
+        self.ttl = ttl
+        self._buffer = FSMWriteBuffer(flush_interval=flush_interval, max_items=max_items)
+        self._cache = LRUCache(maxsize=cache_size, name="fsm_state")
+
+    # --- Чтение и запись снимков ---
+
+    def _is_expired(self, snap: FSMSnapshot) -> bool:
+        return bool(self.ttl) and not snap.is_empty and snap.updated_at < time.time() - self.ttl
+
+    async def _load(self, key: str) -> FSMSnapshot:
+        # Несброшенная запись свежее кэша и БД
+        snap = self._buffer.get_pending(key)
+        if snap is None:
+            snap = self._cache.get(key)
+        if snap is None:
+            AsyncSessionLocal = get_sessionmaker()
+            async with AsyncSessionLocal() as db:
+                result = await db.execute(
+                    select(
+                        models.FSMRecord.state,
+                        models.FSMRecord.data,
+                        models.FSMRecord.updated_at,
+                        models.FSMRecord.chat_id,
+                        models.FSMRecord.user_id,
+                    )
+                    .where(models.FSMRecord.key == key)
+                )
+                row = result.first()
+            snap = FSMSnapshot(row.state, row.data or {}, row.updated_at, row.chat_id, row.user_id) if row else _EMPTY
+            self._cache.set(key, snap)
+        return _EMPTY if self._is_expired(snap) else snap
+
+    def _store(self, key: str, storage_key: StorageKey, state: Optional[str], data: Dict[str, Any]) -> None:
+        snap = FSMSnapshot(
+            state=state,
+            data=data,
+            updated_at=int(time.time()),
+            chat_id=storage_key.chat_id,
+            user_id=storage_key.user_id,
+        )
+        self._cache.set(key, snap)
+        self._buffer.put(key, snap)
+
+    # --- BaseStorage ---
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        storage_key = self.key_builder.build(key)
+        current = await self._load(storage_key)
+        new_state = state.state if isinstance(state, State) else state
+        self._store(storage_key, key, new_state, current.data)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return (await self._load(self.key_builder.build(key))).state
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        if not isinstance(data, dict):
+            raise DataNotDictLikeError(
+                f"Data must be a dict or dict-like object, got {type(data).__name__}"
+            )
+        storage_key = self.key_builder.build(key)
+        current = await self._load(storage_key)
+        self._store(storage_key, key, current.state, data.copy())
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return (await self._load(self.key_builder.build(key))).data.copy()
+
+    # --- Жизненный цикл ---
+
+    async def start(self) -> None:
+        """Запускает фоновый сброс записей."""
+        await self._buffer.start()
+
+    async def close(self) -> None:
+        await self._buffer.stop()
+
+    # --- Очистка брошенных сценариев (utils/fsm_sweeper.py) ---
+
+    async def expire_stale(self, older_than: float) -> List[ExpiredFSM]:
+        """
+        Удаляет состояния, не менявшиеся older_than секунд, и возвращает их владельцев.
+        Возвращаются только строки, удаленные этим вызовом (DELETE ... RETURNING):
+        при нескольких воркерах на одной БД пользователь получит одно уведомление,
+        а состояние, обновленное во время очистки, не считается удаленным.
+        """
+        # Сначала сбрасываем буфер, чтобы БД содержала последние изменения
+        await self._buffer.flush()
+        cutoff = int(time.time() - older_than)
+        fsm_table = models.FSMRecord.__table__
+        AsyncSessionLocal = get_sessionmaker()
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                delete(fsm_table)
+                .where(fsm_table.c.updated_at < cutoff)
+                .returning(fsm_table.c.key, fsm_table.c.chat_id, fsm_table.c.user_id, fsm_table.c.state)
+            )
+            rows = result.all()
+            await db.commit()
+        for row in rows:
+            self._cache.pop(row.key)
+        return [
+            ExpiredFSM(row.chat_id, row.user_id, row.state)
+            for row in rows if row.chat_id is not None and row.user_id is not None
+        ]
+
+    async def count_active(self) -> int:
+        """Количество пользователей внутри сценариев (state не None)."""
+        await self._buffer.flush()
+        AsyncSessionLocal = get_sessionmaker()
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                select(func.count()).select_from(models.FSMRecord).where(models.FSMRecord.state.is_not(None))
+            )
+            return result.scalar() or 0
+
+
+class TrackingMemoryStorage(MemoryStorage):
+    """
+    MemoryStorage, который помнит время последнего изменения каждого ключа,
+    чтобы брошенные сценарии можно было удалить по TTL (FSM_STORAGE=memory).
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._touched: Dict[StorageKey, float] = {}
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        await super().set_state(key, state)
+        self._touched[key] = time.time()
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        await super().set_data(key, data)
+        self._touched[key] = time.time()
+
+    async def expire_stale(self, older_than: float) -> List[ExpiredFSM]:
+        cutoff = time.time() - older_than
+        expired = []
+        for key in list(self.storage):
+            touched = self._touched.get(key)
+            record = self.storage[key]
+            if touched is None or touched < cutoff:
+                # get_state() каждого апдейта создает пустую запись - их удаляем молча
+                if record.state is not None or record.data:
+                    expired.append(ExpiredFSM(key.chat_id, key.user_id, record.state))
+                del self.storage[key]
+                self._touched.pop(key, None)
+        return expired
+
+    async def count_active(self) -> int:
+        return sum(1 for record in self.storage.values() if record.state is not None)
+
+
+_fsm_storage: Optional[DatabaseStorage] = None
+
+
+def get_fsm_storage() -> DatabaseStorage:
+    """Ленивая инициализация FSM-хранилища в БД."""
+    global _fsm_storage
+    if _fsm_storage is None:
+        _fsm_storage = DatabaseStorage(
+            flush_interval=int(os.getenv("FSM_FLUSH_INTERVAL_MS", "1000")) / 1000,
+            max_items=int(os.getenv("FSM_FLUSH_MAX_ITEMS", "200")),
+            ttl=float(os.getenv("FSM_TTL", "86400")),
+            cache_size=int(os.getenv("FSM_CACHE_SIZE", "10000")),
+        )
+    return _fsm_storage
@@ -0,0 +1,121 @@
+# database/migrations.py
+"""
+Миграции данных, выполняемые при старте бота после create_all.
+
+create_all создает только отсутствующие таблицы, поэтому перенос данных
+из старых колонок выполняется здесь. Все функции синхронные (вызываются
+через conn.run_sync) и идемпотентные: повторный запуск ничего не ломает.
+"""
+import logging
+
+from sqlalchemy import select, inspect, text
+from sqlalchemy.engine import Connection
+
+from . import models
+
+logger = logging.getLogger(__name__)
+
+
+def _add_missing_column(conn: Connection, table_name: str, column_name: str, column_type: str) -> bool:
+    """Добавляет колонку в существующую таблицу. Возвращает True, если колонка была добавлена."""
+    existing_columns = {col["name"] for col in inspect(conn).get_columns(table_name)}
+    if column_name in existing_columns:
+        return False
+    conn.execute(text(f"ALTER TABLE {table_name} ADD COLUMN {column_name} {column_type}"))
+    logger.info(f"Добавлена колонка {table_name}.{column_name}.")
+    return True
+
+
+def migrate_username_lower(conn: Connection) -> None:
+    """Добавляет users.username_lower, заполняет ее и создает индекс."""
+    users = models.User.__table__
+    if _add_missing_column(conn, "users", "username_lower", "VARCHAR"):
+        conn.execute(text("UPDATE users SET username_lower = lower(username)"))
+    for index in users.indexes:
+        index.create(conn, checkfirst=True)
+
+
+def migrate_competition_admins(conn: Connection) -> None:
+    """Переносит админов из JSON-колонки competitions.admins в таблицу competition_admins."""
+    competitions = models.Competition.__table__
+    admins_table = models.CompetitionAdmin.__table__
+
+    existing = {
+        (row.competition_id, row.user_id)
+        for row in conn.execute(select(admins_table.c.competition_id, admins_table.c.user_id))
+    }
+
+    rows_to_insert = []
+    for comp_id, creator_id, admins in conn.execute(
+        select(competitions.c.id, competitions.c.creator_id, competitions.c.admins)
+    ):
+        user_ids = {creator_id}
+        user_ids.update(int(a) for a in (admins or []))
+        for user_id in user_ids:
+            if (comp_id, user_id) not in existing:
+                rows_to_insert.append({"competition_id": comp_id, "user_id": user_id})
+
+    if rows_to_insert:
+        conn.execute(admins_table.insert(), rows_to_insert)
+        logger.info(f"Перенесено {len(rows_to_insert)} записей админов в competition_admins.")
+
+
+def migrate_player_achievements(conn: Connection) -> None:
+    """Переносит счетчики из JSON-колонки players.achievements в таблицу player_achievements."""
+    players = models.Player.__table__
+    achievements_table = models.PlayerAchievement.__table__
+
+    migrated_players = {
+        row.player_id for row in conn.execute(select(achievements_table.c.player_id).distinct())
+    }
+
+    rows_to_insert = []
+    for player_id, competition_id, achievements in conn.execute(
+        select(players.c.id, players.c.competition_id, players.c.achievements)
+    ):
+        if not achievements or player_id in migrated_players:
+            continue
+        for ach_name, count in achievements.items():
+            rows_to_insert.append({
+                "player_id": player_id,
+                "competition_id": competition_id,
+                "achievement": ach_name,
+                "count": int(count),
+            })
+
+    if rows_to_insert:
+        conn.execute(achievements_table.insert(), rows_to_insert)
+        logger.info(f"Перенесено {len(rows_to_insert)} счетчиков достижений в player_achievements.")
+
+
+def migrate_competition_leaderboard_message(conn: Connection) -> None:
+    """Добавляет competitions.leaderboard_message_id (живой закрепленный топ)."""
+    _add_missing_column(conn, "competitions", "leaderboard_message_id", "INTEGER")
+
+
+def migrate_competition_version(conn: Connection) -> None:
+    """Добавляет competitions.version (ключ кэша отрисованного топа)."""
+    _add_missing_column(conn, "competitions", "version", "INTEGER NOT NULL DEFAULT 0")
+
+
+def migrate_players_leaderboard_index(conn: Connection) -> None:
+    """Создает индекс (competition_id, mmr DESC, id) для постраничного топа."""
+    for index in models.Player.__table__.indexes:
+        index.create(conn, checkfirst=True)
+
+
+def migrate_fsm_states_owner(conn: Connection) -> None:
+    """Добавляет fsm_states.chat_id/user_id (кому сообщать об истекшем сценарии)."""
+    _add_missing_column(conn, "fsm_states", "chat_id", "INTEGER")
+    _add_missing_column(conn, "fsm_states", "user_id", "INTEGER")
+
+
+def run_migrations(conn: Connection) -> None:
+    """Выполняет все миграции по порядку."""
+    migrate_username_lower(conn)
+    migrate_competition_admins(conn)
+    migrate_player_achievements(conn)
+    migrate_competition_leaderboard_message(conn)
+    migrate_competition_version(conn)
+    migrate_players_leaderboard_index(conn)
+    migrate_fsm_states_owner(conn)
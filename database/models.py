@@ -15,9 +15,30 @@ class User(Base):
     id = Column(Integer, primary_key=True)  # Внутренний уникальный ID пользователя в системе
     user_id = Column(Integer, unique=True, nullable=False, index=True)  # Уникальный Telegram ID пользователя
     username = Column(String)  # Текущий @username пользователя в Telegram (может меняться)
+    username_lower = Column(String, index=True)  # username в нижнем регистре для поиска без учета регистра
     full_name = Column(String)  # Полное имя пользователя из Telegram
 
 
+class ChatMember(Base):
+    """
+    Модель справочника участников чатов.
+    Заполняется пассивно по сообщениям в чатах соревнований, чтобы находить
+    пользователей по @username без регистрации через /рег.
+    """
+    __tablename__ = 'chat_members'
+    __table_args__ = (
+        UniqueConstraint('chat_id', 'user_id', name='uq_chat_member'),  # Одна запись на пользователя в чате
+        Index('idx_chat_members_username', 'chat_id', 'username_lower'),  # Индекс для поиска по @username в чате
+    )
+    id = Column(Integer, primary_key=True)
+    chat_id = Column(Integer, nullable=False)  # ID чата Telegram
+    user_id = Column(Integer, nullable=False)  # Telegram ID пользователя
+    username = Column(String)  # @username на момент последнего сообщения
+    username_lower = Column(String)  # username в нижнем регистре
+    full_name = Column(String)  # Полное имя пользователя
+    last_seen = Column(Integer, nullable=False)  # Время последнего сообщения (Unix timestamp)
+
+
 class Competition(Base):
     """
     Модель соревнования.
@@ -36,16 +57,42 @@ class Competition(Base):
     range_rules = Column(JSON)
     ranks = Column(JSON)
     achievements = Column(JSON) 
+    # Устаревшее поле: список админов теперь хранится в таблице competition_admins.
+    # Оставлено только для миграции старых баз (см. database/migrations.py).
     admins = Column(JSON, default=list) # [user_id1, user_id2]
+    # ID закрепленного сообщения с живым топом в чате соревнования (None - выключено)
+    leaderboard_message_id = Column(Integer, nullable=True)
+    # Версия данных соревнования: растет при каждой записи матча или изменении настроек.
+    # Используется как ключ кэша отрисованного топа (utils/leaderboard.py).
+    version = Column(Integer, default=0, nullable=False)
 
     creator = relationship("User")
     players = relationship("Player", cascade="all, delete-orphan")
     matches = relationship("Match", cascade="all, delete-orphan")
+    admin_links = relationship("CompetitionAdmin", back_populates="competition", cascade="all, delete-orphan")
 
     __table_args__ = (
         Index('idx_competitions_chat', 'chat_id'),
     )
 
+class CompetitionAdmin(Base):
+    """
+    Модель администратора соревнования.
+    Связывает пользователя с соревнованием, которое он может администрировать.
+    """
+    __tablename__ = 'competition_admins'
+    __table_args__ = (
+        UniqueConstraint('competition_id', 'user_id', name='uq_competition_admin'),  # Один пользователь - одна запись на соревнование
+        Index('idx_competition_admins_user', 'user_id', 'competition_id'),  # Индекс для поиска соревнований админа
+    )
+    id = Column(Integer, primary_key=True)
+    competition_id = Column(Integer, ForeignKey('competitions.id'), nullable=False)  # ID соревнования (ссылка на Competition.id)
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=False)  # ID пользователя (ссылка на User.id)
+
+    user = relationship("User")  # Связь с объектом User
+    competition = relationship("Competition", back_populates="admin_links")  # Связь с объектом Competition
+
+
 class Player(Base):
     """
     Модель участника соревнования.
@@ -65,13 +112,62 @@ class Player(Base):
     wins = Column(Integer, default=0)  # Общее количество побед
     losses = Column(Integer, default=0)  # Общее количество поражений
     streak = Column(Integer, default=0)  # Текущая серия (положительная - победы, отрицательная - поражения)
-    # Полученные достижения и их количество для этого участника в этом соревновании.
+    # Устаревшее поле: счетчики достижений теперь хранятся в таблице player_achievements.
+    # Оставлено только для миграции старых баз (см. database/migrations.py).
     achievements = Column(JSON, default=dict)
 
     # Отношения SQLAlchemy
     user = relationship("User")  # Связь с объектом User
     competition = relationship("Competition")  # Связь с объектом Competition
 
+# Индекс для топа с keyset-пагинацией: WHERE competition_id = ? ORDER BY mmr DESC, id
+Index(
+    'idx_players_leaderboard',
+    Player.competition_id,
+    Player.mmr.desc(),
+    Player.id
+)
+
+class PlayerAchievement(Base):
+    """
+    Модель счетчика достижения участника.
+    Хранит, сколько раз участник получил конкретное достижение в соревновании.
+    """
+    __tablename__ = 'player_achievements'
+    __table_args__ = (
+        UniqueConstraint('player_id', 'achievement', name='uq_player_achievement'),  # Один счетчик на достижение участника
+    )
+    id = Column(Integer, primary_key=True)
+    player_id = Column(Integer, ForeignKey('players.id'), nullable=False)  # ID участника (ссылка на Player.id)
+    competition_id = Column(Integer, ForeignKey('competitions.id'), nullable=False)  # ID соревнования (денормализовано для топа)
+    achievement = Column(String, nullable=False)  # Название достижения
+    count = Column(Integer, default=0, nullable=False)  # Сколько раз получено
+
+    player = relationship("Player")  # Связь с объектом Player
+
+# Индекс для топа по достижению: WHERE competition_id = ? AND achievement = ? ORDER BY count DESC
+Index(
+    'idx_player_achievements_top',
+    PlayerAchievement.competition_id,
+    PlayerAchievement.achievement,
+    PlayerAchievement.count.desc()
+)
+
+
+class FSMRecord(Base):
+    """
+    Модель состояния FSM (например, мастера создания соревнования).
+    Одна запись на ключ хранилища: бот, чат, пользователь и destiny.
+    """
+    __tablename__ = 'fsm_states'
+    key = Column(String, primary_key=True)  # Ключ DefaultKeyBuilder, например fsm:<bot_id>:<chat_id>:<user_id>:default
+    chat_id = Column(Integer, nullable=True)  # Telegram ID чата (для уведомления об истекшем сценарии)
+    user_id = Column(Integer, nullable=True)  # Telegram ID пользователя
+    state = Column(String, nullable=True)  # Текущее состояние (None - вне сценария)
+    data = Column(JSON, default=dict)  # Данные сценария (state.get_data())
+    updated_at = Column(Integer, nullable=False, index=True)  # Время последнего изменения (Unix time)
+
+
 class Match(Base):
     """
     Модель матча.
@@ -0,0 +1,62 @@
+# database/profile_buffer.py
+"""
+Отложенная запись изменений профиля пользователя (username, full_name).
+
+Вместо commit на каждое изменение профиля внутри пользовательской команды
+изменения копятся в памяти (последняя запись по Telegram ID побеждает)
+и сбрасываются одним executemany в одной транзакции.
+"""
+import logging
+import os
+from typing import Any, Dict, Hashable, Optional
+
+from sqlalchemy import bindparam, update
+
+from utils.batching import CoalescingBuffer
+from . import models, get_sessionmaker
+
+logger = logging.getLogger(__name__)
+
+
+class ProfileWriteBuffer(CoalescingBuffer):
+    """Буфер обновлений профиля: Telegram ID -> (username, full_name)."""
+
+    def enqueue(self, telegram_id: int, username: str, full_name: str) -> None:
+        """Ставит обновление профиля в очередь."""
+        self.put(telegram_id, {
+            "tg_id": telegram_id,
+            "new_username": username,
+            "new_username_lower": username.lower() if username else None,
+            "new_full_name": full_name,
+        })
+
+    async def write(self, items: Dict[Hashable, Any]) -> None:
+        users = models.User.__table__
+        stmt = (
+            update(users)
+            .where(users.c.user_id == bindparam("tg_id"))
+            .values(
+                username=bindparam("new_username"),
+                username_lower=bindparam("new_username_lower"),
+                full_name=bindparam("new_full_name"),
+            )
+        )
+        AsyncSessionLocal = get_sessionmaker()
+        async with AsyncSessionLocal() as db:
+            await db.execute(stmt, list(items.values()))
+            await db.commit()
+        logger.debug(f"Записано {len(items)} обновлений профилей пользователей.")
+
+
+_profile_buffer: Optional[ProfileWriteBuffer] = None
+
+
+def get_profile_buffer() -> ProfileWriteBuffer:
+    """Ленивая инициализация буфера обновлений профилей."""
+    global _profile_buffer
+    if _profile_buffer is None:
+        _profile_buffer = ProfileWriteBuffer(
+            flush_interval=int(os.getenv("PROFILE_FLUSH_INTERVAL_MS", "1000")) / 1000,
+            max_items=int(os.getenv("PROFILE_FLUSH_MAX_ITEMS", "200")),
+        )
+    return _profile_buffer
@@ -0,0 +1,59 @@
+# filters/text_command.py
+"""
+Текстовые команды бота ("топ", "стат", "/исход", ...).
+
+Первое слово сообщения разбирается один раз (middlewares/command_router.py),
+а фильтр TextCommand сверяет его со словарем зарегистрированных команд.
+"""
+from typing import Dict, Optional
+
+from aiogram.filters import BaseFilter
+from aiogram.types import Message
+
+# Слово команды (в нижнем регистре) -> описание фильтра, который его объявил
+TEXT_COMMANDS: Dict[str, str] = {}
+
+
+def parse_text_command(text: Optional[str]) -> Optional[str]:
+    """
+    Возвращает первое слово сообщения в нижнем регистре.
+    Для слеш-команд отбрасывается упоминание бота: "/Исход@my_bot" -> "/исход".
+    """
+    if not text:
+        return None
+    parts = text.split(maxsplit=1)
+    if not parts:
+        return None
+    word = parts[0].lower()
+    if word.startswith("/"):
+        word = word.split("@", 1)[0]
+    return word
+
+
+def is_text_command(word: Optional[str]) -> bool:
+    """Зарегистрирована ли команда с таким первым словом."""
+    return word is not None and word in TEXT_COMMANDS
+
+
+class TextCommand(BaseFilter):
+    """
+    Фильтр по первому слову сообщения (без учета регистра).
+
+    Пример: @router.message(TextCommand("топ")) или TextCommand("/рег", "/reg").
+    Слова регистрируются глобально, чтобы middleware могло сразу отбрасывать
+    сообщения, которые не являются командами.
+    """
+
+    def __init__(self, *words: str):
+        self.words = frozenset(word.lower() for word in words)
+        for word in self.words:
+            TEXT_COMMANDS[word] = repr(self)
+
+    def __repr__(self) -> str:
+        return f"TextCommand({', '.join(sorted(self.words))})"
+
+    async def __call__(self, message: Message, text_command: Optional[str] = None) -> bool:
+        # text_command кладет CommandRouterMiddleware; без него разбираем сами
+        if text_command is None:
+            text_command = parse_text_command(message.text)
+        return text_command in self.words
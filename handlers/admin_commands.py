@@ -1,18 +1,32 @@
 # handlers/admin_commands.py
 """Глобальные админские команды, доступные в любом состоянии."""
+import html
 import logging
+import os
 from aiogram import Router, F
-from aiogram.types import Message
+from aiogram.types import CallbackQuery, Message
+from typing import Optional
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.filters import Command
-from database import get_sessionmaker, crud
+from database import crud
+from filters.text_command import TextCommand
+from utils.leaderboard import get_leaderboard_page, get_player_leaderboard_page
+from keyboards.leaderboard_keyboards import (
+    LEADERBOARD_PREFIX,
+    LEADERBOARD_ME_PREFIX,
+    get_leaderboard_keyboard
+)
+from utils.live_leaderboard import get_live_leaderboard
 from sqlalchemy.ext.asyncio import AsyncSession
 
 router = Router()
 logger = logging.getLogger(__name__)
 
+LEADERBOARD_MAX_PAGE_SIZE = int(os.getenv("LEADERBOARD_MAX_PAGE_SIZE", "50"))
+
 # --- Команда /add_admin ---
 @router.message(Command("add_admin"))
-async def cmd_add_admin(message: Message):
+async def cmd_add_admin(message: Message, db: AsyncSession, db_user: Optional[crud.UserIdentity]):
     """
     Команда для добавления администратора в соревнование.
     Использование: /add_admin <название_соревнования> @username [@username2 ...]
@@ -43,87 +57,77 @@ async def cmd_add_admin(message: Message):
         await message.reply("Не указаны корректные @username для добавления.")
         return
 
-    AsyncSessionLocal = get_sessionmaker()
-    async with AsyncSessionLocal() as db:
-        try:
-            # 1. Найти соревнование по названию
-            competition = await crud.get_competition_by_name(db, competition_name)
-            if not competition:
-                await message.reply(f"Соревнование с названием '{competition_name}' не найдено.")
-                return
-
-            # 2. Проверить, является ли отправитель админом этого соревнования
-            sender_db_user = await crud.get_user_by_id(db, message.from_user.id)
-            if not sender_db_user or not (
-                sender_db_user.id == competition.creator_id
-            ):
-                await message.reply("Вы не являетесь администратором этого соревнования.")
-                return
-
-            # 3. Найти пользователей по юзернеймам и добавить их в админы
-            errors = []
-            added_admins = []
-            admins_list = list(competition.admins or []) # <-- admins_list это питоновский список из JSON
-            
-            for username in usernames_to_add:
-                clean_username = username.lstrip('@')
-                if not clean_username:
-                    errors.append(f"Некорректный юзернейм: {username}")
-                    continue
-
-                db_user = await crud.get_user_by_username(db, clean_username)
-                if not db_user:
-                    errors.append(f"Пользователь @{clean_username} не найден в системе бота.")
-                    continue
-
-                if db_user.id == competition.creator_id:
-                    errors.append(f"Пользователь @{clean_username} уже является создателем соревнования.")
-                    continue
-
-                # --- ПРОБЛЕМА 1: СРАВНЕНИЕ INT С ЭЛЕМЕНТАМИ СПИСКА ---
-                # Если admins_list содержит строки, это не сработает.
-                # Но SQLAlchemy обычно десериализует JSON массив int корректно.
-                # Давайте добавим логирование для отладки.
-                logger.debug(f"Проверка админа: user_id={db_user.id}, admins_list={admins_list}, type(admins_list)={type(admins_list)}")
-                if db_user.id in admins_list:
-                    errors.append(f"Пользователь @{clean_username} уже является администратором.")
-                    continue
-                # ----------------------------------------------------
-
-                admins_list.append(db_user.id) # <-- Добавление int
-                added_admins.append(f"@{clean_username}")
-                logger.debug(f"Пользователь {db_user.id} добавлен во временный список админов.")
-
-            # 4. Обновить список админов в БД
-            logger.debug(f"Итоговый список админов для сохранения: {admins_list}")
-            if added_admins:
-                competition.admins = admins_list # <-- Присваиваем список int
-                logger.debug(f"competition.admins установлен в {competition.admins}")
-                await db.commit() # <-- Сохраняем
-                logger.debug("Commit выполнен успешно.")
-                await db.refresh(competition) # <-- Обновляем объект
-                logger.debug("Refresh выполнен успешно.")
-                success_msg = f"✅ Администраторы {', '.join(added_admins)} успешно добавлены в соревнование '{competition.name}'."
-                if errors:
-                    success_msg += f"\n⚠️ Ошибки:\n" + "\n".join(errors)
-                await message.reply(success_msg)
-            elif errors:
-                await message.reply("❌ Ошибки при добавлении администраторов:\n" + "\n".join(errors))
-            else:
-                await message.reply("Нечего добавлять. Все указанные пользователи уже являются админами или создателем.")
-
-        except Exception as e:
-            logger.error(f"Ошибка в /add_admin: {e}", exc_info=True)
-            await message.reply(f"❌ Произошла внутренняя ошибка: {e}")
+    try:
+        # 1. Найти соревнование по названию
+        competition = await crud.get_competition_by_name(db, competition_name)
+        if not competition:
+            await message.reply(f"Соревнование с названием '{competition_name}' не найдено.")
+            return
+
+        # 2. Проверить, является ли отправитель админом этого соревнования
+        if not db_user or not (
+            db_user.id == competition.creator_id
+        ):
+            await message.reply("Вы не являетесь администратором этого соревнования.")
+            return
+
+        # 3. Найти всех пользователей по юзернеймам одним запросом
+        errors = []
+        clean_usernames = []
+        for username in usernames_to_add:
+            clean_username = username.lstrip('@')
+            if not clean_username:
+                errors.append(f"Некорректный юзернейм: {username}")
+                continue
+            clean_usernames.append(clean_username)
+
+        users_by_username = await crud.get_users_by_usernames(db, clean_usernames)
+        current_admin_ids = set(await crud.get_competition_admin_ids(db, competition.id))
+
+        new_admins = {}  # internal user_id -> @username
+        for clean_username in clean_usernames:
+            target_user = users_by_username.get(clean_username.lower())
+            if not target_user:
+                errors.append(f"Пользователь @{clean_username} не найден в системе бота.")
+                continue
+
+            if target_user.id == competition.creator_id:
+                errors.append(f"Пользователь @{clean_username} уже является создателем соревнования.")
+                continue
+
+            if target_user.id in current_admin_ids:
+                errors.append(f"Пользователь @{clean_username} уже является администратором.")
+                continue
+
+            new_admins[target_user.id] = f"@{clean_username}"
+
+        # 4. Сохранить новых админов одной транзакцией
+        added_ids = await crud.add_competition_admins(db, competition.id, list(new_admins))
+        added_admins = [new_admins[uid] for uid in added_ids]
+        logger.debug(f"Добавлены админы {added_ids} в соревнование {competition.id}")
+
+        if added_admins:
+            success_msg = f"✅ Администраторы {', '.join(added_admins)} успешно добавлены в соревнование '{competition.name}'."
+            if errors:
+                success_msg += f"\n⚠️ Ошибки:\n" + "\n".join(errors)
+            await message.reply(success_msg)
+        elif errors:
+            await message.reply("❌ Ошибки при добавлении администраторов:\n" + "\n".join(errors))
+        else:
+            await message.reply("Нечего добавлять. Все указанные пользователи уже являются админами или создателем.")
+
+    except Exception as e:
+        logger.error(f"Ошибка в /add_admin: {e}", exc_info=True)
+        await message.reply(f"❌ Произошла внутренняя ошибка: {e}")
 
 
 # --- Команда /top ---
-@router.message(F.text.startswith("топ"))
-async def cmd_top(message: Message):
+@router.message(TextCommand("топ"))
+async def cmd_top(message: Message, db: AsyncSession):
     """
-    Команда для отображения топа игроков соревнования.
+    Команда для отображения топа игроков соревнования (постранично, с кнопками).
     Использование: топ <название_соревнования> [N]
-    Где N - количество игроков в топе (по умолчанию 30).
+    Где N - количество игроков на странице (по умолчанию 30, не больше LEADERBOARD_MAX_PAGE_SIZE).
     """
     logger.info(f"Received топ command from user {message.from_user.id}")
     
@@ -131,7 +135,7 @@ async def cmd_top(message: Message):
     if len(args) < 2:
         await message.reply(
             "Использование: `/top <название_соревнования> [N]`\n"
-            "Где `N` - количество игроков (по умолчанию 30).\n"
+            "Где `N` - количество игроков на странице (по умолчанию 30).\n"
             "Пример: `/top МойТурнир` или `/top МойТурнир 10`",
             parse_mode='Markdown'
         )
@@ -147,51 +151,228 @@ async def cmd_top(message: Message):
         except ValueError:
             await message.reply("Пожалуйста, укажите корректное число игроков для топа.")
             return
+    # Ограничение размера запроса; текст страницы дополнительно урезается
+    # до лимита Telegram в utils.leaderboard.render_leaderboard
+    top_n = min(top_n, LEADERBOARD_MAX_PAGE_SIZE)
+
+    try:
+        # 1. Найти соревнование по названию
+        competition = await crud.get_competition_by_name(db, competition_name)
+        if not competition:
+            await message.reply(f"Соревнование с названием '{html.escape(competition_name)}' не найдено.")
+            return
+
+        # 2. Получить первую страницу топа: из кэша, если с последнего матча она уже отрисована
+        page = await get_leaderboard_page(db, competition, top_n)
+
+        if not page:
+            await message.reply(f"В соревновании '{html.escape(competition.name)}' пока нет игроков.")
+            return
+
+        await message.reply(
+            page.text,
+            parse_mode='HTML',
+            reply_markup=get_leaderboard_keyboard(competition.id, top_n, page)
+        )
+
+    except Exception as e:
+        logger.error(f"Ошибка в /top: {e}", exc_info=True)
+        await message.reply(f"❌ Произошла внутренняя ошибка: {e}")
+
+
+async def _edit_leaderboard_page(callback: CallbackQuery, competition_id: int, size: int, page) -> None:
+    """Показывает страницу топа в сообщении с кнопками."""
+    if not page:
+        await callback.answer("Страница пуста.", show_alert=True)
+        return
+    try:
+        await callback.message.edit_text(
+            page.text,
+            parse_mode='HTML',
+            reply_markup=get_leaderboard_keyboard(competition_id, size, page)
+        )
+    except TelegramBadRequest as e:
+        # Повторное нажатие той же кнопки - текст не изменился
+        if "message is not modified" not in e.message:
+            raise
+    await callback.answer()
+
+
+@router.callback_query(F.data.startswith(LEADERBOARD_PREFIX))
+async def navigate_leaderboard(callback: CallbackQuery, db: AsyncSession):
+    """Переход на соседнюю страницу топа по курсору из callback_data."""
+    try:
+        _, comp_id, size, direction, mmr, player_id, rank = callback.data.split(":")
+        comp_id, size, rank = int(comp_id), int(size), int(rank)
+        # callback_data приходит от клиента: тот же предел, что и в cmd_top
+        size = min(max(size, 1), LEADERBOARD_MAX_PAGE_SIZE)
+        cursor = (int(mmr), int(player_id))
+    except ValueError:
+        await callback.answer("Ошибка навигации.", show_alert=True)
+        return
+
+    competition = await crud.get_competition_by_id(db, comp_id)
+    if not competition:
+        await callback.answer("Соревнование не найдено.", show_alert=True)
+        return
+
+    if direction == "p":
+        page = await get_leaderboard_page(db, competition, size, before=cursor, start_rank=rank)
+    else:
+        page = await get_leaderboard_page(db, competition, size, after=cursor, start_rank=rank)
+    await _edit_leaderboard_page(callback, comp_id, size, page)
+
+
+@router.callback_query(F.data.startswith(LEADERBOARD_ME_PREFIX))
+async def leaderboard_my_position(
+    callback: CallbackQuery,
+    db: AsyncSession,
+    db_user: Optional[crud.UserIdentity]
+):
+    """Переход на страницу топа с позицией нажавшего игрока."""
+    try:
+        _, comp_id, size = callback.data.split(":")
+        comp_id, size = int(comp_id), int(size)
+        # callback_data приходит от клиента: тот же предел, что и в cmd_top
+        size = min(max(size, 1), LEADERBOARD_MAX_PAGE_SIZE)
+    except ValueError:
+        await callback.answer("Ошибка навигации.", show_alert=True)
+        return
+
+    competition = await crud.get_competition_by_id(db, comp_id)
+    if not competition:
+        await callback.answer("Соревнование не найдено.", show_alert=True)
+        return
+
+    player = await crud.get_player(db, comp_id, db_user.id) if db_user else None
+    if not player:
+        await callback.answer("Вы не участвуете в этом соревновании.", show_alert=True)
+        return
+
+    page = await get_player_leaderboard_page(db, competition, size, player)
+    await _edit_leaderboard_page(callback, comp_id, size, page)
+
+
+# --- Команда "достижение" (топ по достижению) ---
+@router.message(TextCommand("достижение"))
+async def cmd_achievement_top(message: Message, db: AsyncSession):
+    """
+    Команда для отображения топа игроков по количеству достижения.
+    Использование: достижение <название_соревнования> <название_достижения>
+    """
+    logger.info(f"Received достижение command from user {message.from_user.id}")
+
+    args = message.text.split(maxsplit=2)
+    if len(args) < 3:
+        await message.reply(
+            "Использование: `достижение <название_соревнования> <название_достижения>`\n"
+            "Пример: `достижение МойТурнир Первая кровь`",
+            parse_mode='Markdown'
+        )
+        return
+
+    competition_name = args[1]
+    achievement_name = args[2].strip()
+
+    try:
+        competition = await crud.get_competition_by_name(db, competition_name)
+        if not competition:
+            await message.reply(f"Соревнование с названием '{html.escape(competition_name)}' не найдено.")
+            return
+
+        leaders = await crud.get_achievement_leaderboard(db, competition.id, achievement_name, limit=10)
+        if not leaders:
+            await message.reply(
+                f"В соревновании '{html.escape(competition.name)}' никто пока не получал "
+                f"достижение '{html.escape(achievement_name)}'."
+            )
+            return
+
+        report_lines = [
+            f"🎖 <b>Топ по достижению</b> '<i>{html.escape(achievement_name)}</i>' "
+            f"в соревновании '<i>{html.escape(competition.name)}</i>':"
+        ]
+        for i, (player, count) in enumerate(leaders, start=1):
+            user = player.user
+            username = f"@{user.username}" if user.username else f"ID:{user.user_id}"
+            report_lines.append(f"{i}. {html.escape(username)}: {count}")
+
+        await message.reply("\n".join(report_lines), parse_mode='HTML')
+
+    except Exception as e:
+        logger.error(f"Ошибка в команде достижение: {e}", exc_info=True)
+        await message.reply(f"❌ Произошла внутренняя ошибка: {e}")
+
+
+# --- Команда /live_top (живой закрепленный топ) ---
+@router.message(Command("live_top"))
+async def cmd_live_top(message: Message, db: AsyncSession, db_user: Optional[crud.UserIdentity]):
+    """
+    Включает или выключает живой топ: закрепленное сообщение в чате соревнования,
+    которое бот обновляет после матчей.
+    Использование: /live_top <название_соревнования>
+    """
+    logger.info(f"Received /live_top command from user {message.from_user.id}")
+
+    args = message.text.split(maxsplit=1)
+    if len(args) < 2:
+        await message.reply(
+            "Использование: `/live_top <название_соревнования>`\n"
+            "Повторный вызов выключает живой топ.",
+            parse_mode='Markdown'
+        )
+        return
+
+    competition_name = args[1].strip()
+    live_leaderboard = get_live_leaderboard()
+
+    try:
+        # 1. Найти соревнование по названию
+        competition = await crud.get_competition_by_name(db, competition_name)
+        if not competition:
+            await message.reply(f"Соревнование с названием '{html.escape(competition_name)}' не найдено.")
+            return
+
+        # 2. Только админы соревнования
+        if not db_user or not await crud.is_competition_admin(db, competition.id, db_user.id):
+            await message.reply("Вы не являетесь администратором этого соревнования.")
+            return
+
+        # 3. Уже включен - выключаем и открепляем
+        if competition.leaderboard_message_id:
+            old_message_id = competition.leaderboard_message_id
+            await crud.set_competition_leaderboard_message(db, competition.id, None)
+            live_leaderboard.forget(competition.id)
+            try:
+                await message.bot.unpin_chat_message(chat_id=competition.chat_id, message_id=old_message_id)
+            except TelegramBadRequest as e:
+                logger.warning(f"Не удалось открепить живой топ соревнования {competition.id}: {e}")
+            await message.reply(f"Живой топ соревнования '{html.escape(competition.name)}' выключен.")
+            return
+
+        # 4. Отправляем топ в чат соревнования и закрепляем
+        text = await live_leaderboard.render(db, competition)
+        try:
+            top_message = await message.bot.send_message(competition.chat_id, text, parse_mode='HTML')
+        except TelegramBadRequest as e:
+            await message.reply(f"❌ Не удалось отправить сообщение в чат соревнования: {html.escape(str(e))}")
+            return
+
+        await crud.set_competition_leaderboard_message(db, competition.id, top_message.message_id)
+        live_leaderboard.forget(competition.id)
 
-    AsyncSessionLocal = get_sessionmaker()
-    async with AsyncSessionLocal() as db:
+        reply_text = f"✅ Живой топ соревнования '{html.escape(competition.name)}' включен."
         try:
-            # 1. Найти соревнование по названию
-            competition = await crud.get_competition_by_name(db, competition_name)
-            if not competition:
-                await message.reply(f"Соревнование с названием '{competition_name}' не найдено.")
-                return
-
-            # 2. Получить список игроков, отсортированных по MMR (убывание)
-            players = await crud.get_competition_players(db, competition.id)
-            
-            # Ограничить количество
-            players_to_show = players[:top_n] if top_n > 0 else players
-
-            if not players_to_show:
-                await message.reply(f"В соревновании '{competition.name}' пока нет игроков.")
-                return
-
-            sorted_ranks_config = sorted(
-                competition.ranks or [], 
-                key=lambda r: r.get('mmr_threshold', 0), 
-                reverse=True
+            await message.bot.pin_chat_message(
+                chat_id=competition.chat_id,
+                message_id=top_message.message_id,
+                disable_notification=True
             )
+        except TelegramBadRequest as e:
+            logger.warning(f"Не удалось закрепить живой топ соревнования {competition.id}: {e}")
+            reply_text += "\n⚠️ Закрепить сообщение не удалось: дайте боту право закреплять сообщения."
+        await message.reply(reply_text)
 
-            def get_rank_name(mmr: int) -> str:
-                """Определяет название ранга по MMR."""
-                for rank_config in sorted_ranks_config:
-                    if mmr >= rank_config.get('mmr_threshold', 0):
-                        return rank_config.get('name', 'Без ранга')
-                return 'Без ранга'
-
-            report_lines = [f"🏆 <b>Топ {len(players_to_show)} игроков</b> в соревновании '<i>{competition.name}</i>':"]
-            for i, player in enumerate(players_to_show, start=1):
-                user = player.user
-                username = f"@{user.username}" if user.username else f"ID:{user.user_id}"
-                mmr = player.mmr
-                rank_name = get_rank_name(mmr)
-                player_id = player.id 
-                
-                report_lines.append(f"{i}. {username}, MMR: {mmr}, Ранг: {rank_name}, ID: {player_id}")
-
-            await message.reply("\n".join(report_lines), parse_mode='HTML')
-
-        except Exception as e:
-            logger.error(f"Ошибка в /top: {e}", exc_info=True)
-            await message.reply(f"❌ Произошла внутренняя ошибка: {e}")
+    except Exception as e:
+        logger.error(f"Ошибка в /live_top: {e}", exc_info=True)
+        await message.reply(f"❌ Произошла внутренняя ошибка: {html.escape(str(e))}")
@@ -22,9 +22,12 @@ async def cmd_start(message: Message):
     await message.answer(
         "<b>👋 Привет! У бота есть несколько команд:</b>\n\n"
         "/start - Основная команда бота, нажмите ее и вам будут доступны почти все функции бота.\n\n"
-        "<b>топ 'название соревнования' N</b>\n '/' использовать не нужно - команда, которая выводит топ игроков в соревновании по ммр. N - число, топ сколько хотите вывести, по умолчанию 30\n\n"
+        "<b>топ 'название соревнования' N</b>\n '/' использовать не нужно - команда, которая выводит топ игроков в соревновании по ммр с кнопками листания и перехода к своей позиции. N - число игроков на странице, по умолчанию 30\n\n"
         "<b>стат 'название соревнования'</b>\n '/' использовать не нужно - показывает вашу статистику по соревнованию, также доступно через кнопки в режиме участника.\n\n"
+        "<b>достижение 'название соревнования' 'название достижения'</b>\n '/' использовать не нужно - показывает топ игроков по количеству полученного достижения.\n\n"
         "<b>/add_admin - команда для добавления админа в соревнование.</b>\n Админ может записывать исходы боев с помощью команды /исход, по умолчанию может только создатель.\n\n"
+        "<b>@имя_бота 'название соревнования'</b> - inline-режим в любом чате: ваша статистика и топ-10 соревнования.\n\n"
+        "<b>/live_top 'название соревнования'</b> - включить (или выключить повторным вызовом) закрепленный топ в чате соревнования, который бот сам обновляет после матчей. Только для админов.\n\n"
         "<b>/исход или /Исход - команда для записи итога одного боя.</b>\nДоступно только админам соревнования. Для подробной инструкции по использованию просто напишите /исход в чате с совернованием (в чате с ботом не срабоатет)"
         )
 
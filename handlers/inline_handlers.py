@@ -0,0 +1,88 @@
+# handlers/inline_handlers.py
+"""
+Inline-режим: "@bot <название соревнования>" в любом чате.
+Возвращает карточку статистики пользователя и топ-10 соревнования.
+"""
+import logging
+import os
+from typing import Optional
+
+from aiogram import Router
+from aiogram.types import InlineQuery, InlineQueryResultArticle, InputTextMessageContent
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import crud
+from handlers.player_handlers import build_player_stats_text
+from utils.cache import LRUCache
+from utils.leaderboard import get_leaderboard_page
+
+router = Router()
+logger = logging.getLogger(__name__)
+
+INLINE_TOP_SIZE = 10
+# Сколько секунд клиенты Telegram кэшируют ответ на одинаковый запрос
+INLINE_CACHE_TIME = int(os.getenv("INLINE_CACHE_TIME", "60"))
+
+# Карточки статистики: (competition_id, version, player_id) -> текст
+_stats_card_cache = LRUCache(maxsize=10_000, ttl=600, name="stats_card")
+
+
+async def get_stats_card(db: AsyncSession, competition, player, db_user: crud.UserIdentity) -> str:
+    """Текст статистики игрока; пересчитывается только после новых матчей соревнования."""
+    key = (competition.id, competition.version, player.id)
+    text = _stats_card_cache.get(key)
+    if text is None:
+        # Карточку отправляют в чужие чаты, поэтому подписываем, чья это статистика
+        owner = f"@{db_user.username}" if db_user.username else (db_user.full_name or f"ID:{db_user.user_id}")
+        text = f"👤 {owner}\n" + await build_player_stats_text(db, competition, player)
+        _stats_card_cache.set(key, text)
+    return text
+
+
+@router.inline_query()
+async def inline_competition_query(
+    inline_query: InlineQuery,
+    db: AsyncSession,
+    db_user: Optional[crud.UserIdentity]
+):
+    """Ответ на inline-запрос с названием соревнования."""
+    competition_name = inline_query.query.strip()
+    if not competition_name:
+        await inline_query.answer([], cache_time=INLINE_CACHE_TIME, is_personal=False)
+        return
+
+    competition = await crud.get_competition_by_name(db, competition_name)
+    if not competition:
+        await inline_query.answer([], cache_time=INLINE_CACHE_TIME, is_personal=False)
+        return
+
+    results = []
+
+    # 1. Карточка статистики (только для участников соревнования)
+    player = await crud.get_player(db, competition.id, db_user.id) if db_user else None
+    if player:
+        results.append(InlineQueryResultArticle(
+            id=f"stats:{competition.id}:{competition.version}:{player.id}",
+            title=f"Моя статистика: {competition.name}",
+            description=f"MMR: {player.mmr}, серия: {player.streak}",
+            input_message_content=InputTextMessageContent(
+                message_text=await get_stats_card(db, competition, player, db_user),
+                parse_mode='HTML'
+            )
+        ))
+
+    # 2. Топ-10 (та же кэшированная страница, что и у команды 'топ')
+    page = await get_leaderboard_page(db, competition, INLINE_TOP_SIZE)
+    if page:
+        results.append(InlineQueryResultArticle(
+            id=f"top:{competition.id}:{competition.version}",
+            title=f"Топ {INLINE_TOP_SIZE}: {competition.name}",
+            description="Лучшие игроки соревнования по MMR",
+            input_message_content=InputTextMessageContent(
+                message_text=page.text,
+                parse_mode='HTML'
+            )
+        ))
+
+    # Карточка у каждого своя, поэтому ответ кэшируется клиентами по пользователю
+    await inline_query.answer(results, cache_time=INLINE_CACHE_TIME, is_personal=True)
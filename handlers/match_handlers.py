@@ -3,13 +3,15 @@
 Хендлеры для управления матчами/исходами в чатах соревнований.
 """
 import logging
-from typing import List, Tuple
+from typing import Dict, List, Optional, Tuple
 
 from aiogram import Router, F
-from aiogram.types import Message
-from aiogram.exceptions import TelegramAPIError
+from aiogram.types import Message, MessageEntity, User
 
-from database import get_sessionmaker, crud
+from database import crud
+from database.chat_directory import get_chat_directory
+from filters.text_command import TextCommand
+from utils.live_leaderboard import get_live_leaderboard
 from sqlalchemy.ext.asyncio import AsyncSession
 from utils.mmr_calculator import (
     calculate_mmr_change_by_formula,
@@ -19,15 +21,53 @@ from utils.mmr_calculator import (
 router = Router()
 logger = logging.getLogger(__name__)
 
+# Префикс токена участника, упомянутого через text_mention (без username): "@#<telegram_id>"
+ID_MENTION_PREFIX = "@#"
 
 
-def parse_match_command(text: str) -> Tuple[str, List[Tuple[str, List[str]]], str]:
+def apply_text_mentions(text: str, entities: Optional[List[MessageEntity]]) -> str:
+    """
+    Заменяет в тексте упоминания text_mention (пользователи без username)
+    на токены вида "@#<telegram_id>", чтобы парсер мог работать с ними как с @username.
+
+    Смещения сущностей Telegram считаются в UTF-16, поэтому замена идет по UTF-16 байтам.
+    """
+    mentions = [e for e in (entities or []) if e.type == "text_mention" and e.user]
+    if not mentions:
+        return text
+
+    encoded = text.encode("utf-16-le")
+    # Идем с конца, чтобы замены не сдвигали смещения еще не обработанных сущностей
+    for entity in sorted(mentions, key=lambda e: e.offset, reverse=True):
+        start = entity.offset * 2
+        end = (entity.offset + entity.length) * 2
+        token = f"{ID_MENTION_PREFIX}{entity.user.id}".encode("utf-16-le")
+        encoded = encoded[:start] + token + encoded[end:]
+    return encoded.decode("utf-16-le")
+
+
+def get_text_mention_users(entities: Optional[List[MessageEntity]]) -> Dict[int, User]:
+    """Возвращает пользователей из сущностей text_mention: telegram_id -> User."""
+    return {
+        e.user.id: e.user
+        for e in (entities or [])
+        if e.type == "text_mention" and e.user
+    }
+
+
+def parse_match_command(
+    text: str,
+    entities: Optional[List[MessageEntity]] = None
+) -> Tuple[str, List[Tuple[str, List[str]]], str]:
     """
     Парсит команду /Исход.
 
     Ожидаемый формат:
     /Исход НазваниеСоревнования @user1: ach1, ach2, @user2: ach3, @winner
 
+    Участники без username, упомянутые через text_mention (entities сообщения),
+    возвращаются как токены "@#<telegram_id>".
+
     Возвращает:
         Tuple[
             str,                         # Название соревнования
@@ -35,6 +75,8 @@ def parse_match_command(text: str) -> Tuple[str, List[Tuple[str, List[str]]], st
             str                          # Юзернейм победителя
         ]
     """
+    text = apply_text_mentions(text, entities)
+
     # Убираем команду и возможные пробелы в начале
     command_part = "/Исход"
     if text.lower().startswith(command_part.lower()):
@@ -56,7 +98,7 @@ def parse_match_command(text: str) -> Tuple[str, List[Tuple[str, List[str]]], st
     winner_part = parts[-1]
     winner_username = winner_part.strip()
     if not winner_username.startswith('@'):
-         raise ValueError("Победитель должен быть указан как @username.")
+         raise ValueError("Победитель должен быть указан как @username или упоминанием.")
 
     # Остальные элементы - это название соревнования и участники
     pre_winner_parts = parts[:-1]
@@ -125,277 +167,307 @@ def parse_match_command(text: str) -> Tuple[str, List[Tuple[str, List[str]]], st
 
 # --- Основной хендлер ---
 
-@router.message(F.text.lower().startswith("/исход"), F.chat.type.in_({"group", "supergroup"}))
-async def handle_match_outcome(message: Message, bot):
+@router.message(TextCommand("/исход"), F.chat.type.in_({"group", "supergroup"}))
+async def handle_match_outcome(message: Message, db: AsyncSession, db_user: Optional[crud.UserIdentity]):
     """
     Обрабатывает команду /Исход в чате соревнования.
     Формат: /Исход НазваниеСоревнования, @user1: достижение, достижение, @user2: достижение, @winner
     """
-    logger.info(f"Получена команда /Исход от пользователя {message.from_user.id} в чате {message.chat.id}")
+    logger.info("Получена команда /Исход от пользователя %s в чате %s", message.from_user.id, message.chat.id)
 
     # 1. Парсинг команды
     try:
-        competition_name, participants_data, winner_username = parse_match_command(message.text)
-        logger.debug(f"Распарсенные данные: соревнование={competition_name}, участники={participants_data}, победитель={winner_username}")
+        competition_name, participants_data, winner_username = parse_match_command(message.text, message.entities)
+        logger.debug("Распарсенные данные: соревнование=%s, участники=%s, победитель=%s", competition_name, participants_data, winner_username)
     except ValueError as e:
         await message.reply(f"❌ Ошибка в формате команды: {e}\nИспользуйте: `/Исход НазваниеСоревнования, @user1: достижение, достижение, @user2: достижение, @winner`", parse_mode='Markdown')
         return
 
-    # Используем асинхронный контекстный менеджер для сессии
-    AsyncSessionLocal = get_sessionmaker()
-    async with AsyncSessionLocal() as db:
-        try:
-            # 2. Проверка, есть ли соревнование с таким названием в этом чате
-            competition = await crud.get_competition_by_name(db, competition_name)
-            if not competition:
-                await message.reply(
-                    f"❌ Соревнование с названием '{competition_name}' не найдено.",
-                    disable_notification=True
-                )
-                return
-
-            if competition.chat_id != message.chat.id:
-                 await message.reply(
-                     f"❌ Соревнование '{competition_name}' не привязано к этому чату (ID: {message.chat.id}).",
-                     disable_notification=True
-                 )
-                 return
-
-            # 3. Проверка, является ли отправитель админом соревнования или бота в чате
-            sender_telegram_id = message.from_user.id
-            sender_db_user = await crud.get_user_by_id(db, sender_telegram_id)
-
-            if not sender_db_user:
-                 # Создаем отправителя в БД, если его там нет
-                 sender_full_name = f"{message.from_user.first_name or ''} {message.from_user.last_name or ''}".strip()
-                 sender_db_user = await crud.get_or_create_user(db, sender_telegram_id, message.from_user.username or "", sender_full_name)
-                 logger.info(f"Пользователь {sender_telegram_id} автоматически создан в БД.")
-
-            sender_is_competition_admin = (
-                sender_db_user.id == competition.creator_id or
-                sender_db_user.id in competition.admins
+    # Сессия БД открыта middleware на время апдейта (аргумент db)
+    try:
+        # 2. Проверка, есть ли соревнование с таким названием в этом чате
+        competition = await crud.get_competition_by_name(db, competition_name)
+        if not competition:
+            await message.reply(
+                f"❌ Соревнование с названием '{competition_name}' не найдено.",
+                disable_notification=True
             )
+            return
 
-            if not (sender_is_competition_admin):
-                await message.reply(
-                    "❌ Вы не являетесь администратором этого соревнования.",
-                    disable_notification=True
-                )
-                return
+        if competition.chat_id != message.chat.id:
+             await message.reply(
+                 f"❌ Соревнование '{competition_name}' не привязано к этому чату (ID: {message.chat.id}).",
+                 disable_notification=True
+             )
+             return
 
-            # 4. Сбор и обработка данных об участниках
-            # Сначала соберем все уникальные юзернеймы
-            all_usernames = {username for username, _ in participants_data}
-            all_usernames.add(winner_username) # Убедимся, что победитель тоже учтен
+        # 3. Проверка, является ли отправитель админом соревнования или бота в чате
+        sender_telegram_id = message.from_user.id
+        sender_db_user = db_user # Определен middleware через кэш
 
-            # Создадим словарь для хранения внутренних ID пользователей
-            user_internal_ids = {} # username -> internal_id
-            errors = []
+        if not sender_db_user:
+             # Создаем отправителя в БД, если его там нет
+             sender_full_name = f"{message.from_user.first_name or ''} {message.from_user.last_name or ''}".strip()
+             sender_db_user = await crud.get_or_create_user(db, sender_telegram_id, message.from_user.username or "", sender_full_name)
+             logger.info("Пользователь %s автоматически создан в БД.", sender_telegram_id)
 
-            for username in all_usernames:
-                if not username.startswith('@'):
-                    errors.append(f"Неверный формат юзернейма: {username}")
+        sender_is_competition_admin = await crud.is_competition_admin(db, competition.id, sender_db_user.id)
+
+        if not (sender_is_competition_admin):
+            await message.reply(
+                "❌ Вы не являетесь администратором этого соревнования.",
+                disable_notification=True
+            )
+            return
+
+        # 4. Сбор и обработка данных об участниках
+        # Сначала соберем все уникальные токены участников
+        all_usernames = {username for username, _ in participants_data}
+        all_usernames.add(winner_username) # Убедимся, что победитель тоже учтен
+
+        # Создадим словарь для хранения внутренних ID пользователей
+        user_internal_ids = {} # username -> internal_id
+        errors = []
+
+        # Упоминания без username (text_mention) уже содержат Telegram ID и данные пользователя
+        mention_users = get_text_mention_users(message.entities)
+        usernames_to_resolve = []
+        for username in all_usernames:
+            if username.startswith(ID_MENTION_PREFIX):
+                id_part = username[len(ID_MENTION_PREFIX):]
+                mention_user = mention_users.get(int(id_part)) if id_part.isdigit() else None
+                if not mention_user:
+                    # Токен набран вручную, а не получен из упоминания
+                    errors.append(f"Неверный формат участника: {username}")
                     continue
+                telegram_id = mention_user.id
+                participant_user = await crud.get_or_create_user(
+                    db,
+                    telegram_id,
+                    mention_user.username or "",
+                    mention_user.full_name
+                )
+                user_internal_ids[username] = participant_user.id
+                continue
+
+            clean_username = username.lstrip('@')
+            if not clean_username:
+                errors.append(f"Пустой юзернейм: {username}")
+                continue
+            usernames_to_resolve.append(username)
+
+        # Все @username разрешаем одним запросом по индексу
+        users_by_username = await crud.get_users_by_usernames(
+            db, [u.lstrip('@') for u in usernames_to_resolve]
+        )
+        unresolved = []
+        for username in usernames_to_resolve:
+            participant_user = users_by_username.get(username.lstrip('@').lower())
+            if participant_user:
+                user_internal_ids[username] = participant_user.id
+            else:
+                unresolved.append(username)
 
+        # Не прошедших /рег ищем в справочнике участников этого чата
+        if unresolved:
+            chat_directory = get_chat_directory()
+            chat_members = await crud.get_chat_members_by_usernames(
+                db, message.chat.id, [u.lstrip('@') for u in unresolved]
+            )
+            for username in unresolved:
                 clean_username = username.lstrip('@')
-                if not clean_username:
-                    errors.append(f"Пустой юзернейм: {username}")
+                member = chat_directory.find_pending(message.chat.id, clean_username)
+                if member is None:
+                    db_member = chat_members.get(clean_username.lower())
+                    if db_member:
+                        member = {
+                            "user_id": db_member.user_id,
+                            "username": db_member.username,
+                            "full_name": db_member.full_name,
+                        }
+                if member is None:
+                    errors.append(f"Пользователь {username} не зарегестрирован в боте и не писал в этот чат")
                     continue
+                participant_user = await crud.get_or_create_user(
+                    db, member["user_id"], member["username"] or "", member["full_name"] or ""
+                )
+                user_internal_ids[username] = participant_user.id
+                logger.info("Пользователь %s (ID: %s) добавлен в БД из справочника чата.", username, member['user_id'])
 
-                # Пытаемся найти пользователя в БД
-                db_user = await crud.get_user_by_username(db, clean_username)
-                
-                if db_user:
-                    # Пользователь найден в БД
-                    user_internal_ids[username] = db_user.id
-                else:
-                    # Пользователь не найден в БД, пытаемся получить его из чата
-                    try: # Это не будет работать, нейронка бреда написала, но ошибки он все равно выдаст так что пофик
-                        # Получаем информацию о пользователе из чата
-                        chat_member = await bot.get_chat_member(message.chat.id, clean_username)
-                        chat_user = chat_member.user
-                        
-                        # Создаем пользователя в БД
-                        full_name = f"{chat_user.first_name or ''} {chat_user.last_name or ''}".strip()
-                        new_db_user = await crud.get_or_create_user(db, chat_user.id, chat_user.username or "", full_name)
-                        user_internal_ids[username] = new_db_user.id
-                        logger.info(f"Пользователь {username} (ID: {chat_user.id}) автоматически добавлен в БД.")
-                        
-                    except TelegramAPIError as e:
-                        # Не удалось получить пользователя из чата
-                        logger.warning(f"Не удалось получить пользователя {username} из чата {message.chat.id}: {e}")
-                        errors.append(f"Пользователь {username} не зарегестрирован в боте")
-                    except Exception as e:
-                        logger.error(f"Ошибка при добавлении пользователя {username} в БД: {e}")
-                        errors.append(f"Ошибка при обработке пользователя {username}.")
-
-            if errors:
-                error_msg = "\n".join(errors)
-                await message.reply(f"❌ Ошибки при обработке участников:\n{error_msg}", disable_notification=True)
-                return
-
-            # 5. Регистрация участников в соревновании (если нужно)
-            player_objs_map = {} # internal_user_id -> models.Player obj
-            for username, internal_id in user_internal_ids.items():
-                try:
-                    player_obj = await crud.get_or_create_player(db, competition.id, internal_id, competition.start_mmr)
-                    player_objs_map[internal_id] = player_obj
-                except Exception as e:
-                     logger.error(f"Ошибка при регистрации игрока {username} (ID: {internal_id}) в соревновании {competition.id}: {e}")
-                     errors.append(f"Ошибка при регистрации игрока {username}.")
+        if errors:
+            error_msg = "\n".join(errors)
+            await message.reply(f"❌ Ошибки при обработке участников:\n{error_msg}", disable_notification=True)
+            return
+
+        # 5. Регистрация участников в соревновании (если нужно)
+        player_objs_map = {} # internal_user_id -> models.Player obj
+        for username, internal_id in user_internal_ids.items():
+            try:
+                player_obj = await crud.get_or_create_player(db, competition.id, internal_id, competition.start_mmr)
+                player_objs_map[internal_id] = player_obj
+            except Exception as e:
+                 logger.error("Ошибка при регистрации игрока %s (ID: %s) в соревновании %s: %s", username, internal_id, competition.id, e)
+                 errors.append(f"Ошибка при регистрации игрока {username}.")
             
-            if errors:
-                error_msg = "\n".join(errors)
-                await message.reply(f"❌ Ошибки при регистрации участников:\n{error_msg}", disable_notification=True)
-                return
+        if errors:
+            error_msg = "\n".join(errors)
+            await message.reply(f"❌ Ошибки при регистрации участников:\n{error_msg}", disable_notification=True)
+            return
 
-            # 6. Определение внутреннего ID победителя
-            winner_internal_id = user_internal_ids.get(winner_username)
-            if not winner_internal_id:
-                # Это маловероятно, если проверка выше прошла, но на всякий случай
-                await message.reply(f"❌ Критическая ошибка: Победитель {winner_username} не найден после обработки.", disable_notification=True)
-                return
+        # 6. Определение внутреннего ID победителя
+        winner_internal_id = user_internal_ids.get(winner_username)
+        if not winner_internal_id:
+            # Это маловероятно, если проверка выше прошла, но на всякий случай
+            await message.reply(f"❌ Критическая ошибка: Победитель {winner_username} не найден после обработки.", disable_notification=True)
+            return
 
-            # 7. Расчет изменений MMR 
-            mmr_changes = {} # internal_id -> mmr_delta
-            errors_during_mmr_calc = [] # Ошибки, возникшие при расчете MMR
+        # 7. Расчет изменений MMR 
+        mmr_changes = {} # internal_id -> mmr_delta
+        errors_during_mmr_calc = [] # Ошибки, возникшие при расчете MMR
 
 
-            player_objs_for_mmr_calc = player_objs_map
+        player_objs_for_mmr_calc = player_objs_map
                 
 
-            # Для каждого участника рассчитываем его изменение MMR относительно каждого оппонента
-            for internal_id, player_obj in player_objs_for_mmr_calc.items():
-                player_current_mmr = player_obj.mmr
-                is_player_winner = (internal_id == winner_internal_id)
+        # Для каждого участника рассчитываем его изменение MMR относительно каждого оппонента
+        for internal_id, player_obj in player_objs_for_mmr_calc.items():
+            player_current_mmr = player_obj.mmr
+            is_player_winner = (internal_id == winner_internal_id)
 
-                # Собираем MMR всех оппонентов (всех других участников)
-                opponent_mmrs = [
-                    opp_player.mmr for opp_id, opp_player in player_objs_for_mmr_calc.items()
-                    if opp_id != internal_id
-                ]
+            # Собираем MMR всех оппонентов (всех других участников)
+            opponent_mmrs = [
+                opp_player.mmr for opp_id, opp_player in player_objs_for_mmr_calc.items()
+                if opp_id != internal_id
+            ]
 
-                if not opponent_mmrs:
-                    # Теоретически возможно только если участник один, что странно для матча.
-                    mmr_changes[internal_id] = 0
-                    continue
+            if not opponent_mmrs:
+                # Теоретически возможно только если участник один, что странно для матча.
+                mmr_changes[internal_id] = 0
+                continue
 
-                # --- Расчет изменения MMR ---
-                try:
-                    if competition.use_formula and competition.formula:
-                        # --- ВАРИАНТ 1: Использование формулы ---
-                        # Для простоты, сравниваем со средним MMR оппонентов.
-                        # Более сложные сценарии (1v1, FFA с весами) требуют усложнения логики.
-                        avg_opponent_mmr = sum(opponent_mmrs) / len(opponent_mmrs)
+            # --- Расчет изменения MMR ---
+            try:
+                if competition.use_formula and competition.formula:
+                    # --- ВАРИАНТ 1: Использование формулы ---
+                    # Для простоты, сравниваем со средним MMR оппонентов.
+                    # Более сложные сценарии (1v1, FFA с весами) требуют усложнения логики.
+                    avg_opponent_mmr = sum(opponent_mmrs) / len(opponent_mmrs)
                         
-                        # Рассчитываем изменение по формуле.
-                        # Предполагаем, что формула дает абсолютное значение изменения за победу.
-                        mmr_delta_abs = calculate_mmr_change_by_formula(competition, player_current_mmr, int(avg_opponent_mmr))
+                    # Рассчитываем изменение по формуле.
+                    # Предполагаем, что формула дает абсолютное значение изменения за победу.
+                    mmr_delta_abs = calculate_mmr_change_by_formula(competition, player_current_mmr, int(avg_opponent_mmr))
                         
-                        # Применяем знак в зависимости от результата.
-                        final_mmr_change = mmr_delta_abs if is_player_winner else -mmr_delta_abs
+                    # Применяем знак в зависимости от результата.
+                    final_mmr_change = mmr_delta_abs if is_player_winner else -mmr_delta_abs
                         
-                    else:
-                        # --- ВАРИАНТ 2: Использование диапазонов ---
-                        # Рассчитываем изменение для каждого матча "этот игрок vs один оппонент"
-                        # и усредняем результат.
-                        total_change = 0
-                        num_matches = len(opponent_mmrs)
+                else:
+                    # --- ВАРИАНТ 2: Использование диапазонов ---
+                    # Рассчитываем изменение для каждого матча "этот игрок vs один оппонент"
+                    # и усредняем результат.
+                    total_change = 0
+                    num_matches = len(opponent_mmrs)
                         
-                        for opp_mmr in opponent_mmrs:
-                            mmr_change_for_pair = calculate_mmr_change_by_ranges(competition, player_current_mmr, opp_mmr, is_player_winner)
-                            total_change += mmr_change_for_pair
+                    for opp_mmr in opponent_mmrs:
+                        mmr_change_for_pair = calculate_mmr_change_by_ranges(competition, player_current_mmr, opp_mmr, is_player_winner)
+                        total_change += mmr_change_for_pair
                         
-                        if num_matches > 0:
-                            # Усредняем изменение по количеству "мини-матчей"
-                            final_mmr_change = round(total_change / num_matches)
-                        else:
-                            final_mmr_change = 0
+                    if num_matches > 0:
+                        # Усредняем изменение по количеству "мини-матчей"
+                        final_mmr_change = round(total_change / num_matches)
+                    else:
+                        final_mmr_change = 0
                     
-                    mmr_changes[internal_id] = final_mmr_change
+                mmr_changes[internal_id] = final_mmr_change
                     
-                except Exception as e:
-                    logger.error(f"Ошибка расчета MMR для пользователя ID {internal_id}: {e}", exc_info=True)
-                    errors_during_mmr_calc.append(f"Ошибка расчета MMR для пользователя ID {internal_id}: {e}")
-                    mmr_changes[internal_id] = 0 # В случае ошибки изменение 0
-
-            # Проверяем, были ли ошибки при расчете
-            if errors_during_mmr_calc:
-                error_msg = "\n".join(errors_during_mmr_calc)
-                await message.reply(
-                    f"❌ Ошибки при расчете MMR:\n{error_msg}\nРезультаты могут быть некорректны.",
-                    disable_notification=True
-                )
+            except Exception as e:
+                logger.error("Ошибка расчета MMR для пользователя ID %s: %s", internal_id, e, exc_info=True)
+                errors_during_mmr_calc.append(f"Ошибка расчета MMR для пользователя ID {internal_id}: {e}")
+                mmr_changes[internal_id] = 0 # В случае ошибки изменение 0
 
-            # 8. Подготовка данных для создания матча и обновления игроков
-            match_participants_data = []
+        # Проверяем, были ли ошибки при расчете
+        if errors_during_mmr_calc:
+            error_msg = "\n".join(errors_during_mmr_calc)
+            await message.reply(
+                f"❌ Ошибки при расчете MMR:\n{error_msg}\nРезультаты могут быть некорректны.",
+                disable_notification=True
+            )
 
-            # Используем participants_data, который содержит (username, achievements_list)
-            for username, achievements_list in participants_data:
-                internal_id = user_internal_ids.get(username)
-                if not internal_id:
-                    # Пропускаем, если пользователь не найден (хотя это уже проверено)
-                    continue
+        # 8. Подготовка данных для создания матча и обновления игроков
+        match_participants_data = []
 
-                is_winner_flag = (internal_id == winner_internal_id)
-                mmr_delta = mmr_changes.get(internal_id, 0) # Получаем РАССЧИТАННОЕ значение
+        # Используем participants_data, который содержит (username, achievements_list)
+        for username, achievements_list in participants_data:
+            internal_id = user_internal_ids.get(username)
+            if not internal_id:
+                # Пропускаем, если пользователь не найден (хотя это уже проверено)
+                continue
 
-                # Достижения от админа
-                admin_achievements = achievements_list
-                # achievements_gained_map[internal_id] = admin_achievements # Больше не нужно отдельно
+            is_winner_flag = (internal_id == winner_internal_id)
+            mmr_delta = mmr_changes.get(internal_id, 0) # Получаем РАССЧИТАННОЕ значение
 
-                match_participants_data.append({
-                    "user_id": internal_id,
-                    "mmr_change": mmr_delta,
-                    "is_winner": is_winner_flag,
-                    "achievements": admin_achievements # Передаем достижения от админа
-                })
+            # Достижения от админа
+            admin_achievements = achievements_list
+            # achievements_gained_map[internal_id] = admin_achievements # Больше не нужно отдельно
 
-            # 9. Создание матча и обновление статистики игроков
-            try:
-                 match = await crud.create_match(
-                     db,
-                     competition_id=competition.id,
-                     winner_id=winner_internal_id,
-                     participants=match_participants_data
-                 )
-                 logger.info(f"Матч ID {match.id} успешно создан для соревнования '{competition.name}' (ID: {competition.id})")
-
-                 # create_match внутри себя вызывает update_player_stats_after_match
-                 # для каждого участника, поэтому доп. обновление не нужно.
-
-                 # 10. Формирование и отправка отчета
-                 report_lines = [f"✅ Результаты матча (ID: {match.id}) для соревнования '{competition.name}' записаны:"]
-                 for p_data in match_participants_data:
-                     user_id = p_data['user_id']
-                     mmr_change = p_data['mmr_change']
-                     is_winner = p_data['is_winner']
-                     aches = p_data['achievements']
+            match_participants_data.append({
+                "user_id": internal_id,
+                "mmr_change": mmr_delta,
+                "is_winner": is_winner_flag,
+                "achievements": admin_achievements # Передаем достижения от админа
+            })
+
+        # 9. Создание матча и обновление статистики игроков
+        try:
+             match = await crud.create_match(
+                 db,
+                 competition_id=competition.id,
+                 winner_id=winner_internal_id,
+                 participants=match_participants_data
+             )
+             logger.info("Матч ID %s успешно создан для соревнования '%s' (ID: %s)", match.id, competition.name, competition.id)
+
+             # create_match в той же транзакции обновляет статистику всех участников,
+             # поэтому доп. обновление не нужно.
+
+             # 10. Формирование и отправка отчета
+             report_lines = [f"✅ Результаты матча (ID: {match.id}) для соревнования '{competition.name}' записаны:"]
+             for p_data in match_participants_data:
+                 user_id = p_data['user_id']
+                 mmr_change = p_data['mmr_change']
+                 is_winner = p_data['is_winner']
+                 aches = p_data['achievements']
                      
-                     # Получаем username из player_obj для отчета
-                     player_obj = player_objs_map.get(user_id)
-                     if player_obj and player_obj.user:
-                         user_display_name = f"@{player_obj.user.username}" if player_obj.user.username else f"ID:{player_obj.user.user_id}"
+                 # Получаем username из player_obj для отчета
+                 player_obj = player_objs_map.get(user_id)
+                 if player_obj and player_obj.user:
+                     if player_obj.user.username:
+                         user_display_name = f"@{player_obj.user.username}"
                      else:
-                         user_display_name = f"ID:{user_id}" # На случай ошибки
+                         user_display_name = player_obj.user.full_name or f"ID:{player_obj.user.user_id}"
+                 else:
+                     user_display_name = f"ID:{user_id}" # На случай ошибки
 
-                     status = "🏆 Победитель" if is_winner else "💀 Проигравший"
-                     mmr_sign = "+" if mmr_change >= 0 else ""
-                     ach_text = f", Достижения: {', '.join(aches)}" if aches else ""
-                     report_lines.append(f" • {user_display_name}: {status}, MMR: {mmr_sign}{mmr_change}{ach_text}")
+                 status = "🏆 Победитель" if is_winner else "💀 Проигравший"
+                 mmr_sign = "+" if mmr_change >= 0 else ""
+                 ach_text = f", Достижения: {', '.join(aches)}" if aches else ""
+                 report_lines.append(f" • {user_display_name}: {status}, MMR: {mmr_sign}{mmr_change}{ach_text}")
 
-                 await message.reply("\n".join(report_lines), disable_notification=True)
+             await message.reply("\n".join(report_lines), disable_notification=True)
 
-            except Exception as e:
-                 logger.error(f"Ошибка при создании матча или обновлении статистики: {e}", exc_info=True)
-                 await message.reply(
-                     f"❌ Произошла ошибка при записи результата матча: {e}",
-                     disable_notification=True
-                 )
+             # 11. Обновление живого закрепленного топа (с задержкой, правки объединяются)
+             if competition.leaderboard_message_id:
+                 get_live_leaderboard().schedule(message.bot, competition.id, competition.chat_id)
 
         except Exception as e:
-            logger.error(f"Ошибка в handle_match_outcome: {e}", exc_info=True)
-            await message.reply(
-                f"❌ Произошла внутренняя ошибка: {e}",
-                disable_notification=True
-            )
\ No newline at end of file
+             logger.error("Ошибка при создании матча или обновлении статистики: %s", e, exc_info=True)
+             await message.reply(
+                 f"❌ Произошла ошибка при записи результата матча: {e}",
+                 disable_notification=True
+             )
+
+    except Exception as e:
+        logger.error("Ошибка в handle_match_outcome: %s", e, exc_info=True)
+        await message.reply(
+            f"❌ Произошла внутренняя ошибка: {e}",
+            disable_notification=True
+        )
\ No newline at end of file
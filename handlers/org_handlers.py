@@ -3,8 +3,9 @@ from aiogram.types import CallbackQuery, Message
 from aiogram.fsm.context import FSMContext
 from aiogram.exceptions import TelegramAPIError # <-- НОВОЕ: Для обработки ошибок API
 from utils.mmr_calculator import parse_range_input
-from database import get_sessionmaker, crud
+from database import crud
 from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Optional
 
 
 from keyboards.org_keyboard import (
@@ -641,7 +642,7 @@ async def show_competition_preview(message, state: FSMContext):
 # ... (все необходимые импорты вверху файла, включая get_sessionmaker, crud, AsyncSession, F, Router и т.д.) ...
 
 @router.callback_query(CompetitionCreation.waiting_for_confirmation, F.data == "confirm_creation")
-async def confirm_competition_creation(callback: CallbackQuery, state: FSMContext):
+async def confirm_competition_creation(callback: CallbackQuery, state: FSMContext, db: AsyncSession):
     """Подтверждает создание соревнования и вызывает crud.create_competition."""
     
     # 1. Собираем все данные из состояния FSM
@@ -668,43 +669,38 @@ async def confirm_competition_creation(callback: CallbackQuery, state: FSMContex
     comp_data["achievements"] = user_data.get('achievements', {})
     comp_data["ranks"] = user_data.get('ranks', [])
 
-    # 3. Получаем фабрику сессий из database/__init__.py
-    AsyncSessionLocal = get_sessionmaker()
-
-    # 4. Используем async with для автоматического управления сессией
-    # Это гарантирует, что сессия будет закрыта, даже если произойдет ошибка
-    async with AsyncSessionLocal() as db:
-        try:
-            # 5. Получаем/создаем пользователя в БД
-            telegram_user_id = callback.from_user.id
-            username = callback.from_user.username or ""
-            full_name = f"{callback.from_user.first_name or ''} {callback.from_user.last_name or ''}".strip()
+    # 3. Сессия БД открыта middleware на время апдейта (аргумент db)
+    try:
+        # 4. Получаем/создаем пользователя в БД
+        telegram_user_id = callback.from_user.id
+        username = callback.from_user.username or ""
+        full_name = f"{callback.from_user.first_name or ''} {callback.from_user.last_name or ''}".strip()
             
-            db_user = await crud.get_or_create_user(db, telegram_user_id, username, full_name)
-            internal_creator_id = db_user.id
-            comp_data["creator_id"] = internal_creator_id
+        db_user = await crud.get_or_create_user(db, telegram_user_id, username, full_name)
+        internal_creator_id = db_user.id
+        comp_data["creator_id"] = internal_creator_id
 
-            # 6. Создаем соревнование через crud
-            # Предполагается, что crud.create_competition сама вызывает await db.commit() и await db.refresh()
-            competition = await crud.create_competition(db, **comp_data)
+        # 5. Создаем соревнование через crud
+        # Предполагается, что crud.create_competition сама вызывает await db.commit() и await db.refresh()
+        competition = await crud.create_competition(db, **comp_data)
             
-            # 7. Отправляем сообщение об успехе пользователю
-            await callback.message.edit_text(
-                f"✅ Соревнование <b>'{competition.name}'</b> успешно создано!\n"
-                f"ID: {competition.id}\n"
-                f"Чат: {competition.chat_id}\n"
-                f"Тип рейтинга: {'Формула' if competition.use_formula else 'Диапазоны'}\n"
-            )
+        # 6. Отправляем сообщение об успехе пользователю
+        await callback.message.edit_text(
+            f"✅ Соревнование <b>'{competition.name}'</b> успешно создано!\n"
+            f"ID: {competition.id}\n"
+            f"Чат: {competition.chat_id}\n"
+            f"Тип рейтинга: {'Формула' if competition.use_formula else 'Диапазоны'}\n"
+        )
             
-        except Exception as e:
-            import logging
-            logging.error(f"Ошибка создания соревнования: {e}", exc_info=True)
-            await callback.message.edit_text(
-                f"❌ Ошибка при создании соревнования: {str(e)}\n" 
-                f"Пожалуйста, попробуйте еще раз или обратитесь к разработчику."
-            )
+    except Exception as e:
+        import logging
+        logging.error(f"Ошибка создания соревнования: {e}", exc_info=True)
+        await callback.message.edit_text(
+            f"❌ Ошибка при создании соревнования: {str(e)}\n" 
+            f"Пожалуйста, попробуйте еще раз или обратитесь к разработчику."
+        )
             
-    # 9. Очищаем состояние FSM и отвечаем на callback
+    # 7. Очищаем состояние FSM и отвечаем на callback
     await state.clear()
     await callback.answer()
 
@@ -714,87 +710,89 @@ async def confirm_competition_creation(callback: CallbackQuery, state: FSMContex
 # ОБРАБОТКА "МОИ СОРЕВНОВАНИЯ"
 
 @router.callback_query(F.data == "my_competitions")
-async def show_my_competitions(callback: CallbackQuery):
+async def show_my_competitions(callback: CallbackQuery, db: AsyncSession, db_user: Optional[crud.UserIdentity]):
     """Показывает список соревнований, где пользователь админ, с пагинацией."""
-    await show_my_competitions_page(callback, page=1)
-
-async def show_my_competitions_page(callback: CallbackQuery, page: int):
+    await show_my_competitions_page(callback, db, db_user, page=1)
+
+async def show_my_competitions_page(
+    callback: CallbackQuery,
+    db: AsyncSession,
+    db_user: Optional[crud.UserIdentity],
+    page: int
+):
     """Вспомогательная функция для отображения конкретной страницы."""
-    AsyncSessionLocal = get_sessionmaker()
-    async with AsyncSessionLocal() as db:
-        try:
-            # Получаем внутренний ID пользователя
-            db_user = await crud.get_user_by_id(db, callback.from_user.id)
-            if not db_user:
-                 await callback.message.edit_text("Ошибка: Вы не зарегистрированы в системе.")
-                 await callback.answer()
-                 return
-
-            internal_user_id = db_user.id
-
-            # Получаем ВСЕ соревнования, где пользователь админ
-            # Это может быть неэффективно для очень больших списков, но для начала сойдет
-            # В будущем можно оптимизировать с помощью JOIN и LIMIT/OFFSET в SQL
-            all_competitions = await crud.get_administered_competitions(db, internal_user_id)
-            
-            if not all_competitions:
-                await callback.message.edit_text(
-                    "У вас нет соревнований, где вы являетесь администратором.",
-                    reply_markup=get_organizer_main_menu() # Возвращаем в меню организатора
-                )
-                await callback.answer()
-                return
-
-            total_items = len(all_competitions)
-            total_pages = math.ceil(total_items / ITEMS_PER_PAGE) or 1 # Минимум 1 страница
-
-            # Проверяем корректность номера страницы
-            if page < 1:
-                page = 1
-            elif page > total_pages:
-                page = total_pages
-
-            # Вычисляем индексы для среза
-            start_index = (page - 1) * ITEMS_PER_PAGE
-            end_index = start_index + ITEMS_PER_PAGE
-            competitions_on_page = all_competitions[start_index:end_index]
-
-            # Формируем текст сообщения
-            if total_pages > 1:
-                header = f"<b>Мои соревнования</b> (Страница {page}/{total_pages}):\n\n"
-            else:
-                header = "<b>Мои соревнования:</b>\n\n"
+    try:
+        # Внутренний ID пользователя уже определен middleware (db_user)
+        if not db_user:
+             await callback.message.edit_text("Ошибка: Вы не зарегистрированы в системе.")
+             await callback.answer()
+             return
+
+        internal_user_id = db_user.id
+
+        # Получаем ВСЕ соревнования, где пользователь админ
+        # Это может быть неэффективно для очень больших списков, но для начала сойдет
+        # В будущем можно оптимизировать с помощью JOIN и LIMIT/OFFSET в SQL
+        all_competitions = await crud.get_administered_competitions(db, internal_user_id)
             
-            if competitions_on_page:
-                comp_lines = []
-                for comp in competitions_on_page:
-                    comp_lines.append(f"• <b>{comp.name}</b> (ID: {comp.id})")
-                body = "\n".join(comp_lines)
-            else:
-                body = "На этой странице соревнований нет."
-
-            message_text = header + body
-
-            # Отправляем/редактируем сообщение с клавиатурой пагинации
+        if not all_competitions:
             await callback.message.edit_text(
-                message_text,
-                reply_markup=get_my_competitions_keyboard(competitions_on_page, page, total_pages, ITEMS_PER_PAGE)
+                "У вас нет соревнований, где вы являетесь администратором.",
+                reply_markup=get_organizer_main_menu() # Возвращаем в меню организатора
             )
             await callback.answer()
+            return
 
-        except Exception as e:
-            await callback.message.edit_text(
-                f"❌ Произошла ошибка: {e}",
-                reply_markup=get_organizer_main_menu()
-            )
-            await callback.answer()
+        total_items = len(all_competitions)
+        total_pages = math.ceil(total_items / ITEMS_PER_PAGE) or 1 # Минимум 1 страница
+
+        # Проверяем корректность номера страницы
+        if page < 1:
+            page = 1
+        elif page > total_pages:
+            page = total_pages
+
+        # Вычисляем индексы для среза
+        start_index = (page - 1) * ITEMS_PER_PAGE
+        end_index = start_index + ITEMS_PER_PAGE
+        competitions_on_page = all_competitions[start_index:end_index]
+
+        # Формируем текст сообщения
+        if total_pages > 1:
+            header = f"<b>Мои соревнования</b> (Страница {page}/{total_pages}):\n\n"
+        else:
+            header = "<b>Мои соревнования:</b>\n\n"
+            
+        if competitions_on_page:
+            comp_lines = []
+            for comp in competitions_on_page:
+                comp_lines.append(f"• <b>{comp.name}</b> (ID: {comp.id})")
+            body = "\n".join(comp_lines)
+        else:
+            body = "На этой странице соревнований нет."
+
+        message_text = header + body
+
+        # Отправляем/редактируем сообщение с клавиатурой пагинации
+        await callback.message.edit_text(
+            message_text,
+            reply_markup=get_my_competitions_keyboard(competitions_on_page, page, total_pages, ITEMS_PER_PAGE)
+        )
+        await callback.answer()
+
+    except Exception as e:
+        await callback.message.edit_text(
+            f"❌ Произошла ошибка: {e}",
+            reply_markup=get_organizer_main_menu()
+        )
+        await callback.answer()
 
 # --- Хендлер для навигации по страницам ---
 @router.callback_query(F.data.startswith("my_comps_page_"))
-async def navigate_my_competitions(callback: CallbackQuery):
+async def navigate_my_competitions(callback: CallbackQuery, db: AsyncSession, db_user: Optional[crud.UserIdentity]):
     """Обрабатывает нажатие кнопок навигации по страницам 'Мои соревнования'."""
     try:
         page_num = int(callback.data.split("_")[-1])
-        await show_my_competitions_page(callback, page=page_num)
+        await show_my_competitions_page(callback, db, db_user, page=page_num)
     except (ValueError, IndexError):
         await callback.answer("Ошибка навигации.", show_alert=True)
\ No newline at end of file
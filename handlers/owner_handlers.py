@@ -0,0 +1,59 @@
+# handlers/owner_handlers.py
+"""Служебные команды владельца бота (OWNER_ID)."""
+import logging
+import os
+
+from aiogram import Router
+from aiogram.filters import Command, CommandObject
+from aiogram.types import BufferedInputFile, Message
+
+from utils.profiler import MODES, get_profiler
+
+router = Router()
+logger = logging.getLogger(__name__)
+
+# Telegram ID владельца; без него служебные команды выключены
+OWNER_ID = int(os.getenv("OWNER_ID", "0"))
+PROFILE_DEFAULT_SECONDS = 30
+
+
+# --- Команда /profile ---
+@router.message(Command("profile"))
+async def cmd_profile(message: Message, command: CommandObject):
+    """
+    Профилирование работающего бота: собирает профиль за указанное время
+    и присылает отчет файлом.
+    Использование: /profile [секунд] [cprofile|sample]
+    """
+    if not OWNER_ID or message.from_user.id != OWNER_ID:
+        return
+
+    seconds = PROFILE_DEFAULT_SECONDS
+    mode = "cprofile"
+    for arg in (command.args or "").split():
+        if arg.isdigit():
+            seconds = int(arg)
+        elif arg.lower() in MODES:
+            mode = arg.lower()
+        else:
+            await message.reply(f"Использование: /profile [секунд] [{'|'.join(MODES)}]")
+            return
+
+    profiler = get_profiler()
+    if profiler.active:
+        await message.reply("Профилирование уже идет, дождитесь отчета.")
+        return
+
+    seconds = min(seconds, profiler.max_seconds)
+    await message.reply(f"⏱ Профилирование ({mode}) на {seconds:.0f} с...")
+    try:
+        report = await profiler.run(seconds, mode)
+    except Exception as e:
+        logger.error(f"Ошибка в /profile: {e}", exc_info=True)
+        await message.reply(f"❌ Не удалось выполнить профилирование: {e}")
+        return
+
+    await message.answer_document(
+        BufferedInputFile(report.content.encode("utf-8"), filename=report.filename),
+        caption=f"Профиль ({report.mode}, {report.seconds:.0f} с): {report.summary}"[:1024]
+    )
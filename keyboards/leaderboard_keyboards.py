@@ -0,0 +1,36 @@
+# keyboards/leaderboard_keyboards.py
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+
+# Формат callback_data (лимит Telegram - 64 байта):
+#   lb:<competition_id>:<size>:<n|p>:<mmr>:<player_id>:<rank>  - следующая/предыдущая страница
+#   lbme:<competition_id>:<size>                               - страница с позицией игрока
+LEADERBOARD_PREFIX = "lb:"
+LEADERBOARD_ME_PREFIX = "lbme:"
+
+
+def get_leaderboard_keyboard(competition_id: int, size: int, page) -> InlineKeyboardMarkup:
+    """Клавиатура постраничного топа. page - utils.leaderboard.LeaderboardPage."""
+    nav_buttons = []
+    if page.has_prev:
+        mmr, player_id = page.first
+        rank = page.start_rank - size
+        nav_buttons.append(InlineKeyboardButton(
+            text="<< Назад",
+            callback_data=f"{LEADERBOARD_PREFIX}{competition_id}:{size}:p:{mmr}:{player_id}:{rank}"
+        ))
+    if page.has_next:
+        mmr, player_id = page.last
+        rank = page.start_rank + page.count
+        nav_buttons.append(InlineKeyboardButton(
+            text="Вперед >>",
+            callback_data=f"{LEADERBOARD_PREFIX}{competition_id}:{size}:n:{mmr}:{player_id}:{rank}"
+        ))
+
+    keyboard = []
+    if nav_buttons:
+        keyboard.append(nav_buttons)
+    keyboard.append([InlineKeyboardButton(
+        text="📍 Моя позиция",
+        callback_data=f"{LEADERBOARD_ME_PREFIX}{competition_id}:{size}"
+    )])
+    return InlineKeyboardMarkup(inline_keyboard=keyboard)
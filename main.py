@@ -1,40 +1,35 @@
 # main.py (ФИНАЛЬНАЯ ВЕРСИЯ ДЛЯ ИНИЦИАЛИЗАЦИИ БД)
 import asyncio
 import logging
-import sys
 from contextlib import asynccontextmanager
 from pathlib import Path
+from typing import List, Optional
 import os
 from dotenv import load_dotenv
 
-from aiogram import Bot, Dispatcher, types
+from aiogram import Bot, Dispatcher, Router, types
 from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.base import BaseSession
 from aiogram.enums import ParseMode
-from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
 
-from handlers import match_handlers 
-from handlers import reg_handler
-from handlers import admin_commands
+from utils.logging_setup import setup_logging
 
-# --- Настройка логирования ДО ВСЕГО ---
-logging.basicConfig(
-    level=logging.DEBUG,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(sys.stdout)
-    ]
-)
+# --- Загрузка переменных окружения (до логирования: оно настраивается из них) ---
+env_path = Path(__file__).parent / ".env"
+load_res = load_dotenv(dotenv_path=env_path) if env_path.exists() else None
+
+# --- Настройка логирования ДО ВСЕГО (LOG_LEVEL, LOG_LEVELS и др., см. utils/logging_setup.py) ---
+setup_logging()
 logger = logging.getLogger(__name__)
 logger.info("--- ЗАПУСК БОТА ---")
 
 logger.info("Импорт моделей...")
 from database import models 
 
-# --- Загрузка переменных окружения ---
-env_path = Path(__file__).parent / ".env"
 logger.info(f"Путь к .env файлу: {env_path}")
 if env_path.exists():
-    load_res = load_dotenv(dotenv_path=env_path)
     logger.info(f"Загрузка .env: {'Успешна' if load_res else 'Файл найден, но переменные могли не загрузиться'}")
 else:
     logger.error(f"Файл .env НЕ НАЙДЕН по пути: {env_path}")
@@ -53,17 +48,57 @@ if not BOT_TOKEN:
     logger.critical("BOT_TOKEN не установлен! Выход.")
     raise ValueError("BOT_TOKEN не найден в .env файле или переменных окружения.")
 
+# --- Режим получения апдейтов: polling (по умолчанию) или webhook ---
+BOT_MODE = os.getenv("BOT_MODE", "polling").lower()
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET") or None
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")  # Публичный адрес, например https://bot.example.com
+logger.info(f"Режим получения апдейтов: {BOT_MODE}")
 
-from handlers import base_handlers, org_handlers, player_handlers
+# --- Количество процессов-обработчиков (больше 1 - шардирование по chat_id, см. utils/sharding.py) ---
+WORKERS = int(os.getenv("WORKERS", "1"))
+SHARD_STATS_INTERVAL = float(os.getenv("SHARD_STATS_INTERVAL", "60"))
 
-from database import init_db 
+# --- Хранилище FSM: db (таблица fsm_states, по умолчанию) или memory ---
+FSM_STORAGE = os.getenv("FSM_STORAGE", "db").lower()
+
+# --- Отладка SQL при разработке: N+1, бюджет запросов на апдейт, медленные запросы ---
+SQL_DEBUG = os.getenv("SQL_DEBUG", "").lower() in ("1", "true", "yes")
+
+
+# Хендлеры импортируются после загрузки .env: часть настроек они читают при импорте
+from handlers import match_handlers
+from handlers import reg_handler
+from handlers import admin_commands
+from handlers import base_handlers, org_handlers, player_handlers, inline_handlers, owner_handlers
+
+from database import init_db, get_engine
+from database.chat_directory import get_chat_directory
+from database.profile_buffer import get_profile_buffer
+from database.fsm_storage import DatabaseStorage, TrackingMemoryStorage, get_fsm_storage
+from middlewares.chat_directory import ChatDirectoryMiddleware
+from middlewares.db_session import DbSessionMiddleware
+from middlewares.command_router import CommandRouterMiddleware
+from middlewares.metrics import HandlerMetricsMiddleware, UpdateMetricsMiddleware
+from middlewares.sql_debug import SqlDebugMiddleware
+from utils.send_scheduler import get_outbound_scheduler
+from utils.live_leaderboard import get_live_leaderboard
+from utils.fsm_sweeper import get_fsm_sweeper
+from utils.metrics import get_metrics
+from utils.sql_debug import get_sql_debugger
+from utils.profiler import get_profiler
+from utils.loop_monitor import configure_asyncio_debug, get_loop_monitor, restore_asyncio_debug
+from utils.sharding import ShardPool, ShardRouterMiddleware
 
 
 async def set_commands(bot: Bot):
     commands = [
         types.BotCommand(command="start", description="Основная команда. Нажимайте"),
         types.BotCommand(command="help", description="Помощь"),
-        types.BotCommand(command="add_admin", description="Добавить админа в соревнование, подробнее в help")
+        types.BotCommand(command="add_admin", description="Добавить админа в соревнование, подробнее в help"),
+        types.BotCommand(command="live_top", description="Вкл/выкл закрепленный топ соревнования")
     ]
     await bot.set_my_commands(commands)
 
@@ -72,39 +107,226 @@ async def set_commands(bot: Bot):
 async def lifespan(dp: Dispatcher):
     yield
 
-async def main():
-    
-    try:
-        await init_db() # <-- КЛЮЧЕВОЕ ИЗМЕНЕНИЕ: await
-    except Exception as e:
-        raise
-    # -------------------------------------
+def handler_routers() -> List[Router]:
+    """Роутеры хендлеров в порядке проверки фильтров."""
+    return [
+        base_handlers.router,
+        org_handlers.router,
+        match_handlers.router,
+        reg_handler.router,
+        admin_commands.router,
+        player_handlers.router,
+        inline_handlers.router,
+        owner_handlers.router,
+    ]
+
+
+def resolve_allowed_updates() -> List[str]:
+    """
+    Типы апдейтов, на которые есть хендлеры. Для фронта шардирования: без
+    хранилища FSM, метрик и фоновых задач полного диспетчера (роутеры
+    подключаются к пустому Router; воркеры запускаются через spawn и
+    импортируют свои копии роутеров).
+    """
+    router = Router()
+    router.include_routers(*handler_routers())
+    return router.resolve_used_update_types()
 
-    logger.info("Создание хранилища состояний...")
-    storage = MemoryStorage()
+
+def build_dispatcher() -> Dispatcher:
+    """Создает диспетчер со всеми роутерами, middleware и фоновыми задачами."""
+    logger.info(f"Создание хранилища состояний ({FSM_STORAGE})...")
+    if FSM_STORAGE == "memory":
+        storage = TrackingMemoryStorage()
+    else:
+        # Незавершенные мастера переживают перезапуск; закрывается диспетчером при остановке
+        storage = get_fsm_storage()
 
     dp = Dispatcher(storage=storage, lifespan=lifespan)
+    if isinstance(storage, DatabaseStorage):
+        dp.startup.register(storage.start)
+    # Брошенные мастера удаляются по FSM_TTL, владельцу приходит уведомление
+    fsm_sweeper = get_fsm_sweeper(storage)
+    dp.startup.register(fsm_sweeper.start)
+    dp.shutdown.register(fsm_sweeper.stop)
+
+    dp.include_routers(*handler_routers())
+
+    # Метрики: апдейты и SQL-запросы на апдейт, задержка хендлеров (вместе с открытием сессии БД)
+    metrics = get_metrics()
+    metrics.instrument_engine(get_engine())
+    dp.update.outer_middleware(UpdateMetricsMiddleware(metrics))
+    dp.message.middleware(HandlerMetricsMiddleware(metrics))
+    dp.callback_query.middleware(HandlerMetricsMiddleware(metrics))
+    dp.inline_query.middleware(HandlerMetricsMiddleware(metrics))
+
+    if SQL_DEBUG:
+        sql_debugger = get_sql_debugger()
+        sql_debugger.instrument_engine(get_engine())
+        dp.update.outer_middleware(SqlDebugMiddleware(sql_debugger))
+        logger.warning("SQL_DEBUG включен: запросы анализируются на каждом апдейте.")
+
+    # Одна сессия БД и один поиск отправителя на апдейт (аргументы db и db_user в хендлерах)
+    dp.message.middleware(DbSessionMiddleware())
+    dp.callback_query.middleware(DbSessionMiddleware())
+    dp.inline_query.middleware(DbSessionMiddleware())
+
+    # Пассивный справочник участников чатов: буфер в памяти, запись пачками
+    chat_directory = get_chat_directory()
+    dp.message.outer_middleware(ChatDirectoryMiddleware(chat_directory))
+    dp.startup.register(chat_directory.start)
+    dp.shutdown.register(chat_directory.stop)
+
+    # Разбор первого слова один раз; обычная переписка в группах дальше не идет
+    dp.message.outer_middleware(CommandRouterMiddleware())
 
+    # Отложенная запись изменений профилей (username/full_name), сброс и при остановке
+    profile_buffer = get_profile_buffer()
+    dp.startup.register(profile_buffer.start)
+    dp.shutdown.register(profile_buffer.stop)
+
+    # Запланированные правки живого топа отменяются при остановке
+    dp.shutdown.register(get_live_leaderboard().stop)
+
+    # Все исходящие запросы к чатам идут через очередь с учетом флуд-лимитов Telegram
+    dp.shutdown.register(get_outbound_scheduler().stop)
+
+    metrics.add_stats("bot_outbound", get_outbound_scheduler().stats)
+    metrics.add_stats("bot_fsm", fsm_sweeper.stats)
+    dp.startup.register(metrics.start)
+    dp.shutdown.register(metrics.stop)
+
+    # Профилирование по запросу: /profile владельца или SIGUSR1
+    dp.startup.register(get_profiler().install_signal_handler)
+
+    setup_loop_monitor(dp)
+    return dp
+
+
+def setup_loop_monitor(dp: Dispatcher) -> None:
+    """Задержка event loop в метриках, стек при зависании, журнал медленных callback-ов."""
+    loop_monitor = get_loop_monitor()
+    metrics = get_metrics()
+    metrics.register(loop_monitor.lag_histogram)
+    metrics.add_stats("bot_loop", loop_monitor.stats)
+    dp.startup.register(configure_asyncio_debug)
+    dp.shutdown.register(restore_asyncio_debug)
+    dp.startup.register(loop_monitor.start)
+    dp.shutdown.register(loop_monitor.stop)
+
+
+def build_front_dispatcher() -> Dispatcher:
+    """Диспетчер фронт-процесса: не обрабатывает апдейты, а раскладывает их по воркерам."""
+    pool = ShardPool(WORKERS, build_dispatcher, build_bot, stats_interval=SHARD_STATS_INTERVAL)
+    dp = Dispatcher()
+    dp.update.outer_middleware(ShardRouterMiddleware(pool))
+    dp.startup.register(pool.start)
+    dp.shutdown.register(pool.stop)
+
+    # Метрики фронта: воркеры и исходящие запросы; метрики апдейтов - у воркеров
+    metrics = get_metrics()
+    metrics.add_stats("bot_shard", pool.stats, label="worker")
+    metrics.add_stats("bot_outbound", get_outbound_scheduler().stats)
+    dp.startup.register(metrics.start)
+    dp.shutdown.register(metrics.stop)
+
+    setup_loop_monitor(dp)
+    return dp
+
+
+def build_bot(session: Optional[BaseSession] = None) -> Bot:
+    """
+    Создает бота; исходящие запросы идут через планировщик флуд-лимитов.
+    session - другая HTTP-сессия (например, на локальный Bot API в benchmarks/load.py).
+    """
     bot = Bot(
         token=BOT_TOKEN,
+        session=session,
         default=DefaultBotProperties(parse_mode=ParseMode.HTML)
     )
+    bot.session.middleware(get_outbound_scheduler())
+    return bot
+
+
+async def run_polling(dp: Dispatcher, bot: Bot, allowed_updates: List[str], ordered: bool = False):
+    """
+    Получение апдейтов через long polling.
+    ordered=True - апдейты передаются в диспетчер строго по одному (фронт шардирования).
+    """
+    # Если раньше бот работал через вебхук, getUpdates вернет конфликт
+    await bot.delete_webhook()
+    await dp.start_polling(bot, allowed_updates=allowed_updates, handle_as_tasks=not ordered)
 
-    dp.include_router(base_handlers.router)
-    dp.include_router(org_handlers.router)
-    dp.include_router(match_handlers.router)
-    dp.include_router(reg_handler.router) 
-    dp.include_router(admin_commands.router)
-    dp.include_router(player_handlers.router)
 
+async def run_webhook(dp: Dispatcher, bot: Bot, allowed_updates: List[str], ordered: bool = False):
+    """
+    Получение апдейтов через вебхук (aiohttp-сервер).
+    Если WEBHOOK_URL не задан, вебхук в Telegram не регистрируется - удобно для
+    локальной проверки через scripts/post_updates.py.
+    """
+    async def on_startup(bot: Bot):
+        if WEBHOOK_URL:
+            await bot.set_webhook(
+                url=f"{WEBHOOK_URL.rstrip('/')}{WEBHOOK_PATH}",
+                secret_token=WEBHOOK_SECRET,
+                allowed_updates=allowed_updates
+            )
+            logger.info(f"Вебхук установлен: {WEBHOOK_URL.rstrip('/')}{WEBHOOK_PATH}")
+        else:
+            logger.warning("WEBHOOK_URL не задан: вебхук в Telegram не регистрируется.")
+
+    dp.startup.register(on_startup)
+
+    app = web.Application()
+    SimpleRequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        secret_token=WEBHOOK_SECRET,
+        handle_in_background=not ordered
+    ).register(app, path=WEBHOOK_PATH)
+    # Запуск/остановка диспетчера (dp.startup/dp.shutdown) вместе с приложением
+    setup_application(app, dp, bot=bot)
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, host=WEBHOOK_HOST, port=WEBHOOK_PORT)
+    await site.start()
+    logger.info(f"Вебхук-сервер слушает http://{WEBHOOK_HOST}:{WEBHOOK_PORT}{WEBHOOK_PATH}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+
+
+async def main():
+    
+    try:
+        await init_db() # <-- КЛЮЧЕВОЕ ИЗМЕНЕНИЕ: await
+    except Exception as e:
+        raise
+    # -------------------------------------
+
+    bot = build_bot()
+    if WORKERS > 1:
+        # У фронта нет своих хендлеров: типы апдейтов берем у роутеров воркеров
+        allowed_updates = resolve_allowed_updates()
+        dp = build_front_dispatcher()
+        logger.info(f"Шардирование апдейтов по {WORKERS} воркерам.")
+    else:
+        dp = build_dispatcher()
+        allowed_updates = dp.resolve_used_update_types()
+    ordered = WORKERS > 1
 
     try:
         await set_commands(bot)
-        await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
+        if BOT_MODE == "webhook":
+            await run_webhook(dp, bot, allowed_updates, ordered=ordered)
+        else:
+            await run_polling(dp, bot, allowed_updates, ordered=ordered)
     except (KeyboardInterrupt, SystemExit):
         logger.info("Бот остановлен пользователем (KeyboardInterrupt/SystemExit).")
     except Exception as e:
-        logger.error(f"Критическая ошибка при запуске поллинга: {e}", exc_info=True)
+        logger.error(f"Критическая ошибка при запуске бота ({BOT_MODE}): {e}", exc_info=True)
         raise
 
 if __name__ == "__main__":
@@ -0,0 +1,28 @@
+# middlewares/chat_directory.py
+"""
+Outer-middleware, которое пассивно собирает справочник участников чатов соревнований.
+"""
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import Message
+
+from database.chat_directory import ChatDirectory
+
+
+class ChatDirectoryMiddleware(BaseMiddleware):
+    """Запоминает автора каждого группового сообщения. Без обращений к БД на горячем пути."""
+
+    def __init__(self, directory: ChatDirectory):
+        self.directory = directory
+
+    async def __call__(
+        self,
+        handler: Callable[[Message, Dict[str, Any]], Awaitable[Any]],
+        event: Message,
+        data: Dict[str, Any]
+    ) -> Any:
+        user = event.from_user
+        if user and not user.is_bot and event.chat.type in ("group", "supergroup"):
+            self.directory.record(event.chat.id, user)
+        return await handler(event, data)
@@ -0,0 +1,38 @@
+# middlewares/command_router.py
+"""
+Outer-middleware, которое разбирает первое слово сообщения один раз на апдейт
+и отсекает обычную переписку в группах до прохода по фильтрам роутеров.
+"""
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.dispatcher.event.bases import UNHANDLED
+from aiogram.types import Message
+
+from filters.text_command import is_text_command, parse_text_command
+
+
+class CommandRouterMiddleware(BaseMiddleware):
+    """
+    Кладет в data["text_command"] первое слово сообщения (см. TextCommand).
+
+    Групповое сообщение пропускается дальше, только если это слеш-команда,
+    зарегистрированная текстовая команда или у пользователя активно состояние FSM.
+    Регистрировать после ChatDirectoryMiddleware, чтобы справочник видел все сообщения.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[Message, Dict[str, Any]], Awaitable[Any]],
+        event: Message,
+        data: Dict[str, Any]
+    ) -> Any:
+        word = parse_text_command(event.text)
+        data["text_command"] = word
+
+        if event.chat.type in ("group", "supergroup"):
+            is_command = word is not None and (word.startswith("/") or is_text_command(word))
+            if not is_command and data.get("raw_state") is None:
+                return UNHANDLED
+
+        return await handler(event, data)
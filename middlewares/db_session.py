@@ -0,0 +1,40 @@
+# middlewares/db_session.py
+"""
+Middleware, которое открывает одну сессию БД на апдейт и определяет отправителя.
+"""
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+from database import get_sessionmaker, crud
+
+
+class DbSessionMiddleware(BaseMiddleware):
+    """
+    Inner-middleware: передает в хендлер аргументы `db` (AsyncSession) и
+    `db_user` (crud.UserIdentity или None, если отправитель не зарегистрирован).
+
+    Сессия открывается только для хендлеров, которые объявили эти аргументы,
+    отправитель определяется через кэш crud.get_user_identity.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        params = data["handler"].params
+        if "db" not in params and "db_user" not in params:
+            return await handler(event, data)
+
+        AsyncSessionLocal = get_sessionmaker()
+        async with AsyncSessionLocal() as db:
+            data["db"] = db
+            if "db_user" in params:
+                from_user = data.get("event_from_user")
+                data["db_user"] = await crud.get_user_identity(
+                    db, from_user.id, from_user.username, from_user.full_name
+                ) if from_user else None
+            return await handler(event, data)
@@ -0,0 +1,64 @@
+# middlewares/metrics.py
+"""
+Middleware сбора метрик (см. utils/metrics.py).
+"""
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.dispatcher.event.bases import UNHANDLED
+from aiogram.types import TelegramObject, Update
+
+from utils.metrics import Metrics
+
+
+class UpdateMetricsMiddleware(BaseMiddleware):
+    """
+    Outer-middleware на dp.update: считает апдейты по типам, время их обработки
+    и SQL-запросы/коммиты, выполненные за время апдейта.
+    """
+
+    def __init__(self, metrics: Metrics):
+        self.metrics = metrics
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any]
+    ) -> Any:
+        update_type = event.event_type
+        outcome = "error"
+        started = time.perf_counter()
+        try:
+            with self.metrics.update_scope(update_type):
+                result = await handler(event, data)
+            outcome = "unhandled" if result is UNHANDLED else "handled"
+            return result
+        finally:
+            self.metrics.update_seconds.observe(time.perf_counter() - started, type=update_type)
+            self.metrics.updates.inc(type=update_type, result=outcome)
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """Inner-middleware: задержка и исключения по хендлерам (модуль.функция)."""
+
+    def __init__(self, metrics: Metrics):
+        self.metrics = metrics
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        callback = data["handler"].callback
+        name = f"{callback.__module__}.{callback.__name__}"
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception as e:
+            self.metrics.handler_errors.inc(handler=name, error=type(e).__name__)
+            raise
+        finally:
+            self.metrics.handler_seconds.observe(time.perf_counter() - started, handler=name)
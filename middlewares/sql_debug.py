@@ -0,0 +1,29 @@
+# middlewares/sql_debug.py
+"""
+Middleware отладки SQL (см. utils/sql_debug.py). Регистрируется только при SQL_DEBUG=1.
+"""
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+
+from utils.sql_debug import SqlDebugger, describe_update
+
+
+class SqlDebugMiddleware(BaseMiddleware):
+    """Outer-middleware на dp.update: собирает запросы апдейта и пишет отчет после обработки."""
+
+    def __init__(self, debugger: SqlDebugger):
+        self.debugger = debugger
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any]
+    ) -> Any:
+        token = self.debugger.begin_update(describe_update(event))
+        try:
+            return await handler(event, data)
+        finally:
+            self.debugger.end_update(token)
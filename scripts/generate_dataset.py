@@ -0,0 +1,481 @@
+# scripts/generate_dataset.py
+"""
+Генератор синтетической базы для нагрузочного тестирования.
+
+Заполняет существующие модели пользователями, соревнованиями (с формулой
+и с диапазонами), игроками и историей матчей. Матчи проигрываются по
+правилам бота: изменение MMR считается теми же функциями из
+utils/mmr_calculator.py, что и в /Исход, плюс бонусы за достижения. У
+игроков есть скрытый "скилл" (влияет на шанс победы) и активность
+(распределение Парето: немногие играют большую часть матчей), поэтому
+MMR расходится, а топ и статистика выглядят как в живой базе.
+
+Результат детерминирован при одинаковом --seed и параметрах. Строки
+вставляются пачками через Core; индексы таблиц матчей на время загрузки
+удаляются и создаются заново.
+
+Пример (10M участников матчей, на SQLite около 6-7 минут):
+    DATABASE_URL=sqlite+aiosqlite:///load.db python scripts/generate_dataset.py \\
+        --users 500000 --competitions 2000 --players 2000000 --participants 10000000 --seed 1
+"""
+import argparse
+import asyncio
+import bisect
+import itertools
+import json
+import math
+import os
+import random
+import sys
+import time
+from operator import itemgetter
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, Dict, List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from dotenv import load_dotenv
+
+load_dotenv()
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+from sqlalchemy import JSON, bindparam, func, select, text, update
+
+from database import get_engine, init_db, models
+from utils.logging_setup import setup_logging
+from utils.mmr_calculator import calculate_mmr_change_by_formula, calculate_mmr_change_by_ranges
+
+# Telegram ID синтетических пользователей: 10^10 + User.id (не пересекаются с бенчмарками)
+TELEGRAM_ID_BASE = 10_000_000_000
+# Время последнего матча по умолчанию: фиксировано, чтобы база не зависела от даты запуска
+DEFAULT_END_TIME = 1_760_000_000
+
+# Формулы ограничены снизу: отрицательный результат дал бы проигравшему очки, и MMR разошелся бы без предела
+FORMULAS = [
+    "max(5, 25 + (opponent_mmr - player_mmr) / 40)",
+    "max(5, min(50, 20 + (opponent_mmr - player_mmr) / 25))",
+    "round(32 / (1 + pow(10, (player_mmr - opponent_mmr) / 400)))",
+]
+# Правило выбирается по модулю разницы MMR, без учета того, кто сильнее, поэтому
+# наборы почти симметричны: иначе сильные игроки набирали бы MMR и на поражениях
+RANGE_RULE_SETS = [
+    [
+        {"diff_min": 0, "diff_max": 100, "win_points": 25, "lose_points": -25},
+        {"diff_min": 100, "diff_max": 300, "win_points": 20, "lose_points": -20},
+        {"diff_min": 300, "diff_max": None, "win_points": 15, "lose_points": -15},
+    ],
+    [
+        {"diff_min": None, "diff_max": None, "win_points": 20, "lose_points": -20},
+    ],
+    [
+        {"diff_min": 0, "diff_max": 150, "win_points": 15, "lose_points": -15},
+        {"diff_min": 150, "diff_max": None, "win_points": 10, "lose_points": -12},
+    ],
+]
+RANKS = [
+    {"name": "Бронза", "mmr_threshold": 0},
+    {"name": "Серебро", "mmr_threshold": 1100},
+    {"name": "Золото", "mmr_threshold": 1300},
+    {"name": "Платина", "mmr_threshold": 1500},
+    {"name": "Алмаз", "mmr_threshold": 1800},
+]
+# Пул достижений: (название, бонус MMR). Первые в списке выдаются чаще (распределение Ципфа)
+ACHIEVEMENT_POOL = [
+    ("MVP", 5), ("Первая кровь", 2), ("Камбэк", 3), ("Снайпер", 2), ("Стена", 2),
+    ("Тактик", 3), ("Без потерь", 4), ("Хет-трик", 6), ("Спасатель", 3), ("Легенда", 10),
+]
+# Форматы соревнований: (вес, размеры матча, веса размеров)
+MATCH_FORMATS = [
+    (0.5, [2], [1]),                                  # дуэли
+    (0.3, [2, 3, 4, 5, 6], [30, 25, 20, 15, 10]),     # небольшие группы
+    (0.15, [8, 10, 12, 16], [40, 30, 20, 10]),        # лобби
+    (0.05, [16, 32, 64], [60, 30, 10]),               # турниры на много участников
+]
+
+
+EMPTY_JSON = {list: "[]", dict: "{}"}
+
+
+class Counts:
+    """Счетчики вставленных строк по таблицам."""
+
+    def __init__(self) -> None:
+        self.rows: Dict[str, int] = {}
+
+    def add(self, table: str, count: int) -> None:
+        self.rows[table] = self.rows.get(table, 0) + count
+
+
+class BatchWriter:
+    """
+    Копит строки по таблицам и вставляет их пачками напрямую через executemany
+    драйвера: без обработки параметров SQLAlchemy на каждую строку вставка в
+    несколько раз быстрее. JSON-колонки сериализуются здесь же.
+    """
+
+    PLACEHOLDERS = {
+        "qmark": lambda n, name: "?",
+        "format": lambda n, name: "%s",
+        "pyformat": lambda n, name: "%s",
+        "numeric": lambda n, name: f":{n + 1}",
+        "numeric_dollar": lambda n, name: f"${n + 1}",
+        "named": lambda n, name: f":{name}",
+    }
+
+    def __init__(self, conn, batch_size: int, counts: Counts):
+        self.conn = conn
+        self.batch_size = batch_size
+        self.counts = counts
+        # Порядок таблиц важен: матч вставляется раньше своих участников
+        self.pending: Dict[Any, List[Dict[str, Any]]] = {}
+        self._statements: Dict[str, tuple] = {}
+
+    def _statement(self, table, columns: List[str]) -> tuple:
+        statement = self._statements.get(table.name)
+        if statement is None:
+            placeholder = self.PLACEHOLDERS[self.conn.dialect.paramstyle]
+            preparer = self.conn.dialect.identifier_preparer
+            sql = (
+                f"INSERT INTO {preparer.format_table(table)} "
+                f"({', '.join(preparer.quote(c) for c in columns)}) "
+                f"VALUES ({', '.join(placeholder(n, c) for n, c in enumerate(columns))})"
+            )
+            json_positions = [n for n, c in enumerate(columns) if isinstance(table.c[c].type, JSON)]
+            statement = self._statements[table.name] = (sql, itemgetter(*columns), json_positions)
+        return statement
+
+    async def add(self, table, row: Dict[str, Any]) -> None:
+        rows = self.pending.setdefault(table, [])
+        rows.append(row)
+        if len(rows) >= self.batch_size:
+            await self.flush()
+
+    async def flush(self) -> None:
+        for table, rows in self.pending.items():
+            if not rows:
+                continue
+            columns = list(rows[0])
+            sql, getter, json_positions = self._statement(table, columns)
+            params = [getter(row) for row in rows]
+            if json_positions:
+                params = [list(values) for values in params]
+                for values in params:
+                    for n in json_positions:
+                        # Большинство значений - пустые [] и {}: сериализуем без вызова json
+                        values[n] = json.dumps(values[n], ensure_ascii=False) if values[n] else EMPTY_JSON[type(values[n])]
+                params = [tuple(values) for values in params]
+            if self.conn.dialect.paramstyle == "named":
+                params = [dict(zip(columns, values)) for values in params]
+            await self.conn.exec_driver_sql(sql, params)
+            self.counts.add(table.name, len(rows))
+            rows.clear()
+        await self.conn.commit()
+
+
+def split_total(total: int, weights: List[float], minimum: int, maximum: int) -> List[int]:
+    """Делит total пропорционально весам, с ограничениями на каждую часть."""
+    weight_sum = sum(weights)
+    return [min(maximum, max(minimum, round(total * w / weight_sum))) for w in weights]
+
+
+def pick_distinct(rng: random.Random, cum_weights: List[float], k: int) -> List[int]:
+    """k разных индексов с вероятностью, пропорциональной весам."""
+    total = cum_weights[-1]
+    n = len(cum_weights)
+    chosen: Dict[int, None] = {}
+    attempts = 0
+    while len(chosen) < k:
+        index = bisect.bisect(cum_weights, rng.random() * total)
+        chosen[min(index, n - 1)] = None
+        attempts += 1
+        if attempts > k * 20:
+            # Почти все веса у нескольких игроков: добираем равномерно
+            for index in rng.sample(range(n), k):
+                if len(chosen) == k:
+                    break
+                chosen[index] = None
+    return list(chosen)
+
+
+class MatchRules:
+    """
+    Расчет MMR матча, как в handlers/match_handlers.py (без бонусов за достижения).
+    Функции из utils/mmr_calculator.py зависят только от MMR пары, поэтому
+    результаты запоминаются: в одном соревновании пары MMR часто повторяются.
+    """
+
+    def __init__(self, competition):
+        self.competition = competition
+        self._memo: Dict[tuple, int] = {}
+
+    def _formula(self, player_mmr: int, opponent_mmr: int) -> int:
+        key = (player_mmr, opponent_mmr)
+        change = self._memo.get(key)
+        if change is None:
+            change = self._memo[key] = calculate_mmr_change_by_formula(self.competition, player_mmr, opponent_mmr)
+        return change
+
+    def _range_change(self, player_mmr: int, opponent_mmr: int, is_winner: bool) -> int:
+        # Правило диапазона выбирается по модулю разницы MMR
+        key = (abs(opponent_mmr - player_mmr), is_winner)
+        change = self._memo.get(key)
+        if change is None:
+            change = self._memo[key] = calculate_mmr_change_by_ranges(self.competition, player_mmr, opponent_mmr, is_winner)
+        return change
+
+    def _ranges_total(self, player_mmr: int, mmrs: List[int], is_winner: bool) -> int:
+        """Сумма изменений по парам с каждым оппонентом (горячий цикл больших матчей)."""
+        memo = self._memo
+        total = 0
+        for opponent_mmr in mmrs:
+            change = memo.get((abs(opponent_mmr - player_mmr), is_winner))
+            if change is None:
+                change = self._range_change(player_mmr, opponent_mmr, is_winner)
+            total += change
+        # В mmrs есть и сам игрок: вычитаем пару с самим собой
+        return total - self._range_change(player_mmr, player_mmr, is_winner)
+
+    def changes(self, mmrs: List[int], winner: int) -> List[int]:
+        changes = []
+        count = len(mmrs)
+        total_mmr = sum(mmrs)
+        for j, player_mmr in enumerate(mmrs):
+            is_winner = j == winner
+            if self.competition.use_formula:
+                delta_abs = self._formula(player_mmr, int((total_mmr - player_mmr) / (count - 1)))
+                changes.append(delta_abs if is_winner else -delta_abs)
+            else:
+                changes.append(round(self._ranges_total(player_mmr, mmrs, is_winner) / (count - 1)))
+        return changes
+
+
+async def next_id(conn, model) -> int:
+    return ((await conn.execute(select(func.max(model.id)))).scalar() or 0) + 1
+
+
+async def generate(args) -> Counts:
+    rng = random.Random(args.seed)
+    counts = Counts()
+    engine = get_engine()
+    await init_db()
+
+    match_indexes = list(models.Match.__table__.indexes) + list(models.MatchParticipant.__table__.indexes)
+
+    async with engine.connect() as conn:
+        if engine.dialect.name == "sqlite":
+            # База одноразовая: при сбое генерацию проще повторить, чем ждать fsync на каждую пачку
+            await conn.execute(text("PRAGMA synchronous=OFF"))
+            await conn.execute(text("PRAGMA journal_mode=MEMORY"))
+
+        user_start = await next_id(conn, models.User)
+        competition_start = await next_id(conn, models.Competition)
+        player_start = await next_id(conn, models.Player)
+        match_start = await next_id(conn, models.Match)
+        participant_start = await next_id(conn, models.MatchParticipant)
+
+        writer = BatchWriter(conn, args.batch_size, counts)
+
+        # --- Пользователи ---
+        stage = time.perf_counter()
+        user_ids = list(range(user_start, user_start + args.users))
+        for user_id in user_ids:
+            has_username = rng.random() < 0.85
+            username = f"user{user_id}" if has_username else None
+            await writer.add(models.User.__table__, {
+                "id": user_id,
+                "user_id": TELEGRAM_ID_BASE + user_id,
+                "username": username,
+                "username_lower": username,
+                "full_name": f"Игрок {user_id}",
+            })
+        await writer.flush()
+        print(f"Пользователи: {args.users} за {time.perf_counter() - stage:.1f} с")
+
+        # --- Соревнования и размеры ---
+        size_weights = [rng.lognormvariate(0, 1.2) for _ in range(args.competitions)]
+        player_counts = split_total(args.players, size_weights, 2, args.users)
+        participant_targets = split_total(
+            args.participants, [n * rng.uniform(0.5, 1.5) for n in player_counts], 2, args.participants
+        )
+
+        # Индексы матчей обновлялись бы на каждой вставке; дешевле построить их один раз в конце
+        for drop in match_indexes:
+            await conn.run_sync(lambda sync_conn, index=drop: index.drop(sync_conn, checkfirst=True))
+        try:
+            stage = time.perf_counter()
+            match_id = match_start
+            participant_id = participant_start
+            player_id = player_start
+            end_time = args.end_time
+            span = args.days * 86400
+            formats = [f[0] for f in MATCH_FORMATS]
+            versions: List[Dict[str, int]] = []
+
+            for n in range(args.competitions):
+                competition_id = competition_start + n
+                use_formula = rng.random() < args.formula_share
+                achievements = dict(rng.sample(ACHIEVEMENT_POOL, rng.randint(2, 6)))
+                competition = SimpleNamespace(
+                    use_formula=use_formula,
+                    formula=rng.choice(FORMULAS) if use_formula else None,
+                    range_rules=None if use_formula else rng.choice(RANGE_RULE_SETS),
+                )
+                rules = MatchRules(competition)
+                start_mmr = rng.choice([0, 1000, 1000, 1200])
+                members = rng.sample(user_ids, player_counts[n])
+                _, sizes, size_weights_ = rng.choices(MATCH_FORMATS, weights=formats)[0]
+                sizes = [s for s in sizes if s <= len(members)] or [len(members)]
+                size_weights_ = size_weights_[:len(sizes)]
+
+                # Скрытые параметры игроков: скилл (шанс победы) и активность (доля матчей)
+                skill = [math.exp(rng.gauss(0, 0.5)) for _ in members]
+                cum_activity = list(itertools.accumulate(min(rng.paretovariate(1.5), 50.0) for _ in members))
+                mmr = [start_mmr] * len(members)
+                wins = [0] * len(members)
+                losses = [0] * len(members)
+                streak = [0] * len(members)
+                earned: Dict[int, Dict[str, int]] = {}
+                # Достижения с весами по Ципфу: первое в списке встречается чаще остальных
+                ach_names = list(achievements)
+                ach_probability = [0.25 / (rank + 1) for rank in range(len(ach_names))]
+
+                await writer.add(models.Competition.__table__, {
+                    "id": competition_id,
+                    "name": f"synth_{competition_id}",
+                    "chat_id": -1_000_000_000_000 - competition_id,
+                    "creator_id": members[0],
+                    "start_mmr": start_mmr,
+                    "use_formula": use_formula,
+                    "formula": competition.formula,
+                    "range_rules": competition.range_rules or [],
+                    "ranks": RANKS,
+                    "achievements": achievements,
+                    "admins": [],
+                    "version": 0,
+                })
+                await writer.add(models.CompetitionAdmin.__table__, {"competition_id": competition_id, "user_id": members[0]})
+
+                # Матчи соревнования идут подряд по времени: первые - args.days дней назад
+                started_at = end_time - rng.randrange(span // 4, span + 1)
+                generated = 0
+                timestamp = started_at
+                matches = 0
+                while generated < participant_targets[n]:
+                    size = rng.choices(sizes, weights=size_weights_)[0]
+                    local = pick_distinct(rng, cum_activity, size)
+                    match_skill = [skill[i] for i in local]
+                    winner = bisect.bisect(list(itertools.accumulate(match_skill)), rng.random() * sum(match_skill))
+                    winner = min(winner, size - 1)
+                    changes = rules.changes([mmr[i] for i in local], winner)
+
+                    timestamp += rng.randrange(1, max(2, 2 * (end_time - started_at) * size // participant_targets[n]))
+                    await writer.add(models.Match.__table__, {
+                        "id": match_id,
+                        "competition_id": competition_id,
+                        "winner_id": members[local[winner]],
+                        "timestamp": min(timestamp, end_time),
+                    })
+                    for j, i in enumerate(local):
+                        is_winner = j == winner
+                        gained = [
+                            name for name, probability in zip(ach_names, ach_probability)
+                            if rng.random() < probability * (2 if is_winner else 0.5)
+                        ]
+                        bonus = sum(achievements[name] for name in gained)
+                        mmr[i] = max(mmr[i] + changes[j] + bonus, 0)
+                        if is_winner:
+                            wins[i] += 1
+                            streak[i] = streak[i] + 1 if streak[i] >= 0 else 1
+                        else:
+                            losses[i] += 1
+                            streak[i] = streak[i] - 1 if streak[i] <= 0 else -1
+                        if gained:
+                            player_earned = earned.setdefault(i, {})
+                            for name in gained:
+                                player_earned[name] = player_earned.get(name, 0) + 1
+                        await writer.add(models.MatchParticipant.__table__, {
+                            "id": participant_id,
+                            "match_id": match_id,
+                            "user_id": members[i],
+                            "mmr_change": changes[j],
+                            "is_winner": is_winner,
+                            "achievements_gained": gained,
+                        })
+                        participant_id += 1
+                    match_id += 1
+                    matches += 1
+                    generated += size
+
+                # Итоговая статистика игроков после всех матчей
+                for i, user_id in enumerate(members):
+                    await writer.add(models.Player.__table__, {
+                        "id": player_id + i,
+                        "competition_id": competition_id,
+                        "user_id": user_id,
+                        "mmr": mmr[i],
+                        "wins": wins[i],
+                        "losses": losses[i],
+                        "streak": streak[i],
+                        "achievements": {},
+                    })
+                for i, player_earned in earned.items():
+                    for name, count in player_earned.items():
+                        await writer.add(models.PlayerAchievement.__table__, {
+                            "player_id": player_id + i,
+                            "competition_id": competition_id,
+                            "achievement": name,
+                            "count": count,
+                        })
+                player_id += len(members)
+                versions.append({"competition_id": competition_id, "version": matches})
+                if args.progress and (n + 1) % args.progress == 0:
+                    elapsed = time.perf_counter() - stage
+                    print(f"  соревнований {n + 1}/{args.competitions}, участников матчей {participant_id - participant_start} ({elapsed:.0f} с)")
+
+            await writer.flush()
+            # version - число изменений топа, как после create_match на каждый матч
+            competitions = models.Competition.__table__
+            await conn.execute(
+                update(competitions).where(competitions.c.id == bindparam("competition_id")).values(version=bindparam("version")),
+                versions,
+            )
+            await conn.commit()
+            print(f"Соревнования и матчи за {time.perf_counter() - stage:.1f} с")
+        finally:
+            stage = time.perf_counter()
+            for index in match_indexes:
+                await conn.run_sync(lambda sync_conn, index=index: index.create(sync_conn, checkfirst=True))
+            await conn.commit()
+            print(f"Индексы матчей за {time.perf_counter() - stage:.1f} с")
+
+    await engine.dispose()
+    return counts
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Генерация синтетической базы для нагрузочного тестирования")
+    parser.add_argument("--users", type=int, default=10_000, help="Число пользователей")
+    parser.add_argument("--competitions", type=int, default=50, help="Число соревнований")
+    parser.add_argument("--players", type=int, default=30_000, help="Всего участий в соревнованиях (игроков)")
+    parser.add_argument("--participants", type=int, default=200_000, help="Всего участников матчей")
+    parser.add_argument("--formula-share", type=float, default=0.3, help="Доля соревнований с формулой MMR")
+    parser.add_argument("--days", type=int, default=365, help="За сколько дней распределены матчи")
+    parser.add_argument("--end-time", type=int, default=DEFAULT_END_TIME, help="Unix time последнего матча")
+    parser.add_argument("--seed", type=int, default=1, help="Seed генератора")
+    parser.add_argument("--batch-size", type=int, default=20_000, help="Строк в одной вставке")
+    parser.add_argument("--progress", type=int, default=100, help="Печатать прогресс каждые N соревнований (0 - нет)")
+    args = parser.parse_args()
+
+    setup_logging()
+    started = time.perf_counter()
+    counts = asyncio.run(generate(args))
+    elapsed = time.perf_counter() - started
+    total = sum(counts.rows.values())
+    for table, count in counts.rows.items():
+        print(f"{table:<22} {count:>12}")
+    print(f"Всего {total} строк за {elapsed:.1f} с ({total / elapsed:.0f} строк/с)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+# scripts/post_updates.py
+"""
+Отправляет записанные апдейты Telegram на локальный вебхук бота.
+
+Файл - JSON-массив апдейтов или по одному апдейту в строке (JSON Lines).
+Пример:
+    BOT_MODE=webhook python main.py
+    python scripts/post_updates.py updates.jsonl --url http://127.0.0.1:8080/webhook --secret $WEBHOOK_SECRET
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+from typing import Any, Dict, List, Optional
+
+from aiohttp import ClientSession
+
+
+def load_updates(path: str) -> List[Dict[str, Any]]:
+    """Читает апдейты из JSON-массива или JSON Lines."""
+    with open(path, encoding="utf-8") as f:
+        content = f.read().strip()
+    if content.startswith("["):
+        return json.loads(content)
+    return [json.loads(line) for line in content.splitlines() if line.strip()]
+
+
+async def post_updates(
+    updates: List[Dict[str, Any]],
+    url: str,
+    secret: Optional[str],
+    concurrency: int
+) -> None:
+    headers = {"X-Telegram-Bot-Api-Secret-Token": secret} if secret else {}
+    semaphore = asyncio.Semaphore(concurrency)
+    failed = 0
+
+    async with ClientSession() as session:
+        async def post(update: Dict[str, Any]) -> None:
+            nonlocal failed
+            async with semaphore:
+                async with session.post(url, json=update, headers=headers) as response:
+                    if response.status != 200:
+                        failed += 1
+                        print(f"update_id={update.get('update_id')}: HTTP {response.status} {await response.text()}")
+
+        started = time.perf_counter()
+        await asyncio.gather(*(post(update) for update in updates))
+        elapsed = time.perf_counter() - started
+
+    print(f"Отправлено {len(updates)} апдейтов за {elapsed:.2f} с, ошибок: {failed}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Отправка записанных апдейтов на вебхук бота")
+    parser.add_argument("file", help="JSON-массив или JSON Lines с апдейтами")
+    parser.add_argument(
+        "--url",
+        default=f"http://127.0.0.1:{os.getenv('WEBHOOK_PORT', '8080')}{os.getenv('WEBHOOK_PATH', '/webhook')}",
+        help="Адрес вебхука (по умолчанию из WEBHOOK_PORT/WEBHOOK_PATH)"
+    )
+    parser.add_argument("--secret", default=os.getenv("WEBHOOK_SECRET"), help="Секретный токен вебхука")
+    parser.add_argument("--concurrency", type=int, default=1, help="Сколько запросов отправлять параллельно")
+    args = parser.parse_args()
+
+    asyncio.run(post_updates(load_updates(args.file), args.url, args.secret, args.concurrency))
+
+
+if __name__ == "__main__":
+    main()
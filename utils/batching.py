@@ -0,0 +1,90 @@
+# utils/batching.py
+"""
+Буферы отложенной записи: накапливают изменения в памяти и сбрасывают их пачкой.
+"""
+import asyncio
+import logging
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Hashable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class CoalescingBuffer(ABC):
+    """
+    Буфер с объединением записей по ключу (последняя запись побеждает).
+
+    Сбрасывается каждые flush_interval секунд или сразу после накопления
+    max_items записей. Наследники реализуют write(), который получает все
+    накопленные записи одним словарем.
+    """
+
+    def __init__(self, flush_interval: float = 5.0, max_items: int = 500):
+        self.flush_interval = flush_interval
+        self.max_items = max_items
+        self._pending: Dict[Hashable, Any] = {}
+        self._flush_requested = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._flush_lock = asyncio.Lock()
+
+    def put(self, key: Hashable, value: Any) -> None:
+        """Ставит запись в очередь на запись."""
+        self._pending[key] = value
+        if len(self._pending) >= self.max_items:
+            self._flush_requested.set()
+
+    def get_pending(self, key: Hashable, default: Any = None) -> Any:
+        """Возвращает еще не записанное значение по ключу."""
+        return self._pending.get(key, default)
+
+    @property
+    def pending_count(self) -> int:
+        return len(self._pending)
+
+    @property
+    def running(self) -> bool:
+        """Запущена ли фоновая задача сброса."""
+        return self._task is not None
+
+    @abstractmethod
+    async def write(self, items: Dict[Hashable, Any]) -> None:
+        """Записывает пачку накопленных записей. Реализуется наследниками."""
+
+    async def flush(self) -> None:
+        """Немедленно записывает все накопленные записи."""
+        async with self._flush_lock:
+            if not self._pending:
+                return
+            items, self._pending = self._pending, {}
+            try:
+                await self.write(items)
+            except Exception as e:
+                logger.error(f"Ошибка записи буфера {type(self).__name__} ({len(items)} записей): {e}", exc_info=True)
+                # Возвращаем записи в очередь, не затирая более свежие значения
+                for key, value in items.items():
+                    self._pending.setdefault(key, value)
+
+    async def start(self) -> None:
+        """Запускает фоновую задачу периодического сброса."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Останавливает фоновую задачу и сбрасывает остаток буфера."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_requested.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_requested.clear()
+            await self.flush()
@@ -0,0 +1,69 @@
+# utils/cache.py
+"""
+Простые in-memory кэши для горячих путей бота.
+"""
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+
+_MISSING = object()
+
+# Кэши с именем: их попадания/промахи публикуются в метриках (utils/metrics.py)
+_named_caches: Dict[str, "LRUCache"] = {}
+
+
+def named_caches() -> Dict[str, "LRUCache"]:
+    """Все именованные кэши процесса: имя -> кэш."""
+    return dict(_named_caches)
+
+
+class LRUCache:
+    """
+    Кэш с ограничением по количеству записей (LRU) и опциональным TTL.
+
+    Не потокобезопасен: рассчитан на использование внутри одного event loop.
+    Если задан name, кэш регистрируется в named_caches().
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: Optional[float] = None, name: Optional[str] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()  # key -> (value, expires_at)
+        self.hits = 0
+        self.misses = 0
+        if name:
+            _named_caches[name] = self
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Возвращает значение по ключу или default, если его нет или оно устарело."""
+        item = self._data.get(key, _MISSING)
+        if item is _MISSING:
+            self.misses += 1
+            return default
+        value, expires_at = item
+        if expires_at is not None and expires_at < time.monotonic():
+            del self._data[key]
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        """Сохраняет значение, вытесняя самые старые записи при переполнении."""
+        expires_at = time.monotonic() + self.ttl if self.ttl is not None else None
+        self._data[key] = (value, expires_at)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key: Hashable) -> None:
+        """Удаляет запись, если она есть."""
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
@@ -0,0 +1,91 @@
+# utils/fsm_sweeper.py
+"""
+Удаление брошенных сценариев FSM (мастер создания соревнования).
+
+Раз в interval секунд удаляет состояния, не менявшиеся дольше ttl, и
+сообщает пользователю, что черновик удален. Работает с DatabaseStorage
+и TrackingMemoryStorage (database/fsm_storage.py). Число пользователей
+внутри сценариев доступно в stats().
+"""
+import asyncio
+import logging
+import os
+from typing import Any, Dict, Optional
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramAPIError
+
+logger = logging.getLogger(__name__)
+
+EXPIRED_DRAFT_TEXT = (
+    "⌛ Черновик соревнования удален: вы долго не продолжали создание.\n"
+    "Чтобы начать заново, нажмите /start."
+)
+
+
+class FSMSweeper:
+    """Фоновая очистка состояний FSM старше ttl."""
+
+    def __init__(self, storage, ttl: float = 86400, interval: float = 600):
+        self.storage = storage
+        self.ttl = ttl
+        self.interval = interval
+        self.live_wizards = 0
+        self.expired_total = 0
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self, bot: Bot) -> None:
+        if self._task is None and self.ttl > 0:
+            self._task = asyncio.create_task(self._run(bot))
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self, bot: Bot) -> None:
+        while True:
+            try:
+                await self.sweep(bot)
+            except Exception as e:
+                logger.error(f"Ошибка очистки состояний FSM: {e}", exc_info=True)
+            await asyncio.sleep(self.interval)
+
+    async def sweep(self, bot: Bot) -> int:
+        """Удаляет просроченные сценарии и уведомляет их владельцев. Возвращает число удаленных."""
+        expired = await self.storage.expire_stale(self.ttl)
+        for record in expired:
+            if record.state is None:
+                continue
+            try:
+                await bot.send_message(record.chat_id, EXPIRED_DRAFT_TEXT)
+            except TelegramAPIError as e:
+                # Пользователь мог заблокировать бота - это не ошибка очистки
+                logger.info(f"Не удалось уведомить {record.user_id} об удалении черновика: {e}")
+        self.expired_total += len(expired)
+        self.live_wizards = await self.storage.count_active()
+        if expired:
+            logger.info(f"FSM: удалено брошенных сценариев: {len(expired)}, активных: {self.live_wizards}.")
+        return len(expired)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"live_wizards": self.live_wizards, "expired_total": self.expired_total}
+
+
+_fsm_sweeper: Optional[FSMSweeper] = None
+
+
+def get_fsm_sweeper(storage) -> FSMSweeper:
+    """Ленивая инициализация очистки FSM для хранилища диспетчера."""
+    global _fsm_sweeper
+    if _fsm_sweeper is None:
+        _fsm_sweeper = FSMSweeper(
+            storage,
+            ttl=float(os.getenv("FSM_TTL", "86400")),
+            interval=float(os.getenv("FSM_SWEEP_INTERVAL", "600")),
+        )
+    return _fsm_sweeper
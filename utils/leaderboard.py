@@ -0,0 +1,173 @@
+# utils/leaderboard.py
+"""
+Форматирование топа игроков соревнования.
+Используется командой 'топ' и живым закрепленным топом.
+"""
+import html
+import os
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from database import crud
+from utils.cache import LRUCache
+
+# Лимит длины сообщения Telegram. Считаем по HTML-тексту вместе с тегами - с запасом
+MESSAGE_LIMIT = 4096
+
+# Отрисованные страницы топа: (competition_id, version, N, курсор) -> LeaderboardPage.
+# Версия соревнования растет при каждом матче, поэтому устаревшие записи
+# просто перестают запрашиваться и вытесняются LRU. TTL ограничивает
+# устаревание имен пользователей (смена username не меняет версию).
+_page_cache = LRUCache(
+    maxsize=int(os.getenv("LEADERBOARD_CACHE_SIZE", "1000")),
+    ttl=float(os.getenv("LEADERBOARD_CACHE_TTL", "600")),
+    name="leaderboard_page",
+)
+
+
+def make_rank_resolver(ranks: Optional[List[Dict[str, Any]]]) -> Callable[[int], str]:
+    """Возвращает функцию MMR -> название ранга по конфигурации рангов соревнования."""
+    sorted_ranks_config = sorted(
+        ranks or [],
+        key=lambda r: r.get('mmr_threshold', 0),
+        reverse=True
+    )
+
+    def get_rank_name(mmr: int) -> str:
+        """Определяет название ранга по MMR."""
+        for rank_config in sorted_ranks_config:
+            if mmr >= rank_config.get('mmr_threshold', 0):
+                return rank_config.get('name', 'Без ранга')
+        return 'Без ранга'
+
+    return get_rank_name
+
+
+def format_leaderboard_line(place: int, player, get_rank_name: Callable[[int], str]) -> str:
+    """Строка топа (HTML): место, игрок, MMR, ранг и ID игрока."""
+    user = player.user
+    username = f"@{user.username}" if user.username else f"ID:{user.user_id}"
+    return (
+        f"{place}. {html.escape(username)}, MMR: {player.mmr}, "
+        f"Ранг: {html.escape(get_rank_name(player.mmr))}, ID: {player.id}"
+    )
+
+
+def _header(competition, start: int, count: int) -> str:
+    name = html.escape(competition.name)
+    if start == 1:
+        return f"🏆 <b>Топ {count} игроков</b> в соревновании '<i>{name}</i>':"
+    return f"🏆 <b>Места {start}–{start + count - 1}</b> в соревновании '<i>{name}</i>':"
+
+
+def render_leaderboard(competition, players: List, start: int = 1, keep_end: bool = False) -> Tuple[str, List, int]:
+    """
+    Текст топа (HTML). players уже отсортированы по MMR, start - место первого игрока.
+    Текст помещается в MESSAGE_LIMIT: лишние игроки отбрасываются с конца страницы
+    (keep_end=True - с начала, для перехода назад).
+    Возвращает текст, показанных игроков и место первого из них.
+    """
+    get_rank_name = make_rank_resolver(competition.ranks)
+    lines = [format_leaderboard_line(i, player, get_rank_name) for i, player in enumerate(players, start=start)]
+    # Заголовок при полном списке не короче заголовка при урезанном
+    budget = MESSAGE_LIMIT - len(_header(competition, start, len(players)))
+    order = range(len(lines) - 1, -1, -1) if keep_end else range(len(lines))
+    count = 0
+    for n in order:
+        budget -= len(lines[n]) + 1
+        if budget < 0:
+            break
+        count += 1
+    count = max(count, 1)
+    if keep_end:
+        dropped = len(players) - count
+        players, lines, start = players[dropped:], lines[dropped:], start + dropped
+    else:
+        players, lines = players[:count], lines[:count]
+    return "\n".join([_header(competition, start, count)] + lines), players, start
+
+
+class LeaderboardPage(NamedTuple):
+    """Отрисованная страница топа и курсоры для соседних страниц."""
+    text: str
+    start_rank: int               # Место первого игрока на странице
+    first: Tuple[int, int]        # Курсор (mmr, player_id) первого игрока
+    last: Tuple[int, int]         # Курсор (mmr, player_id) последнего игрока
+    count: int                    # Игроков на странице (меньше size, если текст не влез в лимит)
+    has_prev: bool
+    has_next: bool
+
+
+async def get_leaderboard_page(
+    db,
+    competition,
+    size: int,
+    after: Optional[Tuple[int, int]] = None,
+    before: Optional[Tuple[int, int]] = None,
+    inclusive: bool = False,
+    start_rank: int = 1
+) -> Optional[LeaderboardPage]:
+    """
+    Страница топа из кэша или из БД (keyset-пагинация, см. crud.get_leaderboard_page).
+    start_rank - место первого игрока страницы, известное вызывающему (из курсора кнопки).
+    Возвращает None, если на странице нет игроков.
+    """
+    key = (competition.id, competition.version, size, after, before, inclusive, start_rank)
+    page = _page_cache.get(key)
+    if page is not None:
+        return page
+
+    # Запрашиваем на одного игрока больше, чтобы узнать, есть ли следующая/предыдущая страница
+    players = await crud.get_leaderboard_page(
+        db, competition.id, size + 1, after=after, before=before, inclusive=inclusive
+    )
+    if before is not None:
+        has_prev = len(players) > size
+        players = players[-size:]
+        has_next = True
+        if not has_prev:
+            start_rank = 1
+    else:
+        has_next = len(players) > size
+        players = players[:size]
+        has_prev = start_rank > 1
+
+    if not players:
+        return None
+
+    start_rank = max(start_rank, 1)
+    # Длинные имена и ранги: страница урезается до лимита сообщения Telegram
+    shown = len(players)
+    text, players, start_rank = render_leaderboard(competition, players, start_rank, keep_end=before is not None)
+    if len(players) < shown:
+        if before is not None:
+            has_prev = True
+        else:
+            has_next = True
+    page = LeaderboardPage(
+        text=text,
+        start_rank=start_rank,
+        first=(players[0].mmr, players[0].id),
+        last=(players[-1].mmr, players[-1].id),
+        count=len(players),
+        has_prev=has_prev,
+        has_next=has_next,
+    )
+    _page_cache.set(key, page)
+    return page
+
+
+async def get_player_leaderboard_page(db, competition, size: int, player) -> Optional[LeaderboardPage]:
+    """Страница топа, на которой игрок находится примерно посередине."""
+    position = await crud.get_player_position(db, player)
+    players_above = await crud.get_leaderboard_page(
+        db, competition.id, size // 2, before=(player.mmr, player.id)
+    )
+    first = players_above[0] if players_above else player
+    return await get_leaderboard_page(
+        db,
+        competition,
+        size,
+        after=(first.mmr, first.id),
+        inclusive=True,
+        start_rank=position - len(players_above),
+    )
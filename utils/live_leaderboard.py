@@ -0,0 +1,141 @@
+# utils/live_leaderboard.py
+"""
+Живой закрепленный топ соревнования.
+
+После каждого матча хендлер вызывает schedule(). Обновления объединяются
+по чату: в одном чате может быть несколько соревнований, а флуд-лимит
+Telegram считается на чат, поэтому правки в чате идут не чаще раза в
+interval секунд, и только если текст топа действительно изменился.
+"""
+import asyncio
+import html
+import logging
+import os
+import time
+from typing import Dict, Optional
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest
+
+from database import crud, get_sessionmaker
+from utils.leaderboard import get_leaderboard_page
+
+logger = logging.getLogger(__name__)
+
+
+class LiveLeaderboard:
+    """Планировщик отложенных правок закрепленных сообщений с топом."""
+
+    def __init__(self, interval: float = 10.0, size: int = 20):
+        self.interval = interval
+        self.size = size
+        # Состояние правок - по чату, хэш текста - по соревнованию (свое сообщение)
+        self._tasks: Dict[int, asyncio.Task] = {}
+        self._pending: Dict[int, Dict[int, None]] = {}  # chat_id -> соревнования в очереди (по порядку)
+        self._last_edit: Dict[int, float] = {}
+        self._last_hash: Dict[int, int] = {}
+
+    def schedule(self, bot: Bot, competition_id: int, chat_id: int) -> None:
+        """Запланировать обновление топа. Повторные вызовы до правки объединяются."""
+        self._pending.setdefault(chat_id, {})[competition_id] = None
+        self._start(bot, chat_id)
+
+    def _start(self, bot: Bot, chat_id: int) -> None:
+        if chat_id in self._tasks:
+            return
+        delay = max(0.0, self._last_edit.get(chat_id, 0.0) + self.interval - time.monotonic())
+        self._tasks[chat_id] = asyncio.create_task(self._refresh_later(bot, chat_id, delay))
+
+    def forget(self, competition_id: int) -> None:
+        """Сбросить состояние соревнования (живой топ выключен или пересоздан)."""
+        for pending in self._pending.values():
+            pending.pop(competition_id, None)
+        self._last_hash.pop(competition_id, None)
+
+    async def render(self, db, competition) -> str:
+        """Текст живого топа соревнования."""
+        page = await get_leaderboard_page(db, competition, self.size)
+        if not page:
+            return f"🏆 В соревновании '<i>{html.escape(competition.name)}</i>' пока нет игроков."
+        return page.text
+
+    async def _refresh_later(self, bot: Bot, chat_id: int, delay: float) -> None:
+        try:
+            if delay:
+                await asyncio.sleep(delay)
+        finally:
+            # Апдейты, пришедшие во время правки, запланируют следующую
+            if self._tasks.get(chat_id) is asyncio.current_task():
+                del self._tasks[chat_id]
+        pending = self._pending.get(chat_id)
+        if not pending:
+            self._pending.pop(chat_id, None)
+            return
+        # Одна правка за интервал: остальные соревнования чата - в следующих
+        competition_id = next(iter(pending))
+        del pending[competition_id]
+        self._last_edit[chat_id] = time.monotonic()
+        try:
+            await self.refresh(bot, competition_id)
+        except Exception as e:
+            logger.error(f"Ошибка обновления живого топа соревнования {competition_id}: {e}", exc_info=True)
+        if pending:
+            self._start(bot, chat_id)
+        else:
+            self._pending.pop(chat_id, None)
+
+    async def refresh(self, bot: Bot, competition_id: int) -> None:
+        """Перерисовывает топ и редактирует закрепленное сообщение, если текст изменился."""
+        AsyncSessionLocal = get_sessionmaker()
+        async with AsyncSessionLocal() as db:
+            competition = await crud.get_competition_by_id(db, competition_id)
+            if not competition or not competition.leaderboard_message_id:
+                return
+            text = await self.render(db, competition)
+
+            text_hash = hash(text)
+            if self._last_hash.get(competition_id) == text_hash:
+                logger.debug(f"Живой топ соревнования {competition_id} не изменился, правка пропущена.")
+                return
+
+            try:
+                await bot.edit_message_text(
+                    text=text,
+                    chat_id=competition.chat_id,
+                    message_id=competition.leaderboard_message_id,
+                    parse_mode='HTML'
+                )
+            except TelegramBadRequest as e:
+                if "message is not modified" in e.message:
+                    pass
+                elif "message to edit not found" in e.message:
+                    # Сообщение удалили из чата - выключаем живой топ
+                    logger.warning(f"Сообщение живого топа соревнования {competition_id} удалено, топ выключен.")
+                    await crud.set_competition_leaderboard_message(db, competition_id, None)
+                    self.forget(competition_id)
+                    return
+                else:
+                    raise
+            self._last_hash[competition_id] = text_hash
+
+    async def stop(self) -> None:
+        """Отменяет запланированные правки (при остановке бота)."""
+        tasks = list(self._tasks.values())
+        self._tasks.clear()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+_live_leaderboard: Optional[LiveLeaderboard] = None
+
+
+def get_live_leaderboard() -> LiveLeaderboard:
+    """Ленивая инициализация живого топа."""
+    global _live_leaderboard
+    if _live_leaderboard is None:
+        _live_leaderboard = LiveLeaderboard(
+            interval=float(os.getenv("LIVE_LEADERBOARD_INTERVAL", "10")),
+            size=int(os.getenv("LIVE_LEADERBOARD_SIZE", "20")),
+        )
+    return _live_leaderboard
@@ -0,0 +1,106 @@
+# utils/logging_setup.py
+"""
+Настройка логирования из переменных окружения.
+
+Запись в stdout/файл выполняет отдельный поток (QueueHandler ->
+QueueListener), поэтому медленный вывод не блокирует event loop.
+
+- LOG_LEVEL - уровень корневого логгера (по умолчанию DEBUG);
+- LOG_LEVELS - уровни отдельных логгеров: "aiogram.event=INFO,sqlalchemy=WARNING";
+- LOG_FORMAT - формат строки;
+- LOG_FILE - дополнительно писать в файл;
+- LOG_DEBUG_SAMPLE_EVERY - из DEBUG-сообщений одного места в коде
+  пропускать каждое N-е (1 - все);
+- LOG_QUEUE=0 - писать синхронно (например, при отладке падений).
+"""
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+from typing import Dict, Optional, Tuple
+
+DEFAULT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class DebugSamplingFilter(logging.Filter):
+    """Пропускает каждое every-е DEBUG-сообщение из одной строки кода; остальные уровни - все."""
+
+    def __init__(self, every: int):
+        super().__init__()
+        self.every = every
+        self._counters: Dict[Tuple[str, int], int] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno != logging.DEBUG or self.every <= 1:
+            return True
+        key = (record.pathname, record.lineno)
+        with self._lock:
+            count = self._counters.get(key, 0)
+            self._counters[key] = count + 1
+        return count % self.every == 0
+
+
+def parse_logger_levels(spec: str) -> Dict[str, int]:
+    """'aiogram=INFO,sqlalchemy.engine=WARNING' -> {'aiogram': 20, 'sqlalchemy.engine': 30}."""
+    levels = {}
+    for item in spec.split(","):
+        if "=" not in item:
+            continue
+        name, level = item.split("=", 1)
+        levels[name.strip()] = logging.getLevelName(level.strip().upper())
+    return {name: level for name, level in levels.items() if isinstance(level, int)}
+
+
+def setup_logging() -> None:
+    """Настраивает корневой логгер. Повторный вызов заменяет прежнюю настройку."""
+    global _listener
+    formatter = logging.Formatter(os.getenv("LOG_FORMAT", DEFAULT_FORMAT))
+    handlers = [logging.StreamHandler(sys.stdout)]
+    log_file = os.getenv("LOG_FILE")
+    if log_file:
+        handlers.append(logging.FileHandler(log_file, encoding="utf-8"))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+    root.setLevel(os.getenv("LOG_LEVEL", "DEBUG").upper())
+    for name, level in parse_logger_levels(os.getenv("LOG_LEVELS", "")).items():
+        logging.getLogger(name).setLevel(level)
+
+    sample_every = int(os.getenv("LOG_DEBUG_SAMPLE_EVERY", "1"))
+    if os.getenv("LOG_QUEUE", "1").lower() in ("0", "false", "no"):
+        for handler in handlers:
+            if sample_every > 1:
+                handler.addFilter(DebugSamplingFilter(sample_every))
+            root.addHandler(handler)
+        return
+
+    queue_handler = logging.handlers.QueueHandler(queue.SimpleQueue())
+    if sample_every > 1:
+        # Отсеиваем до постановки в очередь, чтобы не форматировать лишнее
+        queue_handler.addFilter(DebugSamplingFilter(sample_every))
+    root.addHandler(queue_handler)
+    _listener = logging.handlers.QueueListener(queue_handler.queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    # Дописываем очередь при выходе из процесса
+    atexit.register(stop_logging)
+
+
+def stop_logging() -> None:
+    """Останавливает поток записи логов, дописав накопленные сообщения."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -0,0 +1,202 @@
+# utils/loop_monitor.py
+"""
+Контроль задержки event loop.
+
+Пока event loop занят синхронным кодом (eval формулы MMR, большой цикл
+по участникам), бот не отвечает ни в одном чате. LoopMonitor:
+- раз в interval секунд измеряет, насколько позже запланированного
+  проснулась его задача (задержка планирования), и пишет ее в гистограмму
+  bot_loop_lag_seconds (utils/metrics.py);
+- в отдельном потоке-сторожевом следит, как давно задача просыпалась, и
+  если loop завис дольше threshold, пишет в лог стек того, что выполняется
+  в нем прямо сейчас.
+
+Для продакшена достаточно сторожевого потока. Журнал медленных
+callback-ов event loop - для разработки: ASYNCIO_DEBUG=1 включает
+debug-режим asyncio, ASYNCIO_SLOW_CALLBACK_MS задает его порог
+(loop.slow_callback_duration). Экспериментально, без debug-режима:
+ASYNCIO_SLOW_CALLBACK_PATCH=1 подменяет приватный asyncio.events.Handle._run
+(зависит от внутреннего устройства CPython и замедляет каждый callback).
+"""
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from asyncio import events
+from typing import Any, Callable, Dict, Optional
+
+from utils.metrics import Histogram
+
+logger = logging.getLogger(__name__)
+
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class LoopMonitor:
+    """Измерение задержки event loop и сторожевой поток для зависаний."""
+
+    def __init__(self, interval: float = 0.5, threshold: float = 0.25, dump_cooldown: float = 30.0):
+        self.interval = interval
+        self.threshold = threshold
+        self.dump_cooldown = dump_cooldown
+        self.lag_histogram = Histogram("bot_loop_lag_seconds", "Задержка планирования event loop.", buckets=LAG_BUCKETS)
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self.stalls = 0
+
+        self._heartbeat = time.monotonic()
+        self._loop_thread_id: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stop_watchdog = threading.Event()
+        self._last_dump = 0.0
+
+    async def start(self) -> None:
+        if self._task is not None:
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._task = asyncio.create_task(self._measure())
+        self._stop_watchdog.clear()
+        self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._watchdog.start()
+
+    async def stop(self) -> None:
+        self._stop_watchdog.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._watchdog = None
+
+    async def _measure(self) -> None:
+        while True:
+            started = time.monotonic()
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self._heartbeat = now
+            lag = max(0.0, now - started - self.interval)
+            self.last_lag = lag
+            self.max_lag = max(self.max_lag, lag)
+            self.lag_histogram.observe(lag)
+            if lag >= self.threshold:
+                logger.warning(f"Event loop был заблокирован: задержка {lag * 1000:.0f} мс.")
+
+    def _watch(self) -> None:
+        """Сторожевой поток: снимает стек event loop, пока тот завис."""
+        stalled = False
+        while not self._stop_watchdog.wait(self.threshold / 2):
+            blocked_for = time.monotonic() - self._heartbeat - self.interval
+            if blocked_for < self.threshold:
+                stalled = False
+                continue
+            if stalled:
+                continue  # Это зависание уже записано
+            stalled = True
+            self.stalls += 1
+            if time.monotonic() - self._last_dump < self.dump_cooldown:
+                continue
+            self._last_dump = time.monotonic()
+            frame = sys._current_frames().get(self._loop_thread_id)
+            stack = "".join(traceback.format_stack(frame)) if frame is not None else "стек недоступен\n"
+            logger.error(f"Event loop не отвечает {blocked_for * 1000:.0f} мс. Сейчас выполняется:\n{stack}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {"last_lag": self.last_lag, "max_lag": self.max_lag, "stalls": self.stalls}
+
+
+def _describe_callback(handle: events.Handle) -> str:
+    callback = handle._callback
+    task = getattr(callback, "__self__", None)
+    if isinstance(task, asyncio.Task):
+        coro = task.get_coro()
+        return f"задача {task.get_name()} ({getattr(coro, '__qualname__', coro)})"
+    return repr(handle)
+
+
+def install_slow_callback_logger(threshold: float) -> Callable[[], None]:
+    """
+    Экспериментально: пишет в лог callback-и event loop дольше threshold секунд,
+    подменяя приватный asyncio.events.Handle._run для всех loop-ов процесса.
+    Зависит от внутреннего устройства CPython и добавляет замер к каждому
+    callback-у. Возвращает функцию, которая восстанавливает исходный метод.
+    """
+    original_run = events.Handle._run
+    if getattr(original_run, "_slow_callback_logger", False):
+        return lambda: None
+
+    def _run(self: events.Handle) -> None:
+        started = time.perf_counter()
+        try:
+            original_run(self)
+        finally:
+            elapsed = time.perf_counter() - started
+            if elapsed >= threshold:
+                logger.warning(f"Медленный callback event loop: {elapsed * 1000:.0f} мс, {_describe_callback(self)}")
+
+    _run._slow_callback_logger = True
+    events.Handle._run = _run
+
+    def uninstall() -> None:
+        if events.Handle._run is _run:
+            events.Handle._run = original_run
+
+    return uninstall
+
+
+_uninstall_slow_callback_logger: Optional[Callable[[], None]] = None
+
+
+async def configure_asyncio_debug() -> None:
+    """
+    Включает журнал медленных callback-ов по ASYNCIO_DEBUG, ASYNCIO_SLOW_CALLBACK_MS
+    и ASYNCIO_SLOW_CALLBACK_PATCH (см. описание модуля).
+    """
+    global _uninstall_slow_callback_logger
+    slow_callback_ms = float(os.getenv("ASYNCIO_SLOW_CALLBACK_MS", "0"))
+    if os.getenv("ASYNCIO_DEBUG", "").lower() in ("1", "true", "yes"):
+        loop = asyncio.get_running_loop()
+        loop.set_debug(True)
+        if slow_callback_ms:
+            loop.slow_callback_duration = slow_callback_ms / 1000
+        logger.warning("Включен debug-режим asyncio (только для разработки).")
+    elif slow_callback_ms and os.getenv("ASYNCIO_SLOW_CALLBACK_PATCH", "").lower() in ("1", "true", "yes"):
+        _uninstall_slow_callback_logger = install_slow_callback_logger(slow_callback_ms / 1000)
+        logger.warning(
+            f"Экспериментальный журнал callback-ов event loop дольше {slow_callback_ms:.0f} мс включен "
+            "(подмена asyncio.events.Handle._run)."
+        )
+    elif slow_callback_ms:
+        logger.warning(
+            "ASYNCIO_SLOW_CALLBACK_MS действует только с ASYNCIO_DEBUG=1 "
+            "(или экспериментальным ASYNCIO_SLOW_CALLBACK_PATCH=1); журнал callback-ов не включен."
+        )
+
+
+async def restore_asyncio_debug() -> None:
+    """Снимает экспериментальную подмену Handle._run при остановке."""
+    global _uninstall_slow_callback_logger
+    if _uninstall_slow_callback_logger is not None:
+        _uninstall_slow_callback_logger()
+        _uninstall_slow_callback_logger = None
+
+
+_loop_monitor: Optional[LoopMonitor] = None
+
+
+def get_loop_monitor() -> LoopMonitor:
+    """Ленивая инициализация монитора event loop."""
+    global _loop_monitor
+    if _loop_monitor is None:
+        _loop_monitor = LoopMonitor(
+            interval=float(os.getenv("LOOP_MONITOR_INTERVAL", "0.5")),
+            threshold=float(os.getenv("LOOP_LAG_THRESHOLD_MS", "250")) / 1000,
+            dump_cooldown=float(os.getenv("LOOP_STACK_DUMP_COOLDOWN", "30")),
+        )
+    return _loop_monitor
@@ -0,0 +1,291 @@
+# utils/metrics.py
+"""
+Метрики бота в текстовом формате Prometheus.
+
+- bot_updates_total / bot_update_seconds - апдейты по типам и результату
+  (handled/unhandled/error) и время их обработки;
+- bot_handler_seconds / bot_handler_errors_total - задержка и ошибки по хендлерам;
+- bot_db_queries_total / bot_db_commits_total и гистограммы запросов/коммитов
+  на апдейт (события SQLAlchemy, апдейт определяется через contextvars);
+- bot_cache_* - попадания и промахи именованных кэшей (utils/cache.py);
+- метрики компонентов через register() и add_stats() (очередь исходящих,
+  воркеры, FSM, задержка event loop).
+
+Сервер поднимается на METRICS_HOST:METRICS_PORT (/metrics), если порт задан.
+Middleware для диспетчера - middlewares/metrics.py.
+"""
+import contextvars
+import logging
+import math
+import os
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from aiohttp import web
+from sqlalchemy import event
+
+from utils.cache import named_caches
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55)
+
+LabelValues = Tuple[str, ...]
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    pairs = []
+    for name, value in zip(names, values):
+        escaped = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        pairs.append(f'{name}="{escaped}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+class Counter:
+    """Монотонный счетчик с метками."""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, value: float = 1, **labels: Any) -> None:
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        self._values[key] = self._values.get(key, 0) + value
+
+    def value(self, **labels: Any) -> float:
+        return self._values.get(tuple(str(labels[name]) for name in self.labelnames), 0)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        if not self.labelnames and not self._values:
+            lines.append(f"{self.name} 0")
+        for key, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    """Гистограмма с фиксированными границами корзин."""
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # метки -> (счетчики по корзинам, сумма, количество)
+        self._values: Dict[LabelValues, List] = {}
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        series = self._values.get(key)
+        if series is None:
+            series = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[0][i] += 1
+        series[1] += value
+        series[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for key, (bucket_counts, total, count) in sorted(self._values.items()):
+            for bound, bucket_count in zip(self.buckets, bucket_counts):
+                labels = _format_labels(self.labelnames + ("le",), key + (_format_value(bound),))
+                lines.append(f"{self.name}_bucket{labels} {bucket_count}")
+            labels = _format_labels(self.labelnames + ("le",), key + ("+Inf",))
+            lines.append(f"{self.name}_bucket{labels} {count}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class UpdateDbStats:
+    """Запросы и коммиты БД, выполненные при обработке одного апдейта."""
+    __slots__ = ("queries", "commits")
+
+    def __init__(self) -> None:
+        self.queries = 0
+        self.commits = 0
+
+
+_current_update: contextvars.ContextVar[Optional[UpdateDbStats]] = contextvars.ContextVar(
+    "metrics_current_update", default=None
+)
+
+
+class Metrics:
+    """Реестр метрик процесса и HTTP-сервер для их выдачи."""
+
+    def __init__(self, host: str = "127.0.0.1", port: Optional[int] = None):
+        self.host = host
+        self.port = port
+        self._runner: Optional[web.AppRunner] = None
+        self._instrumented_engines: set = set()
+        self._stats_sources: Dict[str, Tuple[Callable[[], Any], Optional[str]]] = {}
+
+        self.updates = Counter("bot_updates_total", "Обработанные апдейты.", ("type", "result"))
+        self.update_seconds = Histogram("bot_update_seconds", "Время обработки апдейта.", ("type",))
+        self.handler_seconds = Histogram("bot_handler_seconds", "Время работы хендлера.", ("handler",))
+        self.handler_errors = Counter("bot_handler_errors_total", "Исключения в хендлерах.", ("handler", "error"))
+        self.db_queries = Counter("bot_db_queries_total", "SQL-запросы.")
+        self.db_commits = Counter("bot_db_commits_total", "Коммиты транзакций.")
+        self.update_queries = Histogram(
+            "bot_update_db_queries", "SQL-запросов на апдейт.", ("type",), buckets=COUNT_BUCKETS
+        )
+        self.update_commits = Histogram(
+            "bot_update_db_commits", "Коммитов на апдейт.", ("type",), buckets=COUNT_BUCKETS
+        )
+        self._instruments = [
+            self.updates, self.update_seconds, self.handler_seconds, self.handler_errors,
+            self.db_queries, self.db_commits, self.update_queries, self.update_commits,
+        ]
+
+    # --- SQL ---
+
+    def instrument_engine(self, engine) -> None:
+        """Подписывается на события движка (AsyncEngine или Engine): считает запросы и коммиты."""
+        sync_engine = getattr(engine, "sync_engine", engine)
+        if id(sync_engine) in self._instrumented_engines:
+            return
+        self._instrumented_engines.add(id(sync_engine))
+
+        @event.listens_for(sync_engine, "before_cursor_execute")
+        def on_execute(conn, cursor, statement, parameters, context, executemany):
+            self.db_queries.inc()
+            update_stats = _current_update.get()
+            if update_stats is not None:
+                update_stats.queries += 1
+
+        @event.listens_for(sync_engine, "commit")
+        def on_commit(conn):
+            self.db_commits.inc()
+            update_stats = _current_update.get()
+            if update_stats is not None:
+                update_stats.commits += 1
+
+    @contextmanager
+    def update_scope(self, update_type: str) -> Iterator[UpdateDbStats]:
+        """Считает запросы и коммиты, сделанные внутри блока (и в созданных в нем задачах)."""
+        update_stats = UpdateDbStats()
+        token = _current_update.set(update_stats)
+        try:
+            yield update_stats
+        finally:
+            _current_update.reset(token)
+            self.update_queries.observe(update_stats.queries, type=update_type)
+            self.update_commits.observe(update_stats.commits, type=update_type)
+
+    # --- Метрики компонентов ---
+
+    def register(self, instrument) -> None:
+        """Добавляет в выдачу счетчик или гистограмму компонента."""
+        if instrument not in self._instruments:
+            self._instruments.append(instrument)
+
+    def add_stats(self, prefix: str, source: Callable[[], Any], label: Optional[str] = None) -> None:
+        """
+        Публикует числовые поля stats() компонента как gauge '<prefix>_<поле>'.
+        Если source возвращает список словарей, label - поле, которое становится меткой.
+        Повторная регистрация того же префикса заменяет источник.
+        """
+        self._stats_sources[prefix] = (source, label)
+
+    def _render_stats(self) -> List[str]:
+        lines = []
+        for prefix, (source, label) in self._stats_sources.items():
+            try:
+                stats = source()
+            except Exception as e:
+                logger.warning(f"Метрики: не удалось получить {prefix}: {e}")
+                continue
+            rows = stats if isinstance(stats, list) else [stats]
+            series: Dict[str, List[str]] = {}
+            for row in rows:
+                labels = _format_labels((label,), (row[label],)) if label else ""
+                for field, value in row.items():
+                    if field == label or isinstance(value, str) or not isinstance(value, (int, float)):
+                        continue
+                    series.setdefault(f"{prefix}_{field}", []).append(f"{prefix}_{field}{labels} {_format_value(value)}")
+            for name, samples in series.items():
+                lines.append(f"# TYPE {name} gauge")
+                lines.extend(samples)
+        return lines
+
+    def _render_caches(self) -> List[str]:
+        caches = sorted(named_caches().items())
+        lines = ["# HELP bot_cache_hits_total Попадания в кэш.", "# TYPE bot_cache_hits_total counter"]
+        lines += [f'bot_cache_hits_total{{cache="{name}"}} {cache.hits}' for name, cache in caches]
+        lines += ["# HELP bot_cache_misses_total Промахи кэша.", "# TYPE bot_cache_misses_total counter"]
+        lines += [f'bot_cache_misses_total{{cache="{name}"}} {cache.misses}' for name, cache in caches]
+        lines += ["# HELP bot_cache_hit_ratio Доля попаданий с запуска.", "# TYPE bot_cache_hit_ratio gauge"]
+        for name, cache in caches:
+            lookups = cache.hits + cache.misses
+            ratio = cache.hits / lookups if lookups else 0.0
+            lines.append(f'bot_cache_hit_ratio{{cache="{name}"}} {_format_value(ratio)}')
+        lines += ["# HELP bot_cache_entries Записей в кэше.", "# TYPE bot_cache_entries gauge"]
+        lines += [f'bot_cache_entries{{cache="{name}"}} {len(cache)}' for name, cache in caches]
+        return lines
+
+    def render(self) -> str:
+        """Все метрики в текстовом формате Prometheus."""
+        lines = []
+        for instrument in self._instruments:
+            lines.extend(instrument.render())
+        lines.extend(self._render_caches())
+        lines.extend(self._render_stats())
+        return "\n".join(lines) + "\n"
+
+    # --- HTTP-сервер ---
+
+    async def _handle_metrics(self, request: web.Request) -> web.Response:
+        return web.Response(text=self.render(), content_type="text/plain", charset="utf-8")
+
+    async def start(self) -> None:
+        if not self.port or self._runner is not None:
+            return
+        app = web.Application()
+        app.router.add_get("/metrics", self._handle_metrics)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host=self.host, port=self.port).start()
+        logger.info(f"Метрики доступны на http://{self.host}:{self.port}/metrics")
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+_metrics: Optional[Metrics] = None
+
+
+def get_metrics() -> Metrics:
+    """Ленивая инициализация реестра метрик. Без METRICS_PORT сервер не запускается."""
+    global _metrics
+    if _metrics is None:
+        port = os.getenv("METRICS_PORT")
+        _metrics = Metrics(
+            host=os.getenv("METRICS_HOST", "127.0.0.1"),
+            port=int(port) if port else None,
+        )
+    return _metrics
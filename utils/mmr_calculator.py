@@ -100,10 +100,10 @@ def calculate_mmr_change_by_formula(
         # За поражение будет отрицательное значение.
         # Если результат float, округляем до int.
         change = int(eval_formula) if isinstance(eval_formula, (int, float)) else 0
-        logger.debug(f"Формула '{formula}' для MMR игрока {player_mmr} vs {opponent_mmr} дала изменение: {change}")
+        logger.debug("Формула '%s' для MMR игрока %s vs %s дала изменение: %s", formula, player_mmr, opponent_mmr, change)
         return change
     except Exception as e:
-        logger.error(f"Ошибка вычисления формулы '{formula}': {e}")
+        logger.error("Ошибка вычисления формулы '%s': %s", formula, e)
         # В случае ошибки возвращаем 0 или выбрасываем исключение
         # Лучше явно обработать в вызывающем коде
         raise ValueError(f"Ошибка в формуле '{formula}': {e}")
@@ -132,7 +132,7 @@ def calculate_mmr_change_by_ranges(
     
     # Вычисляем разницу рейтингов: Рейтинг_Соперника - Мой_Рейтинг
     mmr_diff = abs(opponent_mmr - player_mmr)
-    logger.debug(f"Разница MMR (оппонент {opponent_mmr} - игрок {player_mmr}) = {mmr_diff}")
+    logger.debug("Разница MMR (оппонент %s - игрок %s) = %s", opponent_mmr, player_mmr, mmr_diff)
 
     # Ищем подходящее правило
     applicable_rule = None
@@ -147,7 +147,7 @@ def calculate_mmr_change_by_ranges(
             break # Берем первое подходящее правило
     
     if not applicable_rule:
-        logger.warning(f"Не найдено правило диапазона для разницы MMR {mmr_diff}. Изменение MMR будет 0.")
+        logger.warning("Не найдено правило диапазона для разницы MMR %s. Изменение MMR будет 0.", mmr_diff)
         return 0
 
     # Определяем изменение MMR на основе правила и результата
@@ -156,7 +156,7 @@ def calculate_mmr_change_by_ranges(
     else:
         mmr_change = applicable_rule.get('lose_points', 0)
     
-    logger.debug(f"Применено правило: {applicable_rule}. Изменение MMR: {mmr_change}")
+    logger.debug("Применено правило: %s. Изменение MMR: %s", applicable_rule, mmr_change)
     return mmr_change
 
 # --- Вспомогательная функция для определения общего изменения MMR в матче с несколькими участниками ---
@@ -0,0 +1,178 @@
+# utils/profiler.py
+"""
+Профилирование работающего бота по запросу.
+
+Сессия ограничена по времени и запускается командой владельца /profile
+(handlers/owner_handlers.py) или сигналом SIGUSR1. Режимы:
+- cprofile - cProfile на потоке event loop (все апдейты за время сессии),
+  отчет pstats по cumulative и tottime;
+- sample - поток, который каждые interval секунд снимает стек event loop;
+  отчет в формате collapsed stacks (flamegraph.pl, speedscope).
+
+Вне сессии профилировщик ничего не делает. При шардировании
+(utils/sharding.py) профилируется процесс, получивший команду или сигнал.
+"""
+import asyncio
+import cProfile
+import io
+import logging
+import os
+import pstats
+import signal
+import sys
+import threading
+import time
+from collections import Counter
+from typing import NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+MODES = ("cprofile", "sample")
+
+
+class ProfileReport(NamedTuple):
+    mode: str
+    seconds: float
+    filename: str
+    content: str
+    summary: str
+
+
+class Profiler:
+    """Одна сессия профилирования за раз."""
+
+    def __init__(
+        self,
+        max_seconds: float = 300,
+        sample_interval: float = 0.005,
+        top: int = 60,
+        output_dir: str = "profiles",
+    ):
+        self.max_seconds = max_seconds
+        self.sample_interval = sample_interval
+        self.top = top
+        self.output_dir = output_dir
+        self._lock = asyncio.Lock()
+
+    @property
+    def active(self) -> bool:
+        return self._lock.locked()
+
+    async def run(self, seconds: float, mode: str = "cprofile") -> ProfileReport:
+        """Профилирует event loop seconds секунд и возвращает отчет."""
+        if mode not in MODES:
+            raise ValueError(f"Неизвестный режим профилирования: {mode}")
+        seconds = min(max(seconds, 1), self.max_seconds)
+        async with self._lock:
+            logger.warning(f"Профилирование ({mode}) на {seconds:.0f} с...")
+            if mode == "cprofile":
+                report = await self._run_cprofile(seconds)
+            else:
+                report = await self._run_sampler(seconds)
+            logger.warning(f"Профилирование завершено: {report.summary}")
+            return report
+
+    async def _run_cprofile(self, seconds: float) -> ProfileReport:
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError as e:
+            # Уже активен другой профилировщик (например, отладчик)
+            raise RuntimeError(f"Не удалось включить cProfile: {e}")
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            profile.disable()
+
+        stream = io.StringIO()
+        stats = pstats.Stats(profile, stream=stream)
+        stats.strip_dirs()
+        stream.write(f"cProfile, {seconds:.0f} с\n\n=== По cumulative ===\n")
+        stats.sort_stats("cumulative").print_stats(self.top)
+        stream.write("\n=== По tottime ===\n")
+        stats.sort_stats("tottime").print_stats(self.top)
+        summary = f"{stats.total_calls} вызовов функций в event loop"
+        return ProfileReport("cprofile", seconds, f"profile-{int(time.time())}.txt", stream.getvalue(), summary)
+
+    async def _run_sampler(self, seconds: float) -> ProfileReport:
+        loop_thread_id = threading.get_ident()
+        stacks: Counter = Counter()
+        stop = threading.Event()
+
+        def sample() -> None:
+            while not stop.wait(self.sample_interval):
+                frame = sys._current_frames().get(loop_thread_id)
+                parts = []
+                while frame is not None:
+                    code = frame.f_code
+                    parts.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                if parts:
+                    stacks[";".join(reversed(parts))] += 1
+
+        sampler = threading.Thread(target=sample, name="profiler-sampler", daemon=True)
+        sampler.start()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            stop.set()
+            await asyncio.get_running_loop().run_in_executor(None, sampler.join)
+
+        total = sum(stacks.values())
+        leaves = Counter()
+        for stack, count in stacks.items():
+            leaves[stack.rsplit(";", 1)[-1]] += count
+        # Ожидание событий в селекторе - простой event loop
+        idle = sum(count for leaf, count in leaves.items() if leaf.startswith("select (selectors.py"))
+        busy_leaves = [(leaf, count) for leaf, count in leaves.most_common() if not leaf.startswith("select (selectors.py")]
+        top_leaves = ", ".join(f"{leaf} {count * 100 / total:.0f}%" for leaf, count in busy_leaves[:3]) or "-"
+        busy_share = (total - idle) * 100 / total if total else 0.0
+        content = "\n".join(f"{stack} {count}" for stack, count in stacks.most_common()) + "\n"
+        summary = f"{total} сэмплов, event loop занят {busy_share:.0f}% времени; чаще всего: {top_leaves}"
+        return ProfileReport("sample", seconds, f"profile-{int(time.time())}.folded", content, summary)
+
+    # --- SIGUSR1 ---
+
+    def save(self, report: ProfileReport) -> str:
+        os.makedirs(self.output_dir, exist_ok=True)
+        path = os.path.join(self.output_dir, report.filename)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(report.content)
+        return path
+
+    async def _run_from_signal(self, seconds: float, mode: str) -> None:
+        if self.active:
+            logger.warning("SIGUSR1: профилирование уже идет.")
+            return
+        try:
+            report = await self.run(seconds, mode)
+            logger.warning(f"Отчет профилировщика сохранен: {self.save(report)}")
+        except Exception as e:
+            logger.error(f"Ошибка профилирования по сигналу: {e}", exc_info=True)
+
+    async def install_signal_handler(self) -> None:
+        """SIGUSR1 запускает сессию с настройками PROFILE_SIGNAL_SECONDS/PROFILE_SIGNAL_MODE."""
+        seconds = float(os.getenv("PROFILE_SIGNAL_SECONDS", "30"))
+        mode = os.getenv("PROFILE_SIGNAL_MODE", "cprofile")
+        try:
+            asyncio.get_running_loop().add_signal_handler(
+                signal.SIGUSR1, lambda: asyncio.create_task(self._run_from_signal(seconds, mode))
+            )
+        except (NotImplementedError, AttributeError):
+            pass  # Нет SIGUSR1 (Windows)
+
+
+_profiler: Optional[Profiler] = None
+
+
+def get_profiler() -> Profiler:
+    """Ленивая инициализация профилировщика."""
+    global _profiler
+    if _profiler is None:
+        _profiler = Profiler(
+            max_seconds=float(os.getenv("PROFILE_MAX_SECONDS", "300")),
+            sample_interval=float(os.getenv("PROFILE_SAMPLE_INTERVAL_MS", "5")) / 1000,
+            top=int(os.getenv("PROFILE_TOP", "60")),
+            output_dir=os.getenv("PROFILE_DIR", "profiles"),
+        )
+    return _profiler
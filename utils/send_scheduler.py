@@ -0,0 +1,291 @@
+# utils/send_scheduler.py
+"""
+Планировщик исходящих запросов к Telegram с учетом флуд-лимитов.
+
+Подключается к сессии бота как request-middleware:
+    bot.session.middleware(get_outbound_scheduler())
+
+Каждый запрос, адресованный чату, ждет токен в ведре этого чата и в общем
+ведре бота. Интерактивные запросы (редактирование сообщений, ответы на
+нажатия кнопок) выдаются раньше обычных отправок. Ответ 429 (retry_after)
+приостанавливает ведро чата и повторяет запрос.
+"""
+import asyncio
+import itertools
+import logging
+import os
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Dict, Hashable, List, Optional
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import (
+    AnswerCallbackQuery,
+    EditMessageCaption,
+    EditMessageMedia,
+    EditMessageReplyMarkup,
+    EditMessageText,
+    TelegramMethod,
+)
+
+from utils.cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_NORMAL = 1
+
+INTERACTIVE_METHODS = (
+    AnswerCallbackQuery,
+    EditMessageText,
+    EditMessageReplyMarkup,
+    EditMessageCaption,
+    EditMessageMedia,
+)
+
+
+class TokenBucket:
+    """Ведро токенов: rate токенов в секунду, не больше capacity накопленных."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def _refill(self, now: float) -> None:
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def time_until_token(self, now: float) -> float:
+        """Сколько секунд ждать до появления токена (0, если токен есть)."""
+        self._refill(now)
+        wait = 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+        return max(wait, self.blocked_until - now)
+
+    def consume(self, now: float) -> None:
+        self._refill(now)
+        self.tokens -= 1
+
+    def block(self, seconds: float) -> None:
+        """Не выдавать токены ближайшие seconds секунд (после ответа 429)."""
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+        self.tokens = 0
+
+
+@dataclass(order=True)
+class _Ticket:
+    priority: int
+    seq: int
+    chat_key: Optional[Hashable] = field(compare=False)
+    future: asyncio.Future = field(compare=False)
+    enqueued_at: float = field(compare=False)
+
+
+class OutboundScheduler(BaseRequestMiddleware):
+    """
+    Request-middleware с очередью исходящих запросов.
+
+    Запросы без чата (getUpdates, getMe, setMyCommands, ...) проходят без очереди,
+    ответы на callback-запросы ограничиваются только общим ведром.
+    """
+
+    def __init__(
+        self,
+        global_rate: float = 30.0,
+        private_chat_rate: float = 1.0,
+        group_chat_rate: float = 20 / 60,
+        chat_burst: float = 3.0,
+        max_retries: int = 3,
+    ):
+        self.private_chat_rate = private_chat_rate
+        self.group_chat_rate = group_chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+
+        self._global_bucket = TokenBucket(global_rate, global_rate)
+        # Ведра неактивных чатов вытесняются: новое ведро все равно полное
+        self._chat_buckets = LRUCache(maxsize=50_000, ttl=600)
+        self._queue: List[_Ticket] = []
+        self._seq = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._worker: Optional[asyncio.Task] = None
+
+        # Метрики
+        self.sent = 0
+        self.retries = 0
+        self.latencies: deque = deque(maxlen=1000)
+
+    # --- Классификация запросов ---
+
+    @staticmethod
+    def _chat_key(method: TelegramMethod) -> Optional[Hashable]:
+        return getattr(method, "chat_id", None)
+
+    @staticmethod
+    def _priority(method: TelegramMethod) -> int:
+        return PRIORITY_INTERACTIVE if isinstance(method, INTERACTIVE_METHODS) else PRIORITY_NORMAL
+
+    def _bucket_for(self, chat_key: Hashable) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_key)
+        if bucket is None:
+            # Положительный ID - личный чат, отрицательный или @username - группа/канал
+            is_private = isinstance(chat_key, int) and chat_key > 0
+            rate = self.private_chat_rate if is_private else self.group_chat_rate
+            bucket = TokenBucket(rate, self.chat_burst)
+        # set() на каждое обращение продлевает TTL активного чата
+        self._chat_buckets.set(chat_key, bucket)
+        return bucket
+
+    # --- Middleware ---
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType,
+        bot: Any,
+        method: TelegramMethod,
+    ) -> Any:
+        chat_key = self._chat_key(method)
+        if chat_key is None and not isinstance(method, AnswerCallbackQuery):
+            return await make_request(bot, method)
+
+        priority = self._priority(method)
+        attempt = 0
+        while True:
+            await self._acquire(priority, chat_key)
+            try:
+                result = await make_request(bot, method)
+                self.sent += 1
+                return result
+            except TelegramRetryAfter as e:
+                attempt += 1
+                self.retries += 1
+                if attempt > self.max_retries:
+                    raise
+                logger.warning(
+                    f"Флуд-лимит Telegram для {type(method).__name__} (чат {chat_key}): "
+                    f"повтор через {e.retry_after} с (попытка {attempt}/{self.max_retries})"
+                )
+                if chat_key is not None:
+                    self._bucket_for(chat_key).block(e.retry_after)
+                else:
+                    self._global_bucket.block(e.retry_after)
+
+    async def _acquire(self, priority: int, chat_key: Optional[Hashable]) -> None:
+        """Ставит запрос в очередь и ждет, пока планировщик его выпустит."""
+        self._ensure_worker()
+        ticket = _Ticket(
+            priority=priority,
+            seq=next(self._seq),
+            chat_key=chat_key,
+            future=asyncio.get_running_loop().create_future(),
+            enqueued_at=time.monotonic(),
+        )
+        self._queue.append(ticket)
+        self._queue.sort()
+        self._wakeup.set()
+        try:
+            await ticket.future
+        except asyncio.CancelledError:
+            if ticket in self._queue:
+                self._queue.remove(ticket)
+            raise
+        self.latencies.append(time.monotonic() - ticket.enqueued_at)
+
+    # --- Планировщик ---
+
+    def _ensure_worker(self) -> None:
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._run())
+
+    async def _run(self) -> None:
+        while True:
+            if not self._queue:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            now = time.monotonic()
+            wait = self._global_bucket.time_until_token(now)
+            ticket = None
+            if wait <= 0:
+                wait = float("inf")
+                # Первый по (приоритет, очередность) запрос, чей чат может отправлять.
+                # Порядок запросов одного чата сохраняется: у них общее ведро.
+                for candidate in self._queue:
+                    if candidate.chat_key is None:
+                        ticket = candidate
+                        break
+                    chat_wait = self._bucket_for(candidate.chat_key).time_until_token(now)
+                    if chat_wait <= 0:
+                        ticket = candidate
+                        break
+                    wait = min(wait, chat_wait)
+
+            if ticket is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            self._queue.remove(ticket)
+            if ticket.future.done():
+                continue
+            self._global_bucket.consume(now)
+            if ticket.chat_key is not None:
+                self._bucket_for(ticket.chat_key).consume(now)
+            ticket.future.set_result(None)
+
+    async def stop(self) -> None:
+        """Останавливает планировщик; ожидающие запросы отменяются."""
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        for ticket in self._queue:
+            ticket.future.cancel()
+        self._queue.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Метрики очереди: размер, отправлено, повторы, задержка в очереди (сек)."""
+        latencies = sorted(self.latencies)
+
+        def percentile(p: float) -> float:
+            if not latencies:
+                return 0.0
+            return latencies[min(len(latencies) - 1, int(len(latencies) * p))]
+
+        return {
+            "queued": len(self._queue),
+            "sent": self.sent,
+            "retries": self.retries,
+            "latency_p50": percentile(0.50),
+            "latency_p99": percentile(0.99),
+            "latency_max": latencies[-1] if latencies else 0.0,
+        }
+
+
+_outbound_scheduler: Optional[OutboundScheduler] = None
+
+
+def get_outbound_scheduler() -> OutboundScheduler:
+    """Ленивая инициализация планировщика исходящих запросов."""
+    global _outbound_scheduler
+    if _outbound_scheduler is None:
+        _outbound_scheduler = OutboundScheduler(
+            global_rate=float(os.getenv("OUTBOUND_GLOBAL_RATE", "30")),
+            private_chat_rate=float(os.getenv("OUTBOUND_PRIVATE_CHAT_RATE", "1")),
+            group_chat_rate=float(os.getenv("OUTBOUND_GROUP_CHAT_PER_MINUTE", "20")) / 60,
+            chat_burst=float(os.getenv("OUTBOUND_CHAT_BURST", "3")),
+            max_retries=int(os.getenv("OUTBOUND_MAX_RETRIES", "3")),
+        )
+    return _outbound_scheduler
@@ -0,0 +1,320 @@
+# utils/sharding.py
+"""
+Обработка апдейтов в нескольких процессах.
+
+Фронт-процесс получает апдейты (polling или webhook) и без обработки
+раскладывает их по N воркерам: номер воркера = chat_id % N. Все апдейты
+одного чата (и, значит, все матчи его соревнования) попадают в один
+воркер, который выполняет их строго по очереди; разные чаты
+обрабатываются параллельно.
+
+Воркер, упавший с ошибкой, перезапускается автоматически. SIGHUP
+перезапускает воркеры по одному: воркер дорабатывает уже полученные
+апдейты, а новые ждут в его очереди следующий процесс.
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+import queue
+import signal
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from aiogram import BaseMiddleware, Bot, Dispatcher
+from aiogram.types import TelegramObject, Update
+
+logger = logging.getLogger(__name__)
+
+# spawn, а не fork: у фронта уже есть event loop и открытые соединения
+_mp = multiprocessing.get_context("spawn")
+
+
+class ShardPool:
+    """Пул процессов-воркеров с очередью апдейтов на каждый воркер."""
+
+    def __init__(
+        self,
+        workers: int,
+        build_dispatcher: Callable[[], Dispatcher],
+        build_bot: Callable[[], Bot],
+        stats_interval: float = 60.0,
+        stop_timeout: float = 30.0,
+    ):
+        self.workers = workers
+        # Фабрики передаются в воркеры по ссылке (pickle), поэтому должны быть функциями модуля
+        self.build_dispatcher = build_dispatcher
+        self.build_bot = build_bot
+        self.stats_interval = stats_interval
+        self.stop_timeout = stop_timeout
+
+        self._queues = [_mp.Queue() for _ in range(workers)]
+        self._stats_queue = _mp.Queue()
+        self._processes: List[Optional[multiprocessing.Process]] = [None] * workers
+        self._monitor_task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self._restarting: set = set()
+
+        # Метрики фронта и последние метрики, присланные воркерами
+        self.dispatched = [0] * workers
+        self.restarts = [0] * workers
+        self.worker_stats: Dict[int, Dict[str, Any]] = {}
+        # Счетчики завершившихся процессов воркера (новый процесс начинает с нуля)
+        self._finished_totals = [{"processed": 0, "errors": 0} for _ in range(workers)]
+
+    # --- Маршрутизация ---
+
+    def shard_for(self, key: int) -> int:
+        return key % self.workers
+
+    def dispatch(self, key: int, update: Update) -> None:
+        """Отправляет апдейт воркеру, отвечающему за ключ (chat_id или user_id)."""
+        shard = self.shard_for(key)
+        self._queues[shard].put((key, update.model_dump_json(exclude_unset=True)))
+        self.dispatched[shard] += 1
+
+    # --- Жизненный цикл воркеров ---
+
+    def _spawn(self, worker_id: int) -> None:
+        process = _mp.Process(
+            target=_worker_main,
+            args=(
+                worker_id,
+                self.workers,
+                self._queues[worker_id],
+                self._stats_queue,
+                self.build_dispatcher,
+                self.build_bot,
+            ),
+            name=f"bot-worker-{worker_id}",
+            daemon=False,
+        )
+        process.start()
+        self._processes[worker_id] = process
+        logger.info(f"Запущен воркер {worker_id} (pid {process.pid}).")
+
+    async def _join(self, process: multiprocessing.Process, timeout: float) -> None:
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, process.join, timeout)
+        if process.is_alive():
+            logger.warning(f"Воркер pid {process.pid} не остановился за {timeout} с, завершаем принудительно.")
+            process.terminate()
+            await loop.run_in_executor(None, process.join, 5)
+
+    async def start(self) -> None:
+        for worker_id in range(self.workers):
+            self._spawn(worker_id)
+        self._monitor_task = asyncio.create_task(self._monitor())
+        try:
+            asyncio.get_running_loop().add_signal_handler(
+                signal.SIGHUP, lambda: asyncio.create_task(self.restart_workers())
+            )
+        except (NotImplementedError, AttributeError):
+            pass  # Нет SIGHUP (Windows)
+
+    async def restart_worker(self, worker_id: int) -> None:
+        """Плавный перезапуск: воркер обрабатывает очередь до метки остановки и выходит."""
+        process = self._processes[worker_id]
+        self._restarting.add(worker_id)
+        try:
+            if process is not None and process.is_alive():
+                self._queues[worker_id].put(None)
+                await self._join(process, self.stop_timeout)
+            self.restarts[worker_id] += 1
+            if not self._stopping:
+                self._spawn(worker_id)
+        finally:
+            self._restarting.discard(worker_id)
+
+    async def restart_workers(self) -> None:
+        """Перезапускает воркеры по одному, чтобы остальные продолжали работу."""
+        logger.info("Плавный перезапуск воркеров...")
+        for worker_id in range(self.workers):
+            await self.restart_worker(worker_id)
+        logger.info("Все воркеры перезапущены.")
+
+    async def stop(self) -> None:
+        """Останавливает воркеры после обработки уже полученных апдейтов."""
+        self._stopping = True
+        if self._monitor_task is not None:
+            self._monitor_task.cancel()
+            try:
+                await self._monitor_task
+            except asyncio.CancelledError:
+                pass
+            self._monitor_task = None
+        for update_queue in self._queues:
+            update_queue.put(None)
+        await asyncio.gather(*(
+            self._join(process, self.stop_timeout)
+            for process in self._processes if process is not None
+        ))
+        self._collect_stats()
+        logger.info(f"Воркеры остановлены. {self.format_stats()}")
+
+    async def _monitor(self) -> None:
+        """Перезапускает упавшие воркеры, собирает и периодически логирует метрики."""
+        last_report = time.monotonic()
+        while True:
+            await asyncio.sleep(1)
+            self._collect_stats()
+            for worker_id, process in enumerate(self._processes):
+                if worker_id in self._restarting or process is None or process.is_alive():
+                    continue
+                logger.error(f"Воркер {worker_id} (pid {process.pid}) завершился с кодом {process.exitcode}, перезапуск.")
+                self.restarts[worker_id] += 1
+                self._spawn(worker_id)
+            if time.monotonic() - last_report >= self.stats_interval:
+                last_report = time.monotonic()
+                logger.info(self.format_stats())
+
+    # --- Метрики ---
+
+    def _collect_stats(self) -> None:
+        while True:
+            try:
+                worker_id, stats = self._stats_queue.get_nowait()
+            except queue.Empty:
+                break
+            previous = self.worker_stats.get(worker_id)
+            if previous and previous["pid"] != stats["pid"]:
+                for counter in ("processed", "errors"):
+                    self._finished_totals[worker_id][counter] += previous[counter]
+            self.worker_stats[worker_id] = stats
+
+    def stats(self) -> List[Dict[str, Any]]:
+        """
+        Метрики по воркерам: отправлено фронтом, обработано (за все перезапуски), ошибки,
+        задержка обработки текущего процесса.
+        """
+        result = []
+        self._collect_stats()
+        for worker_id in range(self.workers):
+            worker = dict(self.worker_stats.get(worker_id, {}))
+            for counter, finished in self._finished_totals[worker_id].items():
+                worker[counter] = worker.get(counter, 0) + finished
+            process = self._processes[worker_id]
+            result.append({
+                "worker": worker_id,
+                "pid": process.pid if process else None,
+                "alive": bool(process and process.is_alive()),
+                "restarts": self.restarts[worker_id],
+                "dispatched": self.dispatched[worker_id],
+                **worker,
+            })
+        return result
+
+    def format_stats(self) -> str:
+        parts = []
+        for s in self.stats():
+            parts.append(
+                f"#{s['worker']} pid={s['pid']} alive={s['alive']} restarts={s['restarts']} "
+                f"dispatched={s['dispatched']} processed={s.get('processed', 0)} errors={s.get('errors', 0)} "
+                f"in_flight={s.get('in_flight', 0)} avg_ms={s.get('avg_ms', 0):.1f} max_ms={s.get('max_ms', 0):.1f}"
+            )
+        return "Воркеры: " + "; ".join(parts)
+
+
+class ShardRouterMiddleware(BaseMiddleware):
+    """
+    Outer-middleware фронта на dp.update: пересылает апдейт воркеру и не обрабатывает его.
+    Ключ шарда - чат апдейта, для апдейтов без чата (inline-запросы) - пользователь.
+    """
+
+    def __init__(self, pool: ShardPool):
+        self.pool = pool
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any]
+    ) -> Any:
+        chat = data.get("event_chat")
+        user = data.get("event_from_user")
+        key = chat.id if chat else (user.id if user else 0)
+        self.pool.dispatch(key, event)
+        return None
+
+
+# --- Процесс-воркер ---
+
+def _worker_main(
+    worker_id: int,
+    workers_total: int,
+    update_queue,
+    stats_queue,
+    build_dispatcher: Callable[[], Dispatcher],
+    build_bot: Callable[[], Bot],
+) -> None:
+    # Ctrl+C получает вся группа процессов; останавливает воркеры фронт
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # Общий лимит исходящих сообщений делится между воркерами
+    global_rate = float(os.getenv("OUTBOUND_GLOBAL_RATE", "30"))
+    os.environ["OUTBOUND_GLOBAL_RATE"] = str(global_rate / workers_total)
+    # Метрики воркера - на следующих за фронтом портах: METRICS_PORT + 1 + worker_id
+    metrics_port = os.getenv("METRICS_PORT")
+    if metrics_port:
+        os.environ["METRICS_PORT"] = str(int(metrics_port) + 1 + worker_id)
+    asyncio.run(_worker_loop(worker_id, update_queue, stats_queue, build_dispatcher, build_bot))
+
+
+async def _worker_loop(
+    worker_id: int,
+    update_queue,
+    stats_queue,
+    build_dispatcher: Callable[[], Dispatcher],
+    build_bot: Callable[[], Bot],
+) -> None:
+    dp = build_dispatcher()
+    bot = build_bot()
+    await dp.emit_startup(bot=bot)
+
+    loop = asyncio.get_running_loop()
+    chains: Dict[int, asyncio.Task] = {}
+    stats = {"pid": os.getpid(), "processed": 0, "errors": 0, "in_flight": 0, "avg_ms": 0.0, "max_ms": 0.0}
+    total_ms = 0.0
+
+    async def handle(key: int, payload: str, previous: Optional[asyncio.Task]) -> None:
+        nonlocal total_ms
+        # Апдейты одного чата выполняются строго по порядку
+        if previous is not None:
+            await asyncio.gather(previous, return_exceptions=True)
+        started = time.perf_counter()
+        try:
+            update = Update.model_validate_json(payload, context={"bot": bot})
+            await dp.feed_update(bot, update)
+        except Exception as e:
+            stats["errors"] += 1
+            logger.error(f"Воркер {worker_id}: ошибка обработки апдейта: {e}", exc_info=True)
+        finally:
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            stats["processed"] += 1
+            stats["in_flight"] -= 1
+            total_ms += elapsed_ms
+            stats["avg_ms"] = total_ms / stats["processed"]
+            stats["max_ms"] = max(stats["max_ms"], elapsed_ms)
+            if chains.get(key) is asyncio.current_task():
+                del chains[key]
+
+    async def report_stats() -> None:
+        while True:
+            await asyncio.sleep(1)
+            stats_queue.put((worker_id, dict(stats, chats=len(chains))))
+
+    reporter = asyncio.create_task(report_stats())
+    try:
+        while True:
+            item = await loop.run_in_executor(None, update_queue.get)
+            if item is None:
+                break
+            key, payload = item
+            stats["in_flight"] += 1
+            chains[key] = asyncio.create_task(handle(key, payload, chains.get(key)))
+        # Дорабатываем уже полученные апдейты
+        await asyncio.gather(*chains.values(), return_exceptions=True)
+    finally:
+        reporter.cancel()
+        stats_queue.put((worker_id, dict(stats, chats=0)))
+        await dp.emit_shutdown(bot=bot)
+        await bot.session.close()
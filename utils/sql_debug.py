@@ -0,0 +1,186 @@
+# utils/sql_debug.py
+"""
+Отладка SQL для разработки (SQL_DEBUG=1): поиск N+1 и медленных запросов.
+
+Для каждого апдейта (middlewares/sql_debug.py) собирается список выполненных
+запросов. После обработки в лог попадают:
+- запросы одной формы, повторенные repeat_threshold и более раз (типичный
+  N+1: запрос в цикле по участникам или username), с местом вызова в коде;
+- апдейты, выполнившие больше budget запросов;
+- запросы дольше slow_ms вместе с EXPLAIN QUERY PLAN (SQLite).
+
+Если SQL_DEBUG не включен, обработчики событий и middleware не
+регистрируются вовсе.
+"""
+import contextvars
+import logging
+import os
+import re
+import sys
+import time
+from collections import Counter
+from typing import Any, List, NamedTuple, Optional
+
+import greenlet
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+_PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_EXPLAINABLE = ("SELECT", "UPDATE", "DELETE", "WITH")
+
+_IN_LIST_RE = re.compile(r"IN \((?:\?|:\w+|%\(\w+\)s)(?:, (?:\?|:\w+|%\(\w+\)s))*\)", re.IGNORECASE)
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def statement_shape(statement: str) -> str:
+    """Форма запроса: без лишних пробелов, списки IN (?, ?, ...) схлопнуты."""
+    shape = _WHITESPACE_RE.sub(" ", statement).strip()
+    return _IN_LIST_RE.sub("IN (...)", shape)
+
+
+class QueryRecord(NamedTuple):
+    shape: str
+    elapsed_ms: float
+    origin: str
+
+
+class UpdateTrace:
+    """Запросы, выполненные при обработке одного апдейта."""
+
+    def __init__(self, description: str):
+        self.description = description
+        self.queries: List[QueryRecord] = []
+
+
+_current_trace: contextvars.ContextVar[Optional[UpdateTrace]] = contextvars.ContextVar(
+    "sql_debug_trace", default=None
+)
+
+
+def _caller_origin() -> str:
+    """Ближайшая к запросу строка кода проекта (файл:строка функция)."""
+    # SQLAlchemy выполняет запрос в дочернем greenlet; код бота - в стеке родителя
+    current = greenlet.getcurrent()
+    frame = current.parent.gr_frame if current.parent is not None else sys._getframe(2)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename.startswith(_PROJECT_ROOT) and "site-packages" not in filename and filename != __file__:
+            return f"{os.path.relpath(filename, _PROJECT_ROOT)}:{frame.f_lineno} {frame.f_code.co_name}"
+        frame = frame.f_back
+    return "?"
+
+
+class SqlDebugger:
+    """Обработчики событий движка и анализ запросов апдейта."""
+
+    def __init__(self, budget: int = 10, slow_ms: float = 50.0, repeat_threshold: int = 3):
+        self.budget = budget
+        self.slow_ms = slow_ms
+        self.repeat_threshold = repeat_threshold
+        self._instrumented_engines: set = set()
+
+    def instrument_engine(self, engine) -> None:
+        sync_engine = getattr(engine, "sync_engine", engine)
+        if id(sync_engine) in self._instrumented_engines:
+            return
+        self._instrumented_engines.add(id(sync_engine))
+        event.listen(sync_engine, "before_cursor_execute", self._before_execute)
+        event.listen(sync_engine, "after_cursor_execute", self._after_execute)
+
+    # Время старта хранится в контексте выполнения, а не в соединении: запрос,
+    # упавший с ошибкой, не доходит до after_cursor_execute и ничего не оставляет
+    def _before_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context._sql_debug_started = time.perf_counter()
+
+    def _after_execute(self, conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, "_sql_debug_started", None)
+        if started is None:
+            return
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        trace = _current_trace.get()
+        if trace is None and elapsed_ms < self.slow_ms:
+            return
+        origin = _caller_origin()
+        if trace is not None:
+            trace.queries.append(QueryRecord(statement_shape(statement), elapsed_ms, origin))
+        if elapsed_ms >= self.slow_ms:
+            plan = self._explain(conn, statement, parameters) if not executemany else None
+            logger.warning(
+                f"SQL: медленный запрос {elapsed_ms:.1f} мс ({origin}): {statement_shape(statement)}"
+                + (f"\n  План: {plan}" if plan else "")
+            )
+
+    def _explain(self, conn, statement: str, parameters) -> Optional[str]:
+        if conn.dialect.name != "sqlite" or not statement.lstrip().upper().startswith(_EXPLAINABLE):
+            return None
+        # Отдельный курсор: результат исходного запроса еще не прочитан
+        cursor = conn.connection.cursor()
+        try:
+            cursor.execute(f"EXPLAIN QUERY PLAN {statement}", parameters)
+            return "; ".join(row[3] for row in cursor.fetchall())
+        except Exception as e:
+            return f"не удалось получить ({e})"
+        finally:
+            cursor.close()
+
+    # --- Апдейт ---
+
+    def begin_update(self, description: str) -> contextvars.Token:
+        return _current_trace.set(UpdateTrace(description))
+
+    def end_update(self, token: contextvars.Token) -> None:
+        trace = _current_trace.get()
+        _current_trace.reset(token)
+        if trace is not None:
+            self.report(trace)
+
+    def report(self, trace: UpdateTrace) -> None:
+        """Пишет в лог повторяющиеся запросы и превышение бюджета."""
+        total = len(trace.queries)
+        if not total:
+            return
+        total_ms = sum(q.elapsed_ms for q in trace.queries)
+        shapes = Counter(q.shape for q in trace.queries)
+        repeated = [(shape, count) for shape, count in shapes.most_common() if count >= self.repeat_threshold]
+
+        for shape, count in repeated:
+            origins = Counter(q.origin for q in trace.queries if q.shape == shape)
+            where = ", ".join(f"{origin} x{n}" for origin, n in origins.most_common(3))
+            logger.warning(f"SQL: {trace.description}: запрос повторен {count} раз ({where}): {shape[:300]}")
+        if total > self.budget:
+            logger.warning(
+                f"SQL: {trace.description}: {total} запросов за {total_ms:.1f} мс "
+                f"(бюджет {self.budget}, уникальных форм {len(shapes)})"
+            )
+        else:
+            logger.debug(f"SQL: {trace.description}: {total} запросов за {total_ms:.1f} мс")
+
+
+def describe_update(update: Any) -> str:
+    """Короткое описание апдейта для лога: тип и текст/данные кнопки."""
+    event_type = update.event_type
+    payload = ""
+    if update.message and update.message.text:
+        payload = update.message.text
+    elif update.callback_query and update.callback_query.data:
+        payload = update.callback_query.data
+    elif update.inline_query:
+        payload = update.inline_query.query
+    return f"апдейт {update.update_id} ({event_type} '{payload[:40]}')"
+
+
+_sql_debugger: Optional[SqlDebugger] = None
+
+
+def get_sql_debugger() -> SqlDebugger:
+    """Ленивая инициализация отладчика SQL."""
+    global _sql_debugger
+    if _sql_debugger is None:
+        _sql_debugger = SqlDebugger(
+            budget=int(os.getenv("SQL_QUERY_BUDGET", "10")),
+            slow_ms=float(os.getenv("SQL_SLOW_MS", "50")),
+            repeat_threshold=int(os.getenv("SQL_REPEAT_THRESHOLD", "3")),
+        )
+    return _sql_debugger